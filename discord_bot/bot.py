@@ -3,32 +3,55 @@ import sys
 import discord
 from discord.ext import commands
 import asyncio
-import tempfile
 import aiohttp
 import random
+from io import BytesIO
 
 # 添加專案路徑，以便匯入其他模組
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from discord_bot.config import (
     DISCORD_TOKEN, DISCORD_PREFIX, MAX_RESULTS, TEXT_WEIGHT, IMAGE_WEIGHT,
-    HELP_MESSAGE, NO_MEMES_FOUND, ERROR_MESSAGE, LOADING_MESSAGE, CATEGORIES_HEADER
+    HELP_MESSAGE, NO_MEMES_FOUND, ERROR_MESSAGE, BUSY_MESSAGE, LOADING_MESSAGE, CATEGORIES_HEADER,
+    INFERENCE_WORKERS, INFERENCE_QUEUE_SIZE, INFERENCE_SERVER_URL, EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_TTL, EMBEDDING_CACHE_PATH, RESULT_CACHE_SIZE, RESULT_CACHE_TTL
 )
 
 from discord_bot.utils import (
-    fetch_memes, fetch_categories, get_meme_by_id, save_discord_attachment,
-    record_interaction, create_embeds_from_memes, create_paginated_embed
+    fetch_memes, fetch_categories, get_meme_by_id,
+    record_interaction, create_embeds_from_memes, create_paginated_embed, get_meme_indexes, get_meme_hash_index,
+    get_meme_lexical_index,
+    configure_inference, shutdown_inference, run_inference, InferenceBusyError,
+    get_http_session, close_http_session, get_meme_image, get_meme_image_url,
+    get_attachment_url, remember_attachment_url, start_interaction_logger, stop_interaction_logger
 )
 
-from models.similarity import recommend_memes
+from models.similarity import recommend_memes, configure_result_cache, get_result_cache_stats
+from models.nlp_model import configure_embedding_cache, save_embedding_cache, get_embedding_cache_stats
+from models.inference_client import InferenceClient
+
+# 設定推論服務時，搜尋交由服務處理，機器人程序不載入模型
+inference_client = InferenceClient(INFERENCE_SERVER_URL) if INFERENCE_SERVER_URL else None
 
 # 設置意圖
 intents = discord.Intents.default()
 intents.message_content = True
 
+class MemeBot(commands.Bot):
+    """梗圖機器人，管理整個執行期間共用的 HTTP 連線池與互動記錄任務"""
+    
+    async def setup_hook(self):
+        # 登入前建立共用連線池，並啟動互動記錄的批次送出任務
+        get_http_session()
+        start_interaction_logger()
+    
+    async def close(self):
+        # 先送出剩餘的互動記錄再關閉連線池
+        await stop_interaction_logger()
+        await close_http_session()
+        await super().close()
+
 # 創建機器人
-# 創建機器人
-bot = commands.Bot(command_prefix=DISCORD_PREFIX, intents=intents, help_command=None)
+bot = MemeBot(command_prefix=DISCORD_PREFIX, intents=intents, help_command=None)
 
 @bot.event
 async def on_ready():
@@ -62,7 +85,9 @@ async def refresh_cache_periodically():
             await asyncio.sleep(60)
             await fetch_memes(force_refresh=True)
             await fetch_categories(force_refresh=True)
-            print("快取已重新整理")
+            # 查詢嵌入向量快取有變更時才寫入磁碟
+            save_embedding_cache()
+            print(f"快取已重新整理，查詢嵌入向量快取: {get_embedding_cache_stats()}，推薦結果快取: {get_result_cache_stats()}")
         except Exception as e:
             print(f"定期重新整理快取時出錯: {str(e)}")
 
@@ -96,16 +121,16 @@ async def meme_command(ctx, *, query=None):
     loading_message = await ctx.send(LOADING_MESSAGE)
     
     try:
-        # 檢查是否有圖片附件
-        image_file = None
+        # 檢查是否有圖片附件，直接讀入記憶體，不寫入臨時檔案
+        image_data = None
         if ctx.message.attachments:
             for attachment in ctx.message.attachments:
-                if attachment.content_type.startswith('image/'):
-                    image_file = await save_discord_attachment(attachment)
+                if (attachment.content_type or '').startswith('image/'):
+                    image_data = await attachment.read()
                     break
         
-        # 獲取梗圖列表 - 使用force_refresh確保獲取最新資料
-        memes = await fetch_memes(force_refresh=True)
+        # 獲取梗圖列表，背景任務每分鐘以增量同步更新快取，指令不必每次向API確認
+        memes = await fetch_memes()
         
         # 如果沒有梗圖，返回錯誤
         if not memes:
@@ -113,15 +138,39 @@ async def meme_command(ctx, *, query=None):
             return
         
         # 推薦梗圖 (依照查詢或隨機選擇)
-        if query or image_file:
-            # 獲取推薦梗圖ID列表
-            recommended_ids = recommend_memes(
-                query_text=query,
-                query_image=image_file,
-                memes=memes,
-                top_k=1,  # 只取最相似的1個結果
-                weight_text=TEXT_WEIGHT
-            )
+        if query or image_data:
+            # 獲取推薦梗圖ID列表，使用快取更新時預先建立的向量索引
+            # 模型推論在執行緒池中進行，避免阻塞事件迴圈
+            try:
+                if inference_client:
+                    recommended_ids = await run_inference(
+                        inference_client.recommend,
+                        query_text=query,
+                        query_image=image_data,
+                        top_k=1,
+                        weight_text=TEXT_WEIGHT
+                    )
+                else:
+                    text_index, image_index = get_meme_indexes()
+                    recommended_ids = await run_inference(
+                        recommend_memes,
+                        query_text=query,
+                        query_image=image_data,
+                        memes=memes,
+                        top_k=1,  # 只取最相似的1個結果
+                        weight_text=TEXT_WEIGHT,
+                        text_index=text_index,
+                        image_index=image_index,
+                        hash_index=get_meme_hash_index(),
+                        lexical_index=get_meme_lexical_index()
+                    )
+            except InferenceBusyError:
+                await loading_message.edit(content=BUSY_MESSAGE)
+                return
+            
+            if recommended_ids is None:
+                await loading_message.edit(content=ERROR_MESSAGE)
+                return
             
             # 獲取推薦梗圖詳細資訊
             if recommended_ids:
@@ -133,11 +182,11 @@ async def meme_command(ctx, *, query=None):
                 # 處理並發送梗圖
                 await send_meme_image(ctx, loading_message, recommended_meme)
                 
-                # 記錄互動
+                # 記錄互動（放入佇列後立即返回，由背景任務批次送出）
                 await record_interaction(
                     ctx.author.id,
                     query,
-                    image_file is not None,
+                    image_data is not None,
                     recommended_meme.get('id')
                 )
             else:
@@ -154,14 +203,7 @@ async def meme_command(ctx, *, query=None):
         error_message = f"處理梗圖請求時出錯: {str(e)}"
         print(error_message)
         await loading_message.edit(content=ERROR_MESSAGE)
-    
-    finally:
-        # 清理臨時文件
-        if image_file and os.path.exists(image_file):
-            try:
-                os.unlink(image_file)
-            except:
-                pass
+
 @bot.command(name="categories")
 async def categories_command(ctx):
     """列出所有梗圖類別"""
@@ -278,46 +320,44 @@ async def send_meme_image(ctx, loading_message, meme):
         loading_message: 載入中訊息
         meme: 梗圖資訊字典
     """
-    image_url = meme.get('image_url')
+    image_url = get_meme_image_url(meme)
     if not image_url:
         await loading_message.edit(content=f"找到梗圖但沒有圖片URL: {meme.get('title', '未知')}")
         return
     
-    # 確保URL是完整的
-    if not image_url.startswith('http'):
-        # 假設是相對URL，轉換為絕對URL
-        image_url = f"http://127.0.0.1:8000{image_url}"
-    
-    # 創建臨時檔案來保存圖片
-    temp_image = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg')
-    temp_image.close()
+    # 準備發送的訊息文字
+    message_text = f"**{meme.get('title', '')}**"
+    if meme.get('category'):
+        message_text += f"\n分類: {meme.get('category')}"
     
     try:
-        # 直接使用aiohttp下載圖片
-        async with aiohttp.ClientSession() as session:
-            async with session.get(image_url) as response:
-                if response.status == 200:
-                    with open(temp_image.name, 'wb') as f:
-                        f.write(await response.read())
-                    
-                    # 準備發送的訊息文字
-                    message_text = f"**{meme.get('title', '')}**"
-                    if meme.get('category'):
-                        message_text += f"\n分類: {meme.get('category')}"
-                    
-                    # 發送圖片和訊息
-                    await loading_message.delete()
-                    await ctx.send(content=message_text, file=discord.File(temp_image.name))
-                else:
-                    print(f"下載圖片失敗，狀態碼: {response.status}，URL: {image_url}")
-                    await loading_message.edit(content=f"無法下載圖片 (HTTP {response.status})")
+        # 先前上傳過且尚未到期的圖片，直接以嵌入訊息引用 Discord CDN 上的附件
+        attachment_url = get_attachment_url(meme)
+        if attachment_url:
+            embed = discord.Embed()
+            embed.set_image(url=attachment_url)
+            await loading_message.delete()
+            await ctx.send(content=message_text, embed=embed)
+            return
+        
+        # 從圖片快取取得內容，未快取時才下載
+        image_data = await get_meme_image(meme)
+        if not image_data:
+            print(f"下載圖片失敗，URL: {image_url}")
+            await loading_message.edit(content="無法下載圖片")
+            return
+        
+        # 直接從記憶體發送圖片，不經過臨時檔案
+        extension = os.path.splitext(image_url.split('?')[0])[1] or '.jpg'
+        await loading_message.delete()
+        message = await ctx.send(
+            content=message_text,
+            file=discord.File(BytesIO(image_data), filename=f"meme_{meme.get('id')}{extension}")
+        )
+        remember_attachment_url(meme, message)
     except Exception as e:
         print(f"處理圖片時出錯: {str(e)}，URL: {image_url}")
         await loading_message.edit(content=f"處理圖片時出錯: {str(e)[:100]}")
-    finally:
-        # 清理臨時檔案
-        if os.path.exists(temp_image.name):
-            os.unlink(temp_image.name)
 async def download_image(url, save_path=None):
     """下載圖片
     
@@ -338,30 +378,42 @@ async def download_image(url, save_path=None):
     print(f"正在下載圖片: {url}")
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    data = await response.read()
+        session = get_http_session()
+        async with session.get(url) as response:
+            if response.status == 200:
+                data = await response.read()
+                
+                if save_path:
+                    # 確保目錄存在
+                    os.makedirs(os.path.dirname(save_path), exist_ok=True)
                     
-                    if save_path:
-                        # 確保目錄存在
-                        os.makedirs(os.path.dirname(save_path), exist_ok=True)
-                        
-                        # 寫入文件
-                        with open(save_path, 'wb') as f:
-                            f.write(data)
-                        return save_path
-                    else:
-                        return data
+                    # 寫入文件
+                    with open(save_path, 'wb') as f:
+                        f.write(data)
+                    return save_path
                 else:
-                    print(f"下載圖片失敗: HTTP {response.status}")
-                    return None
+                    return data
+            else:
+                print(f"下載圖片失敗: HTTP {response.status}")
+                return None
     except Exception as e:
         print(f"下載圖片出錯: {str(e)}")
         return None
 def run_bot():
     """運行Discord機器人"""
-    bot.run(DISCORD_TOKEN)
+    configure_embedding_cache(
+        maxsize=EMBEDDING_CACHE_SIZE,
+        ttl=EMBEDDING_CACHE_TTL or None,
+        path=EMBEDDING_CACHE_PATH or None
+    )
+    configure_result_cache(maxsize=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL or None)
+    configure_inference(workers=INFERENCE_WORKERS, queue_size=INFERENCE_QUEUE_SIZE)
+    try:
+        bot.run(DISCORD_TOKEN)
+    finally:
+        shutdown_inference()
+        # 關閉時保存查詢嵌入向量快取，重新啟動後常用查詢不必重新計算
+        save_embedding_cache()
 
 if __name__ == "__main__":
     run_bot()
\ No newline at end of file
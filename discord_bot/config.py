@@ -11,7 +11,17 @@ DISCORD_PREFIX = os.getenv('DISCORD_PREFIX', '!')
 # API設定
 API_BASE_URL = os.getenv('API_BASE_URL', 'http://127.0.0.1:8000')
 API_MEMES_ENDPOINT = f"{API_BASE_URL}/api/memes/"
+API_VECTORS_ENDPOINT = f"{API_BASE_URL}/api/memes/vectors/"
 API_INTERACTION_ENDPOINT = f"{API_BASE_URL}/api/interactions/"
+API_INTERACTIONS_BULK_ENDPOINT = f"{API_BASE_URL}/api/interactions/bulk/"
+
+# HTTP 連線設定（機器人共用一個連線池）
+HTTP_POOL_LIMIT = int(os.getenv('HTTP_POOL_LIMIT', '100'))  # 連線池的總連線數上限
+HTTP_LIMIT_PER_HOST = int(os.getenv('HTTP_LIMIT_PER_HOST', '20'))  # 每個主機的連線數上限
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', '60'))  # 閒置連線保留秒數
+HTTP_DNS_CACHE_TTL = int(os.getenv('HTTP_DNS_CACHE_TTL', '300'))  # DNS 查詢結果快取秒數
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))  # 建立連線的逾時秒數
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '30'))  # 等待回應資料的逾時秒數
 
 # 文件存儲路徑
 TEMP_DIR = os.getenv('TEMP_DIR', 'temp')
@@ -19,13 +29,45 @@ TEMP_DIR = os.getenv('TEMP_DIR', 'temp')
 # 確保臨時目錄存在
 os.makedirs(TEMP_DIR, exist_ok=True)
 
+# 梗圖圖片快取設定
+IMAGE_CACHE_DIR = os.getenv('IMAGE_CACHE_DIR', os.path.join(TEMP_DIR, 'images'))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv('IMAGE_CACHE_MAX_BYTES', str(500 * 1024 * 1024)))  # 磁碟快取上限，0 表示停用
+IMAGE_MEMORY_CACHE_MAX_BYTES = int(os.getenv('IMAGE_MEMORY_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))  # 記憶體快取上限
+
+# 已上傳至 Discord 的梗圖附件URL快取，到期前直接以嵌入訊息引用，不必重新上傳
+ATTACHMENT_URL_CACHE_SIZE = int(os.getenv('ATTACHMENT_URL_CACHE_SIZE', '2048'))
+ATTACHMENT_URL_EXPIRY_MARGIN = int(os.getenv('ATTACHMENT_URL_EXPIRY_MARGIN', '600'))  # 到期前多少秒就不再使用（秒）
+ATTACHMENT_URL_DEFAULT_TTL = int(os.getenv('ATTACHMENT_URL_DEFAULT_TTL', '43200'))  # URL 沒有到期時間時的使用期限（秒）
+
 # 機器人設定
 MAX_RESULTS = int(os.getenv('MAX_RESULTS', '5'))
 TEXT_WEIGHT = float(os.getenv('TEXT_WEIGHT', '0.6'))
 IMAGE_WEIGHT = float(os.getenv('IMAGE_WEIGHT', '0.4'))
 
+# 模型推論設定
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', '2'))  # 同時執行推論的執行緒數量
+INFERENCE_QUEUE_SIZE = int(os.getenv('INFERENCE_QUEUE_SIZE', '8'))  # 等待推論的請求數量上限
+INFERENCE_SERVER_URL = os.getenv('INFERENCE_SERVER_URL', '')  # 本機推論服務網址，設定後機器人不載入模型
+
+# ANN 索引設定：梗圖數量很多時以 build_ann_index 離線建立的 IVF 索引取代精確搜尋
+USE_ANN_INDEX = os.getenv('USE_ANN_INDEX', '0') == '1'
+ANN_INDEX_DIR = os.getenv('ANN_INDEX_DIR', '')  # 索引目錄，與 Django 的 ANN_INDEX_DIR 相同
+ANN_N_PROBE = int(os.getenv('ANN_N_PROBE', '0'))  # 查詢時檢查的群數，0 表示使用建立索引時的設定
+
+# 互動記錄設定：先暫存於佇列，定期或累積到一定數量後批次送出
+INTERACTION_FLUSH_INTERVAL = float(os.getenv('INTERACTION_FLUSH_INTERVAL', '5'))  # 送出間隔（秒）
+INTERACTION_BATCH_SIZE = int(os.getenv('INTERACTION_BATCH_SIZE', '100'))  # 累積多少筆立即送出
+INTERACTION_QUEUE_SIZE = int(os.getenv('INTERACTION_QUEUE_SIZE', '10000'))  # 佇列上限，超過時捨棄新的記錄
+INTERACTION_MAX_RETRIES = int(os.getenv('INTERACTION_MAX_RETRIES', '5'))  # 送出失敗時的重試次數，超過時捨棄該批記錄
+INTERACTION_RETRY_DELAY = float(os.getenv('INTERACTION_RETRY_DELAY', '2'))  # 第一次重試前的等待秒數，之後每次加倍
+
 # 快取設定
 CACHE_DURATION = int(os.getenv('CACHE_DURATION', '3600'))  # 快取持續時間（秒）
+EMBEDDING_CACHE_SIZE = int(os.getenv('EMBEDDING_CACHE_SIZE', '1024'))  # 查詢嵌入向量快取的最大數量
+EMBEDDING_CACHE_TTL = int(os.getenv('EMBEDDING_CACHE_TTL', '86400'))  # 查詢嵌入向量快取的存活時間（秒），0 表示不過期
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', '512'))  # 推薦結果快取的最大數量
+RESULT_CACHE_TTL = int(os.getenv('RESULT_CACHE_TTL', '0'))  # 推薦結果快取的存活時間（秒），0 表示不過期
+EMBEDDING_CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH', os.path.join(TEMP_DIR, 'embedding_cache.npz'))  # 留空則不寫入磁碟
 
 # Discord訊息設定
 HELP_MESSAGE = """
@@ -46,5 +88,6 @@ HELP_MESSAGE = """
 
 NO_MEMES_FOUND = "抱歉，找不到相關的梗圖 😢"
 ERROR_MESSAGE = "處理請求時發生錯誤 🔧"
+BUSY_MESSAGE = "目前搜尋的人太多了，請稍後再試 ⏳"
 LOADING_MESSAGE = "正在尋找最佳的海綿寶寶梗圖，請稍候... 🔍"
 CATEGORIES_HEADER = "**可用的梗圖類別:**\n"
\ No newline at end of file
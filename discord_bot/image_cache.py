@@ -0,0 +1,187 @@
+import os
+import re
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+
+class ImageCache:
+    """以內容雜湊為鍵的梗圖圖片快取，記憶體與磁碟兩層皆以總位元組數限制並採 LRU 淘汰
+
+    磁碟上每張圖片存為 <雜湊值>.img，檔案的修改時間作為最近使用時間，
+    重新啟動後依修改時間重建 LRU 順序。磁碟讀寫在執行緒中進行，不阻塞事件迴圈。
+    """
+
+    FILE_SUFFIX = '.img'
+
+    def __init__(self, directory, max_disk_bytes=500 * 1024 * 1024, max_memory_bytes=64 * 1024 * 1024):
+        """
+        Args:
+            directory (str): 磁碟快取目錄
+            max_disk_bytes (int): 磁碟快取的總位元組數上限，0 表示不使用磁碟快取
+            max_memory_bytes (int): 記憶體快取的總位元組數上限，0 表示不使用記憶體快取
+        """
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+
+        if self.max_disk_bytes:
+            os.makedirs(directory, exist_ok=True)
+            self._scan_disk()
+
+    @staticmethod
+    def make_key(meme_id, image_hash=None, image_url=None):
+        """產生快取鍵，優先使用伺服器提供的圖片雜湊值
+
+        Args:
+            meme_id (int): 梗圖ID
+            image_hash (str, optional): 圖片內容的 SHA-256 雜湊值
+            image_url (str, optional): 圖片URL，沒有雜湊值時與梗圖ID一起作為鍵
+
+        Returns:
+            str: 可作為檔名的快取鍵
+        """
+        if image_hash and re.fullmatch(r'[0-9a-f]{16,128}', image_hash):
+            return image_hash
+        # 舊版API沒有圖片雜湊值時，圖片更換後URL也會改變
+        return hashlib.sha256(f"{meme_id}:{image_url}".encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.FILE_SUFFIX)
+
+    def _scan_disk(self):
+        """依修改時間載入既有的磁碟快取"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.FILE_SUFFIX):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name[:-len(self.FILE_SUFFIX)], stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    def _remember(self, key, data):
+        """放入記憶體快取，超過上限時淘汰最久未使用的圖片"""
+        if not self.max_memory_bytes or len(data) > self.max_memory_bytes:
+            return
+        with self._lock:
+            if key in self._memory:
+                self._memory_bytes -= len(self._memory.pop(key))
+            self._memory[key] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.max_memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def _evict_disk(self):
+        """刪除最久未使用的檔案，直到磁碟快取不超過上限"""
+        while self._disk_bytes > self.max_disk_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            try:
+                os.unlink(self._path(key))
+            except OSError:
+                pass
+
+    def _read_disk(self, key):
+        with self._lock:
+            if key not in self._disk:
+                return None
+            self._disk.move_to_end(key)
+        try:
+            path = self._path(key)
+            with open(path, 'rb') as f:
+                data = f.read()
+            # 更新修改時間，重新啟動後仍保有最近使用順序
+            os.utime(path)
+            return data
+        except OSError:
+            with self._lock:
+                self._disk_bytes -= self._disk.pop(key, 0)
+            return None
+
+    def _write_disk(self, key, data):
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"寫入圖片快取出錯: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            return
+        with self._lock:
+            self._disk_bytes -= self._disk.pop(key, 0)
+            self._disk[key] = len(data)
+            self._disk_bytes += len(data)
+            self._evict_disk()
+
+    async def get(self, key):
+        """讀取快取的圖片
+
+        Args:
+            key (str): 快取鍵
+
+        Returns:
+            bytes: 圖片內容，不在快取中時返回 None
+        """
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return data
+
+        data = None
+        if self.max_disk_bytes:
+            data = await asyncio.to_thread(self._read_disk, key)
+        if data is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._remember(key, data)
+        return data
+
+    async def put(self, key, data):
+        """寫入圖片到快取
+
+        Args:
+            key (str): 快取鍵
+            data (bytes): 圖片內容
+        """
+        if not data:
+            return
+        self._remember(key, data)
+        if self.max_disk_bytes and len(data) <= self.max_disk_bytes:
+            await asyncio.to_thread(self._write_disk, key, data)
+
+    def stats(self):
+        """快取統計資訊
+
+        Returns:
+            dict: 包含記憶體與磁碟使用量、命中與未命中次數
+        """
+        return {
+            'memory_items': len(self._memory),
+            'memory_bytes': self._memory_bytes,
+            'disk_items': len(self._disk),
+            'disk_bytes': self._disk_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
@@ -10,11 +10,34 @@ from discord.ext import commands
 import sys
 import aiohttp
 import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
 # 添加專案路徑，以便匯入其他模組
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from .config import API_MEMES_ENDPOINT, API_INTERACTION_ENDPOINT, TEMP_DIR
+from .config import (
+    API_MEMES_ENDPOINT, API_VECTORS_ENDPOINT, API_INTERACTIONS_BULK_ENDPOINT, TEMP_DIR,
+    INTERACTION_FLUSH_INTERVAL, INTERACTION_BATCH_SIZE, INTERACTION_QUEUE_SIZE,
+    INTERACTION_MAX_RETRIES, INTERACTION_RETRY_DELAY,
+    HTTP_POOL_LIMIT, HTTP_LIMIT_PER_HOST, HTTP_KEEPALIVE_TIMEOUT, HTTP_DNS_CACHE_TTL,
+    HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, API_BASE_URL,
+    IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES, IMAGE_MEMORY_CACHE_MAX_BYTES,
+    ATTACHMENT_URL_CACHE_SIZE, ATTACHMENT_URL_EXPIRY_MARGIN, ATTACHMENT_URL_DEFAULT_TTL,
+    USE_ANN_INDEX, ANN_INDEX_DIR, ANN_N_PROBE
+)
+from .image_cache import ImageCache
+from models.similarity import (
+    build_meme_indexes_from_vectors, update_meme_indexes, build_meme_hash_index, build_meme_lexical_index
+)
+from models.perceptual_hash import parse_hash
+from models.ann_index import attach_ann_indexes
+from models.vector_payload import decode_payload
+from models.cache import LRUCache
+from urllib.parse import urlparse, parse_qs
+
+# 梗圖列表只取中繼資料，向量另外透過二進位匯出端點取得
+MEME_METADATA_FIELDS = 'id,title,image_url,category,keywords,image_hash,perceptual_hash'
 
 # 全域變數用於快取資料
 _memes_cache = None
@@ -22,9 +45,134 @@ _categories_cache = None
 _last_cache_time = 0
 _cache_duration = 3600  # 快取持續時間（秒）
 
+# 增量同步狀態：伺服器返回的同步時間與 ETag
+_last_sync_time = None
+_memes_etag = None
+
+# 由快取梗圖建立的向量索引，全量同步時重建、增量同步時更新副本後再替換，
+# 推論執行緒持有的舊索引不會在搜尋途中被修改
+_text_index = None
+_image_index = None
+
+# 梗圖的感知雜湊索引，查詢圖片為既有梗圖時不必執行CV模型
+_hash_index = None
+
+# 梗圖關鍵字與標題的 BM25 倒排索引，查詢與關鍵字完全相同時不必執行NLP模型
+_lexical_index = None
+
+# 向量匯出時記錄的模型（向量欄位名稱 -> 模型），用於確認 ANN 索引是否由相同模型建立
+_vector_models = None
+
+# 模型推論使用的執行緒池與名額（執行中 + 排隊中），避免 torch 運算阻塞事件迴圈
+_inference_executor = None
+_inference_slots = None
+_inference_capacity = 0
+
+# 梗圖圖片快取，發送梗圖時不必每次重新下載
+_image_cache = None
+
+# 梗圖ID -> (圖片快取鍵, Discord 附件URL, 到期時間)，同一張圖片到期前重複使用已上傳的附件
+_attachment_urls = LRUCache(maxsize=ATTACHMENT_URL_CACHE_SIZE)
+
+# 互動記錄佇列與背景送出任務
+_interaction_queue = None
+_interaction_task = None
+
+# 機器人共用的 HTTP 連線池，重複使用與 API 及圖片主機的連線
+_http_session = None
+
+def get_http_session():
+    """取得共用的 aiohttp ClientSession，尚未建立或已關閉時建立新的
+    
+    必須在事件迴圈中呼叫。
+    
+    Returns:
+        aiohttp.ClientSession: 共用的連線
+    """
+    global _http_session
+    
+    if _http_session is None or _http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_LIMIT_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL
+        )
+        # 不限制總時間，匯出全部向量等大型回應只要持續有資料就不會逾時
+        timeout = aiohttp.ClientTimeout(total=None, connect=HTTP_CONNECT_TIMEOUT, sock_read=HTTP_READ_TIMEOUT)
+        _http_session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+    return _http_session
+
+async def close_http_session():
+    """關閉共用的 HTTP 連線池"""
+    global _http_session
+    
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+class InferenceBusyError(Exception):
+    """推論佇列已滿，無法再接受新的請求"""
+
+def configure_inference(workers=2, queue_size=8):
+    """設定模型推論的執行緒池
+    
+    Args:
+        workers (int): 同時執行推論的執行緒數量
+        queue_size (int): 等待執行的請求數量上限，超過時 run_inference 會拋出 InferenceBusyError
+    """
+    global _inference_executor, _inference_slots, _inference_capacity
+    
+    if _inference_executor is not None:
+        _inference_executor.shutdown(wait=False)
+    
+    _inference_executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='inference')
+    _inference_capacity = max(1, workers) + max(0, queue_size)
+    _inference_slots = None
+
+def shutdown_inference():
+    """關閉模型推論的執行緒池"""
+    global _inference_executor
+    
+    if _inference_executor is not None:
+        _inference_executor.shutdown(wait=False)
+        _inference_executor = None
+
+async def run_inference(func, *args, **kwargs):
+    """在推論執行緒池中執行同步的模型函數
+    
+    Args:
+        func (callable): 要執行的函數，例如 recommend_memes
+        *args: 位置參數
+        **kwargs: 關鍵字參數
+        
+    Returns:
+        函數的返回值
+        
+    Raises:
+        InferenceBusyError: 執行中與排隊中的請求已達上限
+    """
+    global _inference_slots
+    
+    if _inference_executor is None:
+        configure_inference()
+    if _inference_slots is None:
+        # 在事件迴圈中建立，確保綁定到目前的迴圈
+        _inference_slots = asyncio.Semaphore(_inference_capacity)
+    
+    if _inference_slots.locked():
+        raise InferenceBusyError()
+    
+    async with _inference_slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_inference_executor, functools.partial(func, *args, **kwargs))
+
 async def fetch_memes(category=None, force_refresh=False):
     """從API獲取梗圖列表
     
+    未指定類別時會以增量同步更新快取：帶上次的同步時間 (updated_since) 與 ETag
+    (If-None-Match) 發出請求，目錄未變動時伺服器返回 304，有變動時只返回變更的梗圖。
+    
     Args:
         category (str, optional): 梗圖類別
         force_refresh (bool): 是否強制重新獲取
@@ -32,7 +180,7 @@ async def fetch_memes(category=None, force_refresh=False):
     Returns:
         list: 梗圖列表
     """
-    global _memes_cache, _last_cache_time
+    global _last_cache_time, _memes_etag
     
     # 判斷是否需要重新獲取
     current_time = time.time()
@@ -42,35 +190,159 @@ async def fetch_memes(category=None, force_refresh=False):
             return [meme for meme in _memes_cache if meme.get('category') == category]
         return _memes_cache
     
-    # 構建API請求URL
+    # 構建API請求參數，已有快取時使用增量同步
     url = API_MEMES_ENDPOINT
+    params = {'fields': MEME_METADATA_FIELDS, 'stream': '1'}
+    headers = {}
     if category:
-        url += f"?category={category}"
+        params['category'] = category
+    elif _memes_cache is not None and _last_sync_time:
+        params['updated_since'] = _last_sync_time
+        if _memes_etag:
+            headers['If-None-Match'] = _memes_etag
     
-    print(f"獲取梗圖列表: {url}")
+    print(f"獲取梗圖列表: {url} {params}")
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    data = await response.json()
+        session = get_http_session()
+        async with session.get(url, params=params, headers=headers) as response:
+            if response.status == 304:
+                # 目錄沒有變動，沿用快取
+                _last_cache_time = current_time
+                return _memes_cache
+            elif response.status == 200:
+                data = await response.json()
+                
+                if category:
                     memes = data.get('memes', [])
-                    
-                    # 打印偵錯訊息
                     print(f"獲取到 {len(memes)} 個梗圖")
-                    
-                    # 更新快取
-                    if not category:
-                        _memes_cache = memes
-                        _last_cache_time = current_time
-                    
                     return memes
-                else:
-                    print(f"獲取梗圖失敗: HTTP {response.status}")
-                    return _memes_cache if _memes_cache else []
+                
+                # 取得同一同步區間內變更的向量，失敗時保留原本的快取與同步狀態
+                vectors = {}
+                if not data.get('delta') or data.get('memes'):
+                    vectors = await fetch_meme_vectors(updated_since=params.get('updated_since'))
+                    if vectors is None:
+                        return _memes_cache if _memes_cache else []
+                
+                # 更新快取與向量索引
+                _apply_memes_response(data, vectors)
+                _memes_etag = response.headers.get('ETag')
+                _last_cache_time = current_time
+                
+                return _memes_cache
+            else:
+                print(f"獲取梗圖失敗: HTTP {response.status}")
+                return _memes_cache if _memes_cache else []
     except Exception as e:
         print(f"獲取梗圖出錯: {str(e)}")
         return _memes_cache if _memes_cache else []
+
+async def fetch_meme_vectors(updated_since=None):
+    """從向量匯出端點取得梗圖的文字與圖片向量
+    
+    Args:
+        updated_since (str, optional): 只取得此時間之後變更的梗圖向量
+        
+    Returns:
+        dict: 名稱 -> (梗圖ID列表, 矩陣) 的對應，失敗時返回 None
+    """
+    global _vector_models
+    
+    params = {}
+    if updated_since:
+        params['updated_since'] = updated_since
+    
+    try:
+        session = get_http_session()
+        async with session.get(API_VECTORS_ENDPOINT, params=params) as response:
+            if response.status != 200:
+                print(f"獲取梗圖向量失敗: HTTP {response.status}")
+                return None
+            
+            data = await response.read()
+            header, matrices = decode_payload(data)
+            _vector_models = header.get('models')
+            return matrices
+    except Exception as e:
+        print(f"獲取梗圖向量出錯: {str(e)}")
+        return None
+
+def _apply_memes_response(data, vectors):
+    """將API回應套用到梗圖快取與向量索引
+    
+    Args:
+        data (dict): /api/memes/ 的回應內容
+        vectors (dict): 同一同步區間的向量匯出資料
+    """
+    global _memes_cache, _last_sync_time, _text_index, _image_index, _hash_index, _lexical_index
+    
+    memes = data.get('memes', [])
+    deleted = data.get('deleted', [])
+    
+    if data.get('delta') and _memes_cache is not None and _text_index is not None:
+        # 增量同步：合併變更並更新索引副本
+        memes_by_id = {meme['id']: meme for meme in _memes_cache}
+        for meme_id in deleted:
+            memes_by_id.pop(meme_id, None)
+        for meme in memes:
+            memes_by_id[meme['id']] = meme
+        
+        _memes_cache = list(memes_by_id.values())
+        if memes or deleted:
+            # 向量索引的副本共用矩陣，只有實際變更時才產生新矩陣
+            text_index, image_index = _text_index.copy(), _image_index.copy()
+            update_meme_indexes(text_index, image_index, [meme['id'] for meme in memes], vectors, deleted)
+            hash_index = _hash_index.copy()
+            for meme_id in deleted:
+                hash_index.remove(meme_id)
+            for meme in memes:
+                hash_index.add(meme['id'], parse_hash(meme.get('perceptual_hash')))
+            lexical_index = _lexical_index.copy()
+            lexical_index.remove(deleted)
+            lexical_index.upsert((meme['id'], meme.get('title'), meme.get('keywords')) for meme in memes)
+            _text_index, _image_index, _hash_index, _lexical_index = text_index, image_index, hash_index, lexical_index
+        
+        print(f"增量同步：更新 {len(memes)} 個、刪除 {len(deleted)} 個梗圖，共 {len(_memes_cache)} 個")
+    else:
+        # 全量同步：取代快取並重建索引
+        _memes_cache = memes
+        text_index, image_index = build_meme_indexes_from_vectors(vectors)
+        if USE_ANN_INDEX and ANN_INDEX_DIR:
+            text_index, image_index = attach_ann_indexes(text_index, image_index, ANN_INDEX_DIR,
+                                                         n_probe=ANN_N_PROBE or None, models=_vector_models)
+        _text_index, _image_index = text_index, image_index
+        _hash_index = build_meme_hash_index(memes)
+        _lexical_index = build_meme_lexical_index(memes)
+        
+        print(f"獲取到 {len(memes)} 個梗圖")
+    
+    _last_sync_time = data.get('sync_time')
+
+def get_meme_hash_index():
+    """獲取由快取梗圖建立的感知雜湊索引
+    
+    Returns:
+        PerceptualHashIndex: 感知雜湊索引，快取尚未建立時為 None
+    """
+    return _hash_index
+
+def get_meme_lexical_index():
+    """獲取由快取梗圖建立的關鍵字倒排索引
+    
+    Returns:
+        BM25Index: 倒排索引，快取尚未建立時為 None
+    """
+    return _lexical_index
+
+def get_meme_indexes():
+    """獲取由快取梗圖建立的向量索引
+    
+    Returns:
+        tuple: (文字索引, 圖片索引) 元組，快取尚未建立時為 (None, None)
+    """
+    return _text_index, _image_index
+
 async def fetch_categories(force_refresh=False):
     """獲取所有梗圖類別
     
@@ -114,28 +386,127 @@ async def download_image(url, save_path=None):
         return None
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    data = await response.read()
+        session = get_http_session()
+        async with session.get(url) as response:
+            if response.status == 200:
+                data = await response.read()
+                
+                if save_path:
+                    # 確保目錄存在
+                    os.makedirs(os.path.dirname(save_path), exist_ok=True)
                     
-                    if save_path:
-                        # 確保目錄存在
-                        os.makedirs(os.path.dirname(save_path), exist_ok=True)
-                        
-                        # 寫入文件
-                        with open(save_path, 'wb') as f:
-                            f.write(data)
-                        return save_path
-                    else:
-                        return data
+                    # 寫入文件
+                    with open(save_path, 'wb') as f:
+                        f.write(data)
+                    return save_path
                 else:
-                    print(f"下載圖片失敗: {response.status}")
-                    return None
+                    return data
+            else:
+                print(f"下載圖片失敗: {response.status}")
+                return None
     except Exception as e:
         print(f"下載圖片出錯: {str(e)}")
         return None
 
+def get_image_cache():
+    """取得梗圖圖片快取，第一次呼叫時依設定建立"""
+    global _image_cache
+    
+    if _image_cache is None:
+        _image_cache = ImageCache(
+            IMAGE_CACHE_DIR,
+            max_disk_bytes=IMAGE_CACHE_MAX_BYTES,
+            max_memory_bytes=IMAGE_MEMORY_CACHE_MAX_BYTES
+        )
+    return _image_cache
+
+def get_meme_image_url(meme):
+    """獲取梗圖圖片的完整URL"""
+    image_url = meme.get('image_url')
+    if image_url and not image_url.startswith('http'):
+        # 相對URL，補上API主機
+        image_url = f"{API_BASE_URL}{image_url}"
+    return image_url
+
+async def get_meme_image(meme):
+    """獲取梗圖圖片內容，優先從快取讀取
+    
+    快取以伺服器提供的圖片雜湊值為鍵，圖片更換後雜湊值改變，自然不會讀到舊圖片。
+    
+    Args:
+        meme (dict): 梗圖資訊
+        
+    Returns:
+        bytes: 圖片內容，無法取得時返回 None
+    """
+    image_url = get_meme_image_url(meme)
+    if not image_url:
+        return None
+    
+    cache = get_image_cache()
+    key = get_meme_image_key(meme)
+    data = await cache.get(key)
+    if data is not None:
+        return data
+    
+    data = await download_image(image_url)
+    if data:
+        await cache.put(key, data)
+    return data
+
+def get_meme_image_key(meme):
+    """獲取梗圖圖片在快取中的鍵，圖片更換後鍵也會改變"""
+    return ImageCache.make_key(meme.get('id'), meme.get('image_hash'), get_meme_image_url(meme))
+
+def parse_attachment_expiry(url):
+    """解析 Discord CDN 附件URL的到期時間
+    
+    Discord 附件URL的 ex 參數為十六進位的 Unix 時間，沒有此參數時以 ATTACHMENT_URL_DEFAULT_TTL 計算。
+    
+    Args:
+        url (str): 附件URL
+        
+    Returns:
+        float: 到期的 Unix 時間
+    """
+    try:
+        expires = parse_qs(urlparse(url).query).get('ex')
+        if expires:
+            return float(int(expires[0], 16))
+    except ValueError:
+        pass
+    return time.time() + ATTACHMENT_URL_DEFAULT_TTL
+
+def get_attachment_url(meme):
+    """獲取梗圖先前上傳的 Discord 附件URL
+    
+    Args:
+        meme (dict): 梗圖資訊
+        
+    Returns:
+        str: 仍可使用的附件URL，沒有或即將到期時返回 None
+    """
+    entry = _attachment_urls.get(meme.get('id'))
+    if entry is None:
+        return None
+    
+    image_key, url, expires_at = entry
+    if image_key != get_meme_image_key(meme) or expires_at - ATTACHMENT_URL_EXPIRY_MARGIN <= time.time():
+        return None
+    return url
+
+def remember_attachment_url(meme, message):
+    """記錄發送梗圖後 Discord 返回的附件URL
+    
+    Args:
+        meme (dict): 梗圖資訊
+        message (discord.Message): 包含梗圖附件的訊息
+    """
+    if not message or not message.attachments:
+        return
+    url = message.attachments[0].url
+    _attachment_urls.put(meme.get('id'), (get_meme_image_key(meme), url, parse_attachment_expiry(url)))
+
 async def get_meme_by_id(meme_id):
     """根據ID獲取梗圖
     
@@ -180,26 +551,135 @@ async def save_discord_attachment(attachment):
 async def record_interaction(user_id, input_text, input_image, recommended_meme_id):
     """記錄使用者互動
     
+    互動只會放入佇列，由背景任務批次送出，不會延遲指令的回應。
+    
+    Args:
+        user_id (str): 使用者ID
+        input_text (str): 輸入文字
+        input_image (bool): 是否有輸入圖片
+        recommended_meme_id (int): 推薦的梗圖ID
+    """
+    queue_interaction(user_id, input_text, input_image, recommended_meme_id)
+
+def queue_interaction(user_id, input_text, input_image, recommended_meme_id):
+    """將使用者互動放入佇列，佇列已滿時捨棄
+    
     Args:
         user_id (str): 使用者ID
         input_text (str): 輸入文字
         input_image (bool): 是否有輸入圖片
         recommended_meme_id (int): 推薦的梗圖ID
     """
+    global _interaction_queue
+    
+    if _interaction_queue is None:
+        _interaction_queue = asyncio.Queue(maxsize=INTERACTION_QUEUE_SIZE)
+    
     try:
-        payload = {
+        _interaction_queue.put_nowait({
             'user_id': str(user_id),
             'input_text': input_text,
             'input_image': input_image,
             'recommended_meme_id': recommended_meme_id
-        }
+        })
+    except asyncio.QueueFull:
+        print("互動記錄佇列已滿，捨棄此筆記錄")
+
+async def flush_interactions(interactions):
+    """將一批互動記錄送至批次記錄API
+    
+    Args:
+        interactions (list): 互動記錄列表
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(API_INTERACTION_ENDPOINT, json=payload) as response:
-                if response.status != 200:
-                    print(f"記錄互動失敗: {response.status}")
+    Returns:
+        bool: 是否成功送出
+    """
+    if not interactions:
+        return True
+    
+    try:
+        session = get_http_session()
+        async with session.post(API_INTERACTIONS_BULK_ENDPOINT, json={'interactions': interactions}) as response:
+            if response.status != 200:
+                print(f"批次記錄互動失敗: HTTP {response.status}")
+                return False
+            return True
     except Exception as e:
-        print(f"記錄互動出錯: {str(e)}")
+        print(f"批次記錄互動出錯: {str(e)}")
+        return False
+
+async def flush_interactions_with_retry(interactions):
+    """送出一批互動記錄，失敗時以指數退避重試
+    
+    重試期間新的互動記錄繼續累積在佇列中，重試 INTERACTION_MAX_RETRIES 次仍失敗時才捨棄這一批。
+    
+    Args:
+        interactions (list): 互動記錄列表
+        
+    Returns:
+        bool: 是否成功送出
+    """
+    for attempt in range(INTERACTION_MAX_RETRIES + 1):
+        if await flush_interactions(interactions):
+            return True
+        if attempt < INTERACTION_MAX_RETRIES:
+            await asyncio.sleep(INTERACTION_RETRY_DELAY * 2 ** attempt)
+    
+    print(f"批次記錄互動重試 {INTERACTION_MAX_RETRIES} 次仍失敗，捨棄 {len(interactions)} 筆記錄")
+    return False
+
+async def _run_interaction_logger():
+    """背景任務：每 INTERACTION_FLUSH_INTERVAL 秒或累積 INTERACTION_BATCH_SIZE 筆時送出一批"""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = []
+        try:
+            batch.append(await _interaction_queue.get())
+            deadline = loop.time() + INTERACTION_FLUSH_INTERVAL
+            
+            while len(batch) < INTERACTION_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(_interaction_queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            await flush_interactions_with_retry(batch)
+        except asyncio.CancelledError:
+            # 關閉時（包含等待重試期間）再送出一次已取出但尚未送出的記錄
+            await flush_interactions(batch)
+            raise
+
+def start_interaction_logger():
+    """啟動互動記錄的背景送出任務"""
+    global _interaction_queue, _interaction_task
+    
+    if _interaction_queue is None:
+        _interaction_queue = asyncio.Queue(maxsize=INTERACTION_QUEUE_SIZE)
+    if _interaction_task is None or _interaction_task.done():
+        _interaction_task = asyncio.get_running_loop().create_task(_run_interaction_logger())
+
+async def stop_interaction_logger():
+    """停止背景送出任務，並送出佇列中剩餘的互動記錄"""
+    global _interaction_task
+    
+    if _interaction_task is not None:
+        _interaction_task.cancel()
+        try:
+            await _interaction_task
+        except asyncio.CancelledError:
+            pass
+        _interaction_task = None
+    
+    if _interaction_queue is None:
+        return
+    remaining = []
+    while not _interaction_queue.empty():
+        remaining.append(_interaction_queue.get_nowait())
+    for start in range(0, len(remaining), INTERACTION_BATCH_SIZE):
+        await flush_interactions(remaining[start:start + INTERACTION_BATCH_SIZE])
 
 async def create_embeds_from_memes(memes, title="推薦梗圖", color=0x00BFFF):
     """從梗圖列表創建Discord嵌入消息
@@ -287,24 +767,24 @@ async def download_image(url, save_path=None):
         return None
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    data = await response.read()
+        session = get_http_session()
+        async with session.get(url) as response:
+            if response.status == 200:
+                data = await response.read()
+                
+                if save_path:
+                    # 確保目錄存在
+                    os.makedirs(os.path.dirname(save_path), exist_ok=True)
                     
-                    if save_path:
-                        # 確保目錄存在
-                        os.makedirs(os.path.dirname(save_path), exist_ok=True)
-                        
-                        # 寫入文件
-                        with open(save_path, 'wb') as f:
-                            f.write(data)
-                        return save_path
-                    else:
-                        return data
+                    # 寫入文件
+                    with open(save_path, 'wb') as f:
+                        f.write(data)
+                    return save_path
                 else:
-                    print(f"下載圖片失敗: {response.status}")
-                    return None
+                    return data
+            else:
+                print(f"下載圖片失敗: {response.status}")
+                return None
     except Exception as e:
         print(f"下載圖片出錯: {str(e)}")
         return None
\ No newline at end of file
@@ -100,4 +100,23 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Login URL
 LOGIN_URL = '/admin/login/'
-DATA_UPLOAD_MAX_NUMBER_FILES = 1000 
\ No newline at end of file
+DATA_UPLOAD_MAX_NUMBER_FILES = 1000
+
+# 嵌入向量背景工作設定
+EMBEDDING_BATCH_SIZE = 32  # 批次推論時每批的梗圖數量
+IMAGE_PREPROCESS_WORKERS = 4  # 圖片解碼與前處理的執行緒數量，與模型推論同時進行
+EMBEDDING_JOB_RETRY_DELAY = 30  # 失敗重試前等待秒數（依嘗試次數倍增）
+EMBEDDING_JOB_STALE_TIMEOUT = 600  # 執行中工作超過此秒數沒有進度即視為中斷並重新排入
+TAGGING_WORKERS = 4  # 自動生成標籤的程序數量
+OCR_LANGUAGES = 'chi_tra+eng'  # Tesseract 辨識語言
+AUTO_TAG_CACHE_DIR = os.path.join(BASE_DIR, 'tag_cache')  # 自動標籤結果快取，以圖片雜湊命名
+BATCH_UPLOAD_CREATE_BATCH_SIZE = 500  # 批量上傳時每次寫入資料庫的梗圖數量
+DUPLICATE_HASH_DISTANCE = 6  # 感知雜湊的漢明距離不超過此值時視為重複圖片
+
+# ANN 索引設定：由 build_ann_index 離線建立，推論服務與機器人載入後取代精確搜尋
+ANN_INDEX_DIR = os.getenv('ANN_INDEX_DIR', str(BASE_DIR / 'ann_index'))
+USE_ANN_INDEX = os.getenv('USE_ANN_INDEX', '0') == '1'
+ANN_N_PROBE = int(os.getenv('ANN_N_PROBE', '0'))  # 查詢時檢查的群數，0 表示使用建立索引時的設定
+
+# 本機推論服務網址：設定後背景工作程序改由推論服務執行模型推論，不自行載入模型
+INFERENCE_SERVER_URL = os.getenv('INFERENCE_SERVER_URL', '')
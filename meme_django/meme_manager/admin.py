@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
-from .models import MemeCategory, Meme, UserInteraction, ModelConfiguration
+from .models import MemeCategory, Meme, UserInteraction, ModelConfiguration, EmbeddingJob
 from .forms import MemeForm
 
 @admin.register(MemeCategory)
@@ -16,15 +16,15 @@ class MemeAdmin(admin.ModelAdmin):
     list_filter = ('category', 'created_at')
     search_fields = ('title', 'keywords')
     ordering = ('-created_at',)
-    readonly_fields = ('embedding', 'image_features')
+    readonly_fields = ('image_hash', 'embedding_model', 'embedding_source_hash', 'image_features_model', 'image_features_source_hash')
     
     def save_model(self, request, obj, form, change):
         # 儲存物件
         super().save_model(request, obj, form, change)
         
-        # 觸發嵌入向量生成
-        from .tasks import generate_embeddings
-        generate_embeddings(obj.id)
+        # 將嵌入向量生成加入背景佇列
+        from .tasks import enqueue_embeddings
+        enqueue_embeddings([obj.id])
 
 @admin.register(UserInteraction)
 class UserInteractionAdmin(admin.ModelAdmin):
@@ -50,4 +50,11 @@ class ModelConfigurationAdmin(admin.ModelAdmin):
         # 如果啟用狀態改變，重新載入模型
         if 'active' in form.changed_data and obj.active:
             from .tasks import reload_models
-            reload_models()
\ No newline at end of file
+            reload_models()
+
+@admin.register(EmbeddingJob)
+class EmbeddingJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'generate_tags', 'progress', 'total', 'failed_count', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status', 'created_at')
+    ordering = ('-created_at',)
+    readonly_fields = ('progress', 'total', 'failed_count', 'attempts', 'error', 'started_at', 'finished_at')
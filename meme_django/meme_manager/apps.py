@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class MemeManagerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'meme_manager'
+
+    def ready(self):
+        # 註冊增量同步所需的訊號處理
+        from . import signals  # noqa: F401
@@ -0,0 +1,323 @@
+import os
+import re
+import json
+import hashlib
+import threading
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import cv2
+import pytesseract
+from django.conf import settings
+
+# 匯入 tasks 以將專案根目錄加入路徑
+from meme_manager import tasks  # noqa: F401
+from models.cache import LRUCache
+
+# 自動標籤設定
+OCR_LANGUAGES = getattr(settings, 'OCR_LANGUAGES', 'chi_tra+eng')  # Tesseract 辨識語言
+TAGGING_WORKERS = getattr(settings, 'TAGGING_WORKERS', 4)  # 平行生成標籤的程序數量
+AUTO_TAG_CACHE_DIR = getattr(settings, 'AUTO_TAG_CACHE_DIR', None)  # 標籤結果的磁碟快取目錄，None 表示只快取於記憶體
+AUTO_TAG_CACHE_SIZE = 4096  # 記憶體中快取的圖片數量
+MAX_TEXT_TAGS = 10  # 每張圖片最多從文字中取出的標籤數量
+
+# 標籤生成方式變更時遞增，使舊的快取結果失效
+TAGGER_VERSION = 1
+
+# 顏色標籤：OpenCV 的色相範圍為 0~179，達到畫面比例門檻的顏色才會成為標籤
+COLOR_RANGES = [
+    ('紅色', ((0, 10), (170, 180))),
+    ('橙色', ((10, 20),)),
+    ('黃色', ((20, 35),)),
+    ('綠色', ((35, 85),)),
+    ('藍色', ((85, 130),)),
+    ('紫色', ((130, 150),)),
+    ('粉紅色', ((150, 170),)),
+]
+COLOR_TAG_RATIO = 0.2
+
+PreprocessedImage = namedtuple('PreprocessedImage', ['color', 'gray', 'binary'])
+
+_CJK = r'㐀-䶿一-鿿豈-﫿'
+_CJK_SPACES = re.compile(rf'(?<=[{_CJK}])\s+(?=[{_CJK}])')
+_TOKEN = re.compile(rf'[{_CJK}]+|[A-Za-z0-9]+')
+
+# 記憶體快取與共用的程序池
+_cache = None
+_executor = None
+_executor_lock = threading.Lock()
+
+def preprocess_image(data):
+    """解碼圖片並產生各標籤擷取器共用的灰階與二值化影像
+
+    Args:
+        data (bytes): 圖片檔案內容
+
+    Returns:
+        PreprocessedImage: 彩色、灰階與二值化影像，無法解碼時返回 None
+    """
+    color = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if color is None:
+        return None
+
+    gray = cv2.cvtColor(color, cv2.COLOR_BGR2GRAY)
+    # 小圖放大後 OCR 較準確
+    if min(gray.shape) < 300:
+        gray = cv2.resize(gray, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    # Tesseract 適合淺色背景上的深色文字
+    if binary.mean() < 127:
+        binary = cv2.bitwise_not(binary)
+
+    return PreprocessedImage(color, gray, binary)
+
+def extract_text_tags(image):
+    """以 OCR 辨識圖片中的文字並拆成標籤
+
+    Args:
+        image (PreprocessedImage): 前處理後的圖片
+
+    Returns:
+        list: 標籤列表
+    """
+    text = pytesseract.image_to_string(image.binary, lang=OCR_LANGUAGES)
+    # 中文辨識結果常在字與字之間插入空白
+    text = _CJK_SPACES.sub('', text)
+
+    tags = []
+    for token in _TOKEN.findall(text):
+        if len(token) >= 2 and not token.isdigit() and token not in tags:
+            tags.append(token)
+            if len(tags) >= MAX_TEXT_TAGS:
+                break
+    return tags
+
+def extract_color_tags(image):
+    """依畫面中飽和色彩的色相比例產生顏色標籤
+
+    Args:
+        image (PreprocessedImage): 前處理後的圖片
+
+    Returns:
+        list: 標籤列表
+    """
+    small = cv2.resize(image.color, (64, 64), interpolation=cv2.INTER_AREA)
+    hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+    hue, saturation, value = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+    vivid = (saturation > 80) & (value > 80)
+    total = hue.size
+
+    tags = []
+    for name, ranges in COLOR_RANGES:
+        count = sum(int(np.count_nonzero(vivid & (hue >= low) & (hue < high))) for low, high in ranges)
+        if count / total >= COLOR_TAG_RATIO:
+            tags.append(name)
+    return tags
+
+# 依序執行的標籤擷取器，皆接收同一份前處理結果
+TAG_EXTRACTORS = [extract_text_tags, extract_color_tags]
+
+def extract_tags(data, extract_text=True):
+    """由圖片內容產生標籤
+
+    Args:
+        data (bytes): 圖片檔案內容
+        extract_text (bool): 是否以 OCR 辨識圖片文字，False 時略過文字標籤
+
+    Returns:
+        list: 標籤列表
+    """
+    image = preprocess_image(data)
+    if image is None:
+        raise ValueError("無法解碼圖片")
+
+    tags = []
+    for extractor in TAG_EXTRACTORS:
+        if not extract_text and extractor is extract_text_tags:
+            continue
+        for tag in extractor(image):
+            if tag not in tags:
+                tags.append(tag)
+    return tags
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        _cache = LRUCache(maxsize=AUTO_TAG_CACHE_SIZE)
+    return _cache
+
+def _cache_key(image_hash, extract_text):
+    # 不辨識文字時的結果不同，分開快取
+    return image_hash if extract_text else f"{image_hash}-color"
+
+def _cache_path(key):
+    return os.path.join(AUTO_TAG_CACHE_DIR, f"{key}.json")
+
+def get_cached_tags(image_hash, extract_text=True):
+    """讀取快取的標籤
+
+    Args:
+        image_hash (str): 圖片內容的 SHA-256 雜湊值
+        extract_text (bool): 標籤是否包含 OCR 辨識的文字
+
+    Returns:
+        list: 標籤列表，不在快取中時返回 None
+    """
+    key = _cache_key(image_hash, extract_text)
+    cache = _get_cache()
+    tags = cache.get(key)
+    if tags is not None or not AUTO_TAG_CACHE_DIR:
+        return tags
+
+    try:
+        with open(_cache_path(key), 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if entry.get('version') != TAGGER_VERSION or entry.get('languages') != OCR_LANGUAGES:
+        return None
+
+    tags = entry.get('tags', [])
+    cache.put(key, tags)
+    return tags
+
+def cache_tags(image_hash, tags, extract_text=True):
+    """將標籤寫入快取
+
+    Args:
+        image_hash (str): 圖片內容的 SHA-256 雜湊值
+        tags (list): 標籤列表
+        extract_text (bool): 標籤是否包含 OCR 辨識的文字
+    """
+    key = _cache_key(image_hash, extract_text)
+    _get_cache().put(key, tags)
+    if not AUTO_TAG_CACHE_DIR:
+        return
+
+    path = _cache_path(key)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(AUTO_TAG_CACHE_DIR, exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': TAGGER_VERSION, 'languages': OCR_LANGUAGES, 'tags': tags}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"寫入標籤快取出錯: {str(e)}")
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+def get_tagging_executor(workers=None):
+    """取得共用的標籤生成程序池
+
+    Args:
+        workers (int, optional): 程序數量，預設為 TAGGING_WORKERS
+
+    子程序以 spawn 方式啟動：背景工作程序此時通常已載入模型並啟動推論執行緒，
+    fork 多執行緒的 torch/OpenMP 程序可能使子程序死結，且子程序會繼承模型佔用的記憶體。
+
+    Returns:
+        ProcessPoolExecutor: 程序池
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=max(1, workers or TAGGING_WORKERS),
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _executor
+
+def shutdown_tagging_executor():
+    """關閉標籤生成程序池"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+def _read_image(image_path):
+    """讀取圖片內容並計算雜湊值"""
+    with open(image_path, 'rb') as f:
+        data = f.read()
+    return data, hashlib.sha256(data).hexdigest()
+
+def generate_tags_for_image(image_path, extract_text=True):
+    """為單一圖片生成標籤，相同內容的圖片直接使用快取結果
+
+    Args:
+        image_path (str): 圖片路徑
+        extract_text (bool): 是否以 OCR 辨識圖片文字，False 時只產生顏色標籤
+
+    Returns:
+        str: 以逗號分隔的標籤
+    """
+    data, image_hash = _read_image(image_path)
+    tags = get_cached_tags(image_hash, extract_text)
+    if tags is None:
+        tags = extract_tags(data, extract_text)
+        cache_tags(image_hash, tags, extract_text)
+    return ",".join(tags)
+
+def generate_tags_for_images(image_paths, workers=None, extract_text=True):
+    """以程序池批次為多張圖片生成標籤
+
+    每張圖片只讀取一次，以內容雜湊查詢快取，只有未快取的圖片會送到程序池處理。
+
+    Args:
+        image_paths (list): 圖片路徑列表
+        workers (int, optional): 程序數量，預設為 TAGGING_WORKERS
+        extract_text (bool): 是否以 OCR 辨識圖片文字，False 時只產生顏色標籤
+
+    Returns:
+        list: 與輸入順序相同的標籤字串列表（以逗號分隔），處理失敗的圖片對應 None
+    """
+    results = [None] * len(image_paths)
+    pending = {}
+    for i, image_path in enumerate(image_paths):
+        try:
+            data, image_hash = _read_image(image_path)
+        except OSError as e:
+            print(f"讀取圖片 {image_path} 出錯: {str(e)}")
+            continue
+
+        tags = get_cached_tags(image_hash, extract_text)
+        if tags is not None:
+            results[i] = ",".join(tags)
+        elif image_hash in pending:
+            # 同一批次中內容相同的圖片只處理一次
+            pending[image_hash][1].append(i)
+        else:
+            pending[image_hash] = (data, [i])
+
+    if not pending:
+        return results
+
+    try:
+        executor = get_tagging_executor(workers)
+        futures = {image_hash: executor.submit(extract_tags, data, extract_text) for image_hash, (data, _) in pending.items()}
+    except BrokenProcessPool as e:
+        # 先前的子程序異常結束（例如記憶體不足）後程序池無法再使用，重新建立後由下一批使用
+        print(f"標籤生成程序池已中斷: {str(e)}")
+        shutdown_tagging_executor()
+        return results
+
+    broken = False
+    for image_hash, future in futures.items():
+        try:
+            tags = future.result()
+        except BrokenProcessPool as e:
+            broken = True
+            print(f"生成標籤時程序池中斷 ({image_paths[pending[image_hash][1][0]]}): {str(e)}")
+            continue
+        except Exception as e:
+            print(f"生成標籤時出錯 ({image_paths[pending[image_hash][1][0]]}): {str(e)}")
+            continue
+        cache_tags(image_hash, tags, extract_text)
+        for i in pending[image_hash][1]:
+            results[i] = ",".join(tags)
+
+    if broken:
+        shutdown_tagging_executor()
+    return results
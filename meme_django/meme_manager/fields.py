@@ -0,0 +1,106 @@
+import base64
+import json
+import struct
+import numpy as np
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+# 二進位向量格式：4 位元組標記 + 1 位元組型態代碼 + uint32 維度 + 小端序原始資料
+VECTOR_MAGIC = b'VEC1'
+VECTOR_HEADER = struct.Struct('<4scI')
+VECTOR_DTYPES = {
+    b'e': np.dtype('<f2'),
+    b'f': np.dtype('<f4'),
+}
+VECTOR_DTYPE_CODES = {dtype: code for code, dtype in VECTOR_DTYPES.items()}
+
+def encode_vector(vector, dtype='float32'):
+    """將向量編碼為二進位格式
+
+    Args:
+        vector (np.ndarray | list): 向量
+        dtype (str): 儲存的資料型態，float32 或 float16
+
+    Returns:
+        bytes: 含標頭的二進位資料
+    """
+    dtype = np.dtype(dtype).newbyteorder('<')
+    if dtype not in VECTOR_DTYPE_CODES:
+        raise ValueError(f"不支援的向量型態: {dtype}")
+
+    array = np.ascontiguousarray(np.asarray(vector).reshape(-1), dtype=dtype)
+    header = VECTOR_HEADER.pack(VECTOR_MAGIC, VECTOR_DTYPE_CODES[dtype], array.size)
+    return header + array.tobytes()
+
+def decode_vector(data):
+    """將二進位資料解碼為向量，也相容舊版以 JSON 儲存的向量
+
+    Args:
+        data (bytes | memoryview | str): 資料庫中的值
+
+    Returns:
+        np.ndarray: 向量（二進位資料為唯讀的零複製檢視），無資料時為 None
+    """
+    if data is None:
+        return None
+
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    data = memoryview(data)
+
+    if data.nbytes >= VECTOR_HEADER.size and data[:4].tobytes() == VECTOR_MAGIC:
+        _, code, dim = VECTOR_HEADER.unpack_from(data)
+        dtype = VECTOR_DTYPES.get(code)
+        if dtype is None:
+            raise ValueError(f"未知的向量型態代碼: {code!r}")
+        return np.frombuffer(data, dtype=dtype, count=dim, offset=VECTOR_HEADER.size)
+
+    # 舊版 JSONField 儲存的浮點數列表
+    values = json.loads(data.tobytes().decode('utf-8'))
+    if values is None:
+        return None
+    return np.asarray(values, dtype=np.float32)
+
+class VectorField(models.BinaryField):
+    """以緊湊二進位格式儲存 NumPy 向量的欄位
+
+    讀取時直接返回 np.ndarray，寫入時接受 np.ndarray（或列表），
+    標頭中記錄資料型態與維度。
+    """
+    description = _("二進位向量")
+
+    def __init__(self, *args, dtype='float32', **kwargs):
+        self.dtype = dtype
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.dtype != 'float32':
+            kwargs['dtype'] = self.dtype
+        return name, path, args, kwargs
+
+    def from_db_value(self, value, expression, connection):
+        return decode_vector(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, np.ndarray):
+            return value
+        if isinstance(value, (list, tuple)):
+            return np.asarray(value, dtype=self.dtype)
+        if isinstance(value, str) and not value.lstrip().startswith(('[', 'null')):
+            # 序列化 (dumpdata) 時使用的 base64 字串
+            value = base64.b64decode(value.encode('ascii'))
+        return decode_vector(value)
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        if isinstance(value, (bytes, memoryview)):
+            value = decode_vector(value)
+        return encode_vector(value, dtype=self.dtype)
+
+    def value_to_string(self, obj):
+        value = self.value_from_object(obj)
+        if value is None:
+            return None
+        return base64.b64encode(encode_vector(value, dtype=self.dtype)).decode('ascii')
@@ -0,0 +1,99 @@
+import hashlib
+
+# 匯入 tasks 以將專案根目錄加入路徑
+from meme_manager import tasks  # noqa: F401
+from models.perceptual_hash import PerceptualHashIndex, DEFAULT_DUPLICATE_DISTANCE, dhash, format_hash, parse_hash
+
+def hash_text(text):
+    """計算文字內容的 SHA-256 雜湊
+
+    Args:
+        text (str): 文字
+
+    Returns:
+        str: 十六進位雜湊值
+    """
+    return hashlib.sha256((text or "").encode('utf-8')).hexdigest()
+
+def hash_stored_file(storage, name, chunk_size=64 * 1024):
+    """計算儲存空間中檔案內容的 SHA-256 雜湊
+
+    Args:
+        storage: Django 檔案儲存空間
+        name (str): 檔案名稱
+        chunk_size (int): 每次讀取的位元組數
+
+    Returns:
+        str: 十六進位雜湊值，檔案不存在時返回 None
+    """
+    if not name or not storage.exists(name):
+        return None
+
+    hasher = hashlib.sha256()
+    with storage.open(name, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def hash_uploaded_file(uploaded_file):
+    """逐塊計算上傳檔案內容的 SHA-256 雜湊，讀取後將檔案位置移回開頭
+
+    Args:
+        uploaded_file: Django 上傳檔案
+
+    Returns:
+        str: 十六進位雜湊值
+    """
+    hasher = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        hasher.update(chunk)
+    uploaded_file.seek(0)
+    return hasher.hexdigest()
+
+def perceptual_hash_file(f):
+    """計算圖片檔案物件的感知雜湊 (dHash)，讀取後將檔案位置移回原處
+
+    Args:
+        f: 圖片檔案物件
+
+    Returns:
+        str: 十六進位雜湊值，無法解碼圖片時返回 None
+    """
+    try:
+        return format_hash(dhash(f))
+    except Exception as e:
+        print(f"計算感知雜湊時出錯: {str(e)}")
+        return None
+
+def perceptual_hash_stored_file(storage, name):
+    """計算儲存空間中圖片的感知雜湊 (dHash)
+
+    Args:
+        storage: Django 檔案儲存空間
+        name (str): 檔案名稱
+
+    Returns:
+        str: 十六進位雜湊值，檔案不存在或無法解碼時返回 None
+    """
+    if not name or not storage.exists(name):
+        return None
+
+    with storage.open(name, 'rb') as f:
+        return perceptual_hash_file(f)
+
+def build_perceptual_hash_index(max_distance=DEFAULT_DUPLICATE_DISTANCE):
+    """以所有梗圖的感知雜湊建立重複圖片索引
+
+    Args:
+        max_distance (int): 視為重複圖片的最大漢明距離
+
+    Returns:
+        PerceptualHashIndex: 梗圖ID -> 感知雜湊的索引
+    """
+    from meme_manager.models import Meme
+
+    rows = Meme.objects.exclude(perceptual_hash=None).values_list('id', 'perceptual_hash')
+    return PerceptualHashIndex(
+        ((meme_id, parse_hash(value)) for meme_id, value in rows.iterator(chunk_size=2000)),
+        max_distance=max_distance
+    )
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from meme_manager.fields import VECTOR_MAGIC
+from meme_manager.models import Meme
+
+class Command(BaseCommand):
+    help = "將舊版以 JSON 儲存的嵌入向量與圖片特徵轉換為二進位向量格式"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="每次批次寫入的梗圖數量")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        fields = ['embedding', 'image_features']
+
+        # 略過欄位轉換器直接讀取原始值，判斷哪些梗圖仍是 JSON 格式
+        quote = connection.ops.quote_name
+        columns = ', '.join(quote(Meme._meta.get_field(name).column) for name in ['id', *fields])
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT {columns} FROM {quote(Meme._meta.db_table)}")
+            legacy_ids = [row[0] for row in cursor.fetchall() if any(self._is_legacy(value) for value in row[1:])]
+
+        if not legacy_ids:
+            self.stdout.write(self.style.SUCCESS("所有向量皆已是二進位格式"))
+            return
+
+        converted = 0
+        for start in range(0, len(legacy_ids), batch_size):
+            chunk_ids = legacy_ids[start:start + batch_size]
+            # VectorField 讀取時會解析 JSON，寫回時編碼為二進位
+            memes = list(Meme.objects.filter(id__in=chunk_ids).only('id', *fields))
+            Meme.objects.bulk_update(memes, fields)
+            converted += len(memes)
+            self.stdout.write(f"已轉換 {converted}/{len(legacy_ids)} 個梗圖")
+
+        self.stdout.write(self.style.SUCCESS(f"完成，共轉換 {converted} 個梗圖的向量"))
+
+    @staticmethod
+    def _is_legacy(value):
+        if value is None:
+            return False
+        if isinstance(value, str):
+            return True
+        return bytes(value[:len(VECTOR_MAGIC)]) != VECTOR_MAGIC
@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from meme_manager.hashing import perceptual_hash_stored_file, build_perceptual_hash_index
+from meme_manager.models import Meme
+from models.perceptual_hash import DEFAULT_DUPLICATE_DISTANCE, parse_hash
+
+class Command(BaseCommand):
+    help = "為尚未計算感知雜湊的梗圖補上雜湊，並列出重複（重新編碼或縮放）的梗圖"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="每次批次寫入的梗圖數量")
+        parser.add_argument('--max-distance', type=int,
+                            default=getattr(settings, 'DUPLICATE_HASH_DISTANCE', DEFAULT_DUPLICATE_DISTANCE),
+                            help="視為重複圖片的最大漢明距離")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        missing_ids = list(Meme.objects.filter(perceptual_hash=None).order_by('id').values_list('id', flat=True))
+        for start in range(0, len(missing_ids), batch_size):
+            memes = list(Meme.objects.filter(id__in=missing_ids[start:start + batch_size]).only('id', 'image'))
+            now = timezone.now()
+            for meme in memes:
+                meme.perceptual_hash = perceptual_hash_stored_file(meme.image.storage, meme.image.name)
+                # bulk_update 不會自動更新 auto_now 欄位，需手動設定以便機器人增量同步取得雜湊
+                meme.updated_at = now
+            Meme.objects.bulk_update(memes, ['perceptual_hash', 'updated_at'])
+            self.stdout.write(f"已計算 {min(start + batch_size, len(missing_ids))}/{len(missing_ids)} 個梗圖的感知雜湊")
+
+        index = build_perceptual_hash_index(options['max_distance'])
+        rows = Meme.objects.exclude(perceptual_hash=None).order_by('id').values_list('id', 'perceptual_hash')
+
+        # 每組重複梗圖以ID最小的梗圖為代表
+        grouped = set()
+        groups = 0
+        for meme_id, value in rows.iterator(chunk_size=2000):
+            if meme_id in grouped:
+                continue
+            matches = [match_id for _, match_id in index.find(parse_hash(value)) if match_id not in grouped]
+            if len(matches) < 2:
+                continue
+            grouped.update(matches)
+            groups += 1
+            self.stdout.write(f"重複梗圖: {', '.join(str(match_id) for match_id in sorted(matches))}")
+
+        self.stdout.write(self.style.SUCCESS(f"完成，共找到 {groups} 組重複梗圖"))
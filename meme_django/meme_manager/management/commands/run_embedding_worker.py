@@ -0,0 +1,34 @@
+import time
+from django.core.management.base import BaseCommand
+from meme_manager.tasks import claim_next_embedding_job, requeue_stale_embedding_jobs, run_embedding_job
+
+class Command(BaseCommand):
+    help = "執行嵌入向量背景工作程序，依序處理佇列中的工作"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="佇列為空時的輪詢間隔（秒）")
+        parser.add_argument('--once', action='store_true', help="處理完目前佇列中的工作後結束")
+
+    def handle(self, *args, **options):
+        poll_interval = options['poll_interval']
+        self.stdout.write("嵌入向量工作程序已啟動")
+
+        try:
+            while True:
+                requeued = requeue_stale_embedding_jobs()
+                if requeued:
+                    self.stdout.write(f"重新排入 {requeued} 個中斷的工作")
+
+                job = claim_next_embedding_job()
+                if job:
+                    self.stdout.write(f"開始執行工作 {job.id}（第 {job.attempts} 次嘗試）")
+                    run_embedding_job(job)
+                    self.stdout.write(f"工作 {job.id} 狀態: {job.get_status_display()} ({job.progress}/{job.total})")
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write("嵌入向量工作程序已結束")
@@ -0,0 +1,90 @@
+from aiohttp import web
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Max
+from meme_manager.models import Meme, DeletedMeme, ModelConfiguration
+
+# 匯入 tasks 以將專案根目錄加入路徑
+from meme_manager import tasks  # noqa: F401
+from models.inference_server import InferenceServer, DEFAULT_MAX_BATCH, DEFAULT_MAX_WAIT
+from models.search_engine import VectorSearchEngine
+from models.ann_index import attach_ann_indexes
+from models.perceptual_hash import PerceptualHashIndex, parse_hash
+from models.lexical_index import BM25Index
+
+def make_index_loader():
+    """建立索引載入函數，只在梗圖目錄有變更時重新建立索引"""
+    last_state = [None]
+
+    def load_indexes():
+        state = (
+            Meme.objects.aggregate(count=Count('id'), updated=Max('updated_at')),
+            DeletedMeme.objects.aggregate(deleted=Max('deleted_at')),
+        )
+        if state == last_state[0]:
+            return None
+
+        text_items = []
+        image_items = []
+        hash_index = PerceptualHashIndex()
+        lexical_items = []
+        rows = Meme.objects.order_by('id').values_list(
+            'id', 'embedding', 'image_features', 'perceptual_hash', 'title', 'keywords'
+        )
+        for meme_id, embedding, image_features, perceptual_hash, title, keywords in rows.iterator(chunk_size=500):
+            lexical_items.append((meme_id, title, keywords))
+            if embedding is not None:
+                text_items.append((meme_id, embedding))
+            if image_features is not None:
+                image_items.append((meme_id, image_features))
+            if perceptual_hash:
+                hash_index.add(meme_id, parse_hash(perceptual_hash))
+
+        last_state[0] = state
+        text_index, image_index = VectorSearchEngine(text_items), VectorSearchEngine(image_items)
+        if getattr(settings, 'USE_ANN_INDEX', False):
+            config = ModelConfiguration.objects.filter(active=True).first()
+            models = {
+                'embedding': config.nlp_model_path if config else None,
+                'image_features': config.cv_model_path if config else None,
+            }
+            text_index, image_index = attach_ann_indexes(text_index, image_index, settings.ANN_INDEX_DIR,
+                                                         n_probe=getattr(settings, 'ANN_N_PROBE', 0) or None,
+                                                         models=models)
+        return text_index, image_index, hash_index, BM25Index(lexical_items)
+
+    return load_indexes
+
+class Command(BaseCommand):
+    help = "啟動本機推論服務，載入一次啟用的模型供機器人與背景工作程序共用"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help="監聽位址")
+        parser.add_argument('--port', type=int, default=8765, help="監聽埠號")
+        parser.add_argument('--max-batch', type=int, default=DEFAULT_MAX_BATCH, help="微批次的最大數量")
+        parser.add_argument('--max-wait-ms', type=float, default=DEFAULT_MAX_WAIT * 1000,
+                            help="湊微批次時最多等待的毫秒數")
+        parser.add_argument('--refresh-interval', type=float, default=30, help="檢查梗圖目錄是否變更的間隔（秒）")
+
+    def handle(self, *args, **options):
+        config = ModelConfiguration.objects.filter(active=True).first()
+        if not config:
+            self.stderr.write("沒有啟用的模型設定")
+            return
+
+        server = InferenceServer(
+            nlp_model_path=config.nlp_model_path,
+            cv_model_path=config.cv_model_path,
+            index_loader=make_index_loader(),
+            refresh_interval=options['refresh_interval'],
+            max_batch=options['max_batch'],
+            max_wait=options['max_wait_ms'] / 1000,
+            allowed_root=settings.MEDIA_ROOT
+        )
+
+        self.stdout.write(f"載入模型設定: {config.name}")
+        server.load_models()
+        server.refresh_indexes()
+
+        self.stdout.write(f"推論服務啟動於 http://{options['host']}:{options['port']}")
+        web.run_app(server.create_app(), host=options['host'], port=options['port'], print=None)
@@ -0,0 +1,121 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:14
+
+import django.db.models.deletion
+import django.utils.timezone
+import meme_manager.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletedMeme',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('meme_id', models.BigIntegerField(verbose_name='梗圖ID')),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='刪除時間')),
+            ],
+            options={
+                'verbose_name': '已刪除梗圖',
+                'verbose_name_plural': '已刪除梗圖',
+            },
+        ),
+        migrations.CreateModel(
+            name='EmbeddingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('meme_ids', models.JSONField(blank=True, default=list, help_text='空列表表示所有梗圖', verbose_name='梗圖ID列表')),
+                ('force', models.BooleanField(default=False, help_text='未勾選時略過內容與模型皆未變更的梗圖', verbose_name='強制重新生成')),
+                ('generate_tags', models.BooleanField(default=False, help_text='生成嵌入向量前先依圖片內容產生標籤，完成後自動取消', verbose_name='自動生成標籤')),
+                ('status', models.CharField(choices=[('pending', '等待中'), ('running', '執行中'), ('succeeded', '已完成'), ('failed', '失敗')], db_index=True, default='pending', max_length=20, verbose_name='狀態')),
+                ('progress', models.PositiveIntegerField(default=0, verbose_name='已處理數量')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='總數量')),
+                ('failed_count', models.PositiveIntegerField(default=0, verbose_name='失敗數量')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='嘗試次數')),
+                ('max_attempts', models.PositiveIntegerField(default=3, verbose_name='最大嘗試次數')),
+                ('error', models.TextField(blank=True, default='', verbose_name='錯誤訊息')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='最早執行時間')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='建立時間')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='開始時間')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='完成時間')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新時間')),
+            ],
+            options={
+                'verbose_name': '嵌入向量工作',
+                'verbose_name_plural': '嵌入向量工作',
+            },
+        ),
+        migrations.CreateModel(
+            name='MemeCategory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='類別名稱')),
+                ('description', models.TextField(blank=True, null=True, verbose_name='類別描述')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='建立時間')),
+            ],
+            options={
+                'verbose_name': '梗圖類別',
+                'verbose_name_plural': '梗圖類別',
+            },
+        ),
+        migrations.CreateModel(
+            name='ModelConfiguration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='設定名稱')),
+                ('nlp_model_path', models.CharField(blank=True, max_length=255, null=True, verbose_name='NLP模型路徑')),
+                ('cv_model_path', models.CharField(blank=True, max_length=255, null=True, verbose_name='CV模型路徑')),
+                ('active', models.BooleanField(default=False, verbose_name='是否啟用')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='建立時間')),
+            ],
+            options={
+                'verbose_name': '模型設定',
+                'verbose_name_plural': '模型設定',
+            },
+        ),
+        migrations.CreateModel(
+            name='Meme',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200, verbose_name='標題')),
+                ('image', models.ImageField(upload_to='memes/', verbose_name='圖片')),
+                ('keywords', models.TextField(help_text='請使用逗號分隔關鍵字', verbose_name='關鍵字')),
+                ('image_hash', models.CharField(blank=True, editable=False, max_length=64, null=True, verbose_name='圖片雜湊')),
+                ('perceptual_hash', models.CharField(blank=True, editable=False, help_text='圖片的 dHash，用於找出重新編碼或縮放的重複圖片', max_length=16, null=True, verbose_name='感知雜湊')),
+                ('embedding', meme_manager.fields.VectorField(blank=True, null=True, verbose_name='文字嵌入向量')),
+                ('embedding_model', models.CharField(blank=True, max_length=255, null=True, verbose_name='文字嵌入模型')),
+                ('embedding_source_hash', models.CharField(blank=True, editable=False, max_length=64, null=True, verbose_name='文字嵌入來源雜湊')),
+                ('image_features', meme_manager.fields.VectorField(blank=True, null=True, verbose_name='圖片特徵向量')),
+                ('image_features_model', models.CharField(blank=True, max_length=255, null=True, verbose_name='圖片特徵模型')),
+                ('image_features_source_hash', models.CharField(blank=True, editable=False, max_length=64, null=True, verbose_name='圖片特徵來源雜湊')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='建立時間')),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True, verbose_name='更新時間')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memes', to='meme_manager.memecategory', verbose_name='類別')),
+            ],
+            options={
+                'verbose_name': '梗圖',
+                'verbose_name_plural': '梗圖',
+            },
+        ),
+        migrations.CreateModel(
+            name='UserInteraction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(max_length=100, verbose_name='使用者ID')),
+                ('input_text', models.TextField(blank=True, null=True, verbose_name='輸入文字')),
+                ('input_image', models.BooleanField(default=False, verbose_name='是否有輸入圖片')),
+                ('interaction_time', models.DateTimeField(auto_now_add=True, verbose_name='互動時間')),
+                ('recommended_meme', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='recommendations', to='meme_manager.meme', verbose_name='推薦梗圖')),
+            ],
+            options={
+                'verbose_name': '使用者互動',
+                'verbose_name_plural': '使用者互動',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meme_manager', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='embeddingjob',
+            name='extract_text',
+            field=models.BooleanField(default=True, help_text='自動生成標籤時以 OCR 辨識圖片文字，未勾選時只產生顏色標籤', verbose_name='提取圖片文字'),
+        ),
+    ]
@@ -1,5 +1,8 @@
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
+from .fields import VectorField
+from .hashing import hash_stored_file, perceptual_hash_stored_file
 
 class MemeCategory(models.Model):
     name = models.CharField(_("類別名稱"), max_length=100)
@@ -18,16 +21,57 @@ class Meme(models.Model):
     image = models.ImageField(_("圖片"), upload_to="memes/")
     category = models.ForeignKey(MemeCategory, on_delete=models.CASCADE, related_name="memes", verbose_name=_("類別"))
     keywords = models.TextField(_("關鍵字"), help_text=_("請使用逗號分隔關鍵字"))
-    embedding = models.JSONField(_("文字嵌入向量"), blank=True, null=True)
-    image_features = models.JSONField(_("圖片特徵向量"), blank=True, null=True)
+    image_hash = models.CharField(_("圖片雜湊"), max_length=64, blank=True, null=True, editable=False)
+    perceptual_hash = models.CharField(_("感知雜湊"), max_length=16, blank=True, null=True, editable=False,
+                                       help_text=_("圖片的 dHash，用於找出重新編碼或縮放的重複圖片"))
+    embedding = VectorField(_("文字嵌入向量"), blank=True, null=True)
+    embedding_model = models.CharField(_("文字嵌入模型"), max_length=255, blank=True, null=True)
+    embedding_source_hash = models.CharField(_("文字嵌入來源雜湊"), max_length=64, blank=True, null=True, editable=False)
+    image_features = VectorField(_("圖片特徵向量"), blank=True, null=True)
+    image_features_model = models.CharField(_("圖片特徵模型"), max_length=255, blank=True, null=True)
+    image_features_source_hash = models.CharField(_("圖片特徵來源雜湊"), max_length=64, blank=True, null=True, editable=False)
     created_at = models.DateTimeField(_("建立時間"), auto_now_add=True)
+    updated_at = models.DateTimeField(_("更新時間"), auto_now=True, db_index=True)
     
     def __str__(self):
         return self.title
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 記錄載入時的圖片名稱，儲存時用來判斷圖片是否更換
+        instance._loaded_image_name = instance.__dict__.get('image')
+        return instance
+    
+    def save(self, *args, **kwargs):
+        image_changed = 'image' not in self.get_deferred_fields() and bool(self.image) and (
+            not self.image_hash or self.image.name != getattr(self, '_loaded_image_name', None)
+        )
+        super().save(*args, **kwargs)
+        
+        # 圖片寫入儲存空間後計算內容雜湊，供重新生成嵌入向量時判斷是否需要更新，
+        # 並計算感知雜湊供偵測重複圖片
+        if image_changed:
+            self.image_hash = hash_stored_file(self.image.storage, self.image.name)
+            self.perceptual_hash = perceptual_hash_stored_file(self.image.storage, self.image.name)
+            self._loaded_image_name = self.image.name
+            Meme.objects.filter(pk=self.pk).update(image_hash=self.image_hash, perceptual_hash=self.perceptual_hash)
+    
     class Meta:
         verbose_name = _("梗圖")
         verbose_name_plural = _("梗圖")
+
+class DeletedMeme(models.Model):
+    """已刪除梗圖的記錄，供機器人增量同步時得知哪些梗圖被移除"""
+    meme_id = models.BigIntegerField(_("梗圖ID"))
+    deleted_at = models.DateTimeField(_("刪除時間"), auto_now_add=True, db_index=True)
+    
+    def __str__(self):
+        return f"{self.meme_id} - {self.deleted_at}"
+    
+    class Meta:
+        verbose_name = _("已刪除梗圖")
+        verbose_name_plural = _("已刪除梗圖")
         
 class UserInteraction(models.Model):
     user_id = models.CharField(_("使用者ID"), max_length=100)
@@ -61,4 +105,55 @@ class ModelConfiguration(models.Model):
         if self.active:
             # 停用其他設定
             ModelConfiguration.objects.exclude(pk=self.pk).update(active=False)
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+class EmbeddingJob(models.Model):
+    """嵌入向量生成工作，由背景工作程序 (run_embedding_worker) 依序執行"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, _("等待中")),
+        (STATUS_RUNNING, _("執行中")),
+        (STATUS_SUCCEEDED, _("已完成")),
+        (STATUS_FAILED, _("失敗")),
+    ]
+    
+    meme_ids = models.JSONField(_("梗圖ID列表"), default=list, blank=True, help_text=_("空列表表示所有梗圖"))
+    force = models.BooleanField(_("強制重新生成"), default=False, help_text=_("未勾選時略過內容與模型皆未變更的梗圖"))
+    generate_tags = models.BooleanField(_("自動生成標籤"), default=False,
+                                        help_text=_("生成嵌入向量前先依圖片內容產生標籤，完成後自動取消"))
+    extract_text = models.BooleanField(_("提取圖片文字"), default=True,
+                                       help_text=_("自動生成標籤時以 OCR 辨識圖片文字，未勾選時只產生顏色標籤"))
+    status = models.CharField(_("狀態"), max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    progress = models.PositiveIntegerField(_("已處理數量"), default=0)
+    total = models.PositiveIntegerField(_("總數量"), default=0)
+    failed_count = models.PositiveIntegerField(_("失敗數量"), default=0)
+    attempts = models.PositiveIntegerField(_("嘗試次數"), default=0)
+    max_attempts = models.PositiveIntegerField(_("最大嘗試次數"), default=3)
+    error = models.TextField(_("錯誤訊息"), blank=True, default="")
+    run_after = models.DateTimeField(_("最早執行時間"), default=timezone.now)
+    created_at = models.DateTimeField(_("建立時間"), auto_now_add=True)
+    started_at = models.DateTimeField(_("開始時間"), blank=True, null=True)
+    finished_at = models.DateTimeField(_("完成時間"), blank=True, null=True)
+    updated_at = models.DateTimeField(_("更新時間"), auto_now=True)
+    
+    def __str__(self):
+        return f"{self.get_status_display()} - {self.progress}/{self.total}"
+    
+    @property
+    def stage(self):
+        """目前的處理階段：先生成標籤，再生成嵌入向量"""
+        return 'tagging' if self.generate_tags else 'embedding'
+    
+    @property
+    def percent(self):
+        """完成百分比"""
+        if not self.total:
+            return 100 if self.status == self.STATUS_SUCCEEDED else 0
+        return int(self.progress * 100 / self.total)
+    
+    class Meta:
+        verbose_name = _("嵌入向量工作")
+        verbose_name_plural = _("嵌入向量工作")
@@ -0,0 +1,15 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from .models import Meme, MemeCategory, DeletedMeme
+
+@receiver(post_delete, sender=Meme)
+def record_meme_deletion(sender, instance, **kwargs):
+    """記錄被刪除的梗圖（包含刪除類別時連帶刪除的梗圖），供增量同步使用"""
+    DeletedMeme.objects.create(meme_id=instance.id)
+
+@receiver(post_save, sender=MemeCategory)
+def touch_category_memes(sender, instance, created, **kwargs):
+    """類別名稱變更時更新所屬梗圖的更新時間，讓增量同步帶出新的類別名稱"""
+    if not created:
+        Meme.objects.filter(category=instance).update(updated_at=timezone.now())
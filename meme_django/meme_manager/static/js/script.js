@@ -14,6 +14,9 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // 自動隱藏通知訊息
     initAutoHideAlerts();
+    
+    // 更新背景工作進度
+    initJobProgress();
 });
 
 // 圖片預覽功能
@@ -75,6 +78,42 @@ function initAutoHideAlerts() {
     });
 }
 
+// 輪詢背景工作進度，直到工作完成或失敗
+function pollJobProgress(statusUrl, onUpdate, interval = 2000) {
+    function poll() {
+        fetch(statusUrl, { headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+            .then(response => response.json())
+            .then(job => {
+                onUpdate(job);
+                if (!job.done) {
+                    setTimeout(poll, interval);
+                }
+            })
+            .catch(() => setTimeout(poll, interval * 2));
+    }
+    
+    poll();
+}
+
+// 背景工作進度列
+function initJobProgress() {
+    const rows = document.querySelectorAll('.job-progress');
+    rows.forEach(row => {
+        const status = row.getAttribute('data-job-status');
+        if (status === 'succeeded' || status === 'failed') return;
+        
+        pollJobProgress(row.getAttribute('data-job-status-url'), function(job) {
+            const bar = row.querySelector('.progress-bar');
+            bar.style.width = job.percent + '%';
+            bar.textContent = `${job.progress}/${job.total}`;
+            row.querySelector('.job-status').textContent = job.status_display;
+            if (job.status === 'failed') {
+                bar.classList.add('bg-danger');
+            }
+        });
+    });
+}
+
 // 類別過濾器
 function filterByCategory(selectElement) {
     const form = selectElement.closest('form');
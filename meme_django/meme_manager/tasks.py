@@ -1,50 +1,449 @@
 import os
 import numpy as np
 import sys
+from datetime import timedelta
 from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
 
 # 添加models目錄到路徑
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-def generate_embeddings(meme_id):
-    """為單一梗圖生成嵌入向量"""
-    try:
-        from meme_manager.models import Meme, ModelConfiguration
-        from models.nlp_model import get_text_embedding
-        from models.cv_model import get_image_features
+# 背景工作設定
+EMBEDDING_JOB_RETRY_DELAY = getattr(settings, 'EMBEDDING_JOB_RETRY_DELAY', 30)  # 重試前等待秒數（依嘗試次數倍增）
+EMBEDDING_JOB_STALE_TIMEOUT = getattr(settings, 'EMBEDDING_JOB_STALE_TIMEOUT', 600)  # 執行中工作多久沒有進度視為中斷
+EMBEDDING_BATCH_SIZE = getattr(settings, 'EMBEDDING_BATCH_SIZE', 32)  # 批次推論時每批的梗圖數量
+IMAGE_PREPROCESS_WORKERS = getattr(settings, 'IMAGE_PREPROCESS_WORKERS', None)  # 圖片解碼與前處理的執行緒數量
+INFERENCE_SERVER_URL = getattr(settings, 'INFERENCE_SERVER_URL', '')  # 本機推論服務網址
+TAGGING_WORKERS = getattr(settings, 'TAGGING_WORKERS', 4)  # 批量上傳後自動生成標籤的程序數量
+
+_inference_client = None
+
+def get_inference_client():
+    """取得本機推論服務的客戶端，未設定 INFERENCE_SERVER_URL 時返回 None"""
+    global _inference_client
+    
+    if INFERENCE_SERVER_URL and _inference_client is None:
+        from models.inference_client import InferenceClient
+        _inference_client = InferenceClient(INFERENCE_SERVER_URL)
+    return _inference_client
+
+def _embed_texts(texts, config, batch_size):
+    """生成文字嵌入向量，有推論服務時交由服務處理
+    
+    Returns:
+        list: 嵌入向量列表，失敗時返回 None
+    """
+    client = get_inference_client()
+    if client is None:
+        from models.nlp_model import get_text_embeddings
+        return get_text_embeddings(texts, model_path=config.nlp_model_path, batch_size=batch_size)
+    
+    result = client.embed_texts(texts)
+    if result is None:
+        return None
+    embeddings, model = result
+    if model != config.nlp_model_path:
+        # 推論服務啟動後啟用的設定已變更，需重新啟動服務
+        raise RuntimeError(f"推論服務使用的NLP模型 ({model}) 與啟用設定 ({config.nlp_model_path}) 不同")
+    return embeddings
+
+def _embed_images(image_paths, config, batch_size):
+    """提取圖片特徵，有推論服務時交由服務處理
+    
+    Returns:
+        list: 特徵向量列表，無法讀取的圖片對應 None，失敗時返回 None
+    """
+    client = get_inference_client()
+    if client is None:
+        from models.cv_model import get_images_features
+        return get_images_features(
+            image_paths,
+            model_path=config.cv_model_path,
+            batch_size=batch_size,
+            workers=IMAGE_PREPROCESS_WORKERS
+        )
+    
+    result = client.embed_images(image_paths)
+    if result is None:
+        return None
+    features, model = result
+    if model != config.cv_model_path:
+        raise RuntimeError(f"推論服務使用的CV模型 ({model}) 與啟用設定 ({config.cv_model_path}) 不同")
+    return features
+
+def generate_embeddings(meme_id, force=False):
+    """為單一梗圖生成嵌入向量
+    
+    Args:
+        meme_id (int): 梗圖ID
+        force (bool): 是否在內容與模型皆未變更時仍重新生成
+        
+    Returns:
+        bool: 是否成功生成
+    """
+    return not generate_embeddings_batch([meme_id], force=force)
+
+def _is_stale(model_identity, source_hash, config_model, current_hash):
+    """判斷向量是否需要重新生成：模型或來源內容與上次生成時不同"""
+    return not source_hash or source_hash != current_hash or model_identity != config_model
+
+def generate_embeddings_batch(meme_ids, batch_size=None, progress_callback=None, force=False, heartbeat=None):
+    """以批次推論為多個梗圖生成嵌入向量
+    
+    依批次讀取梗圖，文字與圖片各以一次批次推論處理整批，最後以 bulk_update 寫回。
+    每個梗圖記錄生成向量時的關鍵字雜湊、圖片雜湊與模型，未指定 force 時，
+    內容與模型皆未變更的向量會被略過。
+    
+    Args:
+        meme_ids (list): 梗圖ID列表
+        batch_size (int, optional): 每批的梗圖數量，預設為 EMBEDDING_BATCH_SIZE
+        progress_callback (callable, optional): 每批完成後呼叫，參數為 (已處理數量, 失敗數量)
+        force (bool): 是否重新生成所有向量
+        heartbeat (callable, optional): 每批開始與文字、圖片推論之間呼叫，讓工作在批次處理期間不被視為中斷
         
-        meme = Meme.objects.get(id=meme_id)
+    Returns:
+        list: 生成失敗的梗圖ID列表
+    """
+    from meme_manager.models import Meme, ModelConfiguration
+    from meme_manager.hashing import hash_text, hash_stored_file
+    
+    meme_ids = list(meme_ids)
+    batch_size = batch_size or EMBEDDING_BATCH_SIZE
+    
+    # 獲取啟用的模型設定
+    config = ModelConfiguration.objects.filter(active=True).first()
+    if not config:
+        return meme_ids
+    
+    failed = []
+    processed = 0
+    for start in range(0, len(meme_ids), batch_size):
+        chunk_ids = meme_ids[start:start + batch_size]
+        if heartbeat:
+            heartbeat()
+        try:
+            memes = list(Meme.objects.filter(id__in=chunk_ids).only(
+                'id', 'image', 'keywords', 'image_hash',
+                'embedding_model', 'embedding_source_hash',
+                'image_features_model', 'image_features_source_hash'
+            ))
+            now = timezone.now()
+            backfilled = []
+            
+            # 生成文字嵌入向量，只處理關鍵字或模型有變更的梗圖
+            if config.nlp_model_path:
+                keywords_hashes = {meme.id: hash_text(meme.keywords) for meme in memes}
+                stale = [
+                    meme for meme in memes
+                    if force or _is_stale(meme.embedding_model, meme.embedding_source_hash,
+                                          config.nlp_model_path, keywords_hashes[meme.id])
+                ]
+                if stale:
+                    embeddings = _embed_texts([meme.keywords for meme in stale], config, batch_size)
+                    if embeddings is None:
+                        raise RuntimeError("文字嵌入向量生成失敗")
+                    for meme, embedding in zip(stale, embeddings):
+                        meme.embedding = embedding
+                        meme.embedding_model = config.nlp_model_path
+                        meme.embedding_source_hash = keywords_hashes[meme.id]
+                        meme.updated_at = now
+                    # bulk_update 不會自動更新 auto_now 欄位，需手動設定以便增量同步
+                    Meme.objects.bulk_update(
+                        stale, ['embedding', 'embedding_model', 'embedding_source_hash', 'updated_at']
+                    )
+            
+            # 生成圖片特徵向量，只處理圖片或模型有變更的梗圖
+            if config.cv_model_path:
+                if heartbeat:
+                    heartbeat()
+                for meme in memes:
+                    if not meme.image_hash:
+                        # 舊資料沒有圖片雜湊時補上
+                        meme.image_hash = hash_stored_file(meme.image.storage, meme.image.name)
+                        backfilled.append(meme)
+                stale = [
+                    meme for meme in memes
+                    if force or _is_stale(meme.image_features_model, meme.image_features_source_hash,
+                                          config.cv_model_path, meme.image_hash)
+                ]
+                if stale:
+                    image_paths = [os.path.join(settings.MEDIA_ROOT, meme.image.name) for meme in stale]
+                    features = _embed_images(image_paths, config, batch_size)
+                    if features is None:
+                        raise RuntimeError("圖片特徵提取失敗")
+                    for meme, feature in zip(stale, features):
+                        meme.image_features = feature
+                        meme.image_features_model = config.cv_model_path if feature is not None else None
+                        meme.image_features_source_hash = meme.image_hash if feature is not None else None
+                        meme.updated_at = now
+                    Meme.objects.bulk_update(stale, [
+                        'image_hash', 'image_features', 'image_features_model',
+                        'image_features_source_hash', 'updated_at'
+                    ])
+                
+                # 只補上圖片雜湊、不需重新生成的梗圖
+                stale_ids = {meme.id for meme in stale}
+                backfilled = [meme for meme in backfilled if meme.id not in stale_ids]
+                if backfilled:
+                    Meme.objects.bulk_update(backfilled, ['image_hash'])
+        except Exception as e:
+            print(f"批次生成嵌入向量時出錯: {str(e)}")
+            failed.extend(chunk_ids)
         
-        # 獲取啟用的模型設定
-        config = ModelConfiguration.objects.filter(active=True).first()
-        if not config:
-            return
-        
-        # 生成文字嵌入向量
-        if config.nlp_model_path:
-            keywords = meme.keywords
-            embedding = get_text_embedding(keywords, model_path=config.nlp_model_path)
-            meme.embedding = embedding.tolist() if embedding is not None else None
-        
-        # 生成圖片特徵向量
-        if config.cv_model_path:
-            image_path = os.path.join(settings.MEDIA_ROOT, meme.image.name)
-            features = get_image_features(image_path, model_path=config.cv_model_path)
-            meme.image_features = features.tolist() if features is not None else None
-        
-        meme.save()
-    except Exception as e:
-        print(f"為梗圖 {meme_id} 生成嵌入向量時出錯: {str(e)}")
+        processed += len(chunk_ids)
+        if progress_callback:
+            progress_callback(processed, len(failed))
+    
+    return failed
+
+def _merge_keywords(tags, keywords):
+    """將自動生成的標籤放在既有關鍵字之前，並移除重複的關鍵字"""
+    merged = []
+    for keyword in f"{tags or ''},{keywords or ''}".split(','):
+        keyword = keyword.strip()
+        if keyword and keyword not in merged:
+            merged.append(keyword)
+    return ",".join(merged)
+
+def generate_tags_batch(meme_ids, batch_size=None, progress_callback=None, workers=None, heartbeat=None,
+                        extract_text=True):
+    """以程序池為多個梗圖自動生成標籤，並以 bulk_update 合併到關鍵字
+    
+    Args:
+        meme_ids (list): 梗圖ID列表
+        batch_size (int, optional): 每批的梗圖數量，預設為 EMBEDDING_BATCH_SIZE
+        progress_callback (callable, optional): 每批完成後呼叫，參數為 (已處理數量, 失敗數量)
+        workers (int, optional): 平行處理的程序數量，預設為 TAGGING_WORKERS
+        heartbeat (callable, optional): 每批開始時呼叫，讓工作在批次處理期間不被視為中斷
+        extract_text (bool): 是否以 OCR 辨識圖片文字，False 時只產生顏色標籤
+        
+    Returns:
+        list: 生成標籤失敗的梗圖ID列表，失敗的梗圖只記錄而不重試，仍會繼續生成嵌入向量
+    """
+    from meme_manager.models import Meme
+    from meme_manager.auto_tagging import generate_tags_for_images
+    
+    meme_ids = list(meme_ids)
+    batch_size = batch_size or EMBEDDING_BATCH_SIZE
+    
+    failed = []
+    processed = 0
+    for start in range(0, len(meme_ids), batch_size):
+        chunk_ids = meme_ids[start:start + batch_size]
+        if heartbeat:
+            heartbeat()
+        try:
+            memes = list(Meme.objects.filter(id__in=chunk_ids).only('id', 'image', 'keywords'))
+            image_paths = [os.path.join(settings.MEDIA_ROOT, meme.image.name) for meme in memes]
+            
+            now = timezone.now()
+            tagged = []
+            chunk_failed = []
+            for meme, tags in zip(memes, generate_tags_for_images(
+                image_paths, workers=workers or TAGGING_WORKERS, extract_text=extract_text
+            )):
+                if tags is None:
+                    chunk_failed.append(meme.id)
+                elif tags:
+                    meme.keywords = _merge_keywords(tags, meme.keywords)
+                    meme.updated_at = now
+                    tagged.append(meme)
+            if tagged:
+                Meme.objects.bulk_update(tagged, ['keywords', 'updated_at'])
+        except Exception as e:
+            # 單一批次出錯不影響其他批次，已寫入的標籤保留
+            print(f"批次生成標籤時出錯: {str(e)}")
+            chunk_failed = chunk_ids
+        
+        if chunk_failed:
+            print(f"無法自動生成標籤的梗圖: {', '.join(str(meme_id) for meme_id in chunk_failed)}")
+            failed.extend(chunk_failed)
+        
+        processed += len(chunk_ids)
+        if progress_callback:
+            progress_callback(processed, len(failed))
+    
+    return failed
 
-def generate_embeddings_for_all():
-    """為所有梗圖生成嵌入向量"""
+def generate_embeddings_for_all(force=False):
+    """為所有梗圖生成嵌入向量，未指定 force 時只處理內容或模型有變更的梗圖"""
     from meme_manager.models import Meme
-    memes = Meme.objects.all()
-    for meme in memes:
-        generate_embeddings(meme.id)
+    meme_ids = Meme.objects.order_by('id').values_list('id', flat=True)
+    return generate_embeddings_batch(meme_ids, force=force)
+
+def enqueue_embeddings(meme_ids, force=False, generate_tags=False, extract_text=True):
+    """建立嵌入向量生成工作，交由背景工作程序執行
+    
+    Args:
+        meme_ids (list): 梗圖ID列表
+        force (bool): 是否在內容與模型皆未變更時仍重新生成
+        generate_tags (bool): 是否在生成嵌入向量前先自動生成標籤
+        extract_text (bool): 自動生成標籤時是否以 OCR 辨識圖片文字
+        
+    Returns:
+        EmbeddingJob: 建立的工作
+    """
+    from meme_manager.models import EmbeddingJob
+    meme_ids = list(meme_ids)
+    return EmbeddingJob.objects.create(
+        meme_ids=meme_ids, total=len(meme_ids), force=force, generate_tags=generate_tags,
+        extract_text=extract_text
+    )
+
+def enqueue_embeddings_for_all(force=False):
+    """建立為所有梗圖重新生成嵌入向量的工作"""
+    from meme_manager.models import EmbeddingJob, Meme
+    return EmbeddingJob.objects.create(meme_ids=[], total=Meme.objects.count(), force=force)
+
+def claim_next_embedding_job():
+    """取出下一個可執行的工作並標記為執行中
+    
+    以條件更新確保多個工作程序同時執行時，同一個工作只會被一個程序取得。
+    
+    Returns:
+        EmbeddingJob: 取得的工作，沒有可執行的工作時返回 None
+    """
+    from meme_manager.models import EmbeddingJob
+    
+    now = timezone.now()
+    job = EmbeddingJob.objects.filter(
+        status=EmbeddingJob.STATUS_PENDING,
+        run_after__lte=now
+    ).order_by('id').first()
+    if not job:
+        return None
+    
+    claimed = EmbeddingJob.objects.filter(id=job.id, status=EmbeddingJob.STATUS_PENDING).update(
+        status=EmbeddingJob.STATUS_RUNNING,
+        attempts=F('attempts') + 1,
+        started_at=now,
+        updated_at=now
+    )
+    if not claimed:
+        return None
+    
+    job.refresh_from_db()
+    return job
+
+def requeue_stale_embedding_jobs():
+    """將長時間沒有進度的執行中工作（例如工作程序中斷）重新放回佇列
+    
+    中斷的執行視為一次失敗的嘗試（嘗試次數在取出工作時已遞增），已達最大嘗試次數的工作標記為失敗，
+    避免每次都使工作程序中斷的工作（例如處理某張圖片時記憶體不足）無限重新排入。
+    
+    Returns:
+        int: 重新排入的工作數量
+    """
+    from meme_manager.models import EmbeddingJob
+    
+    now = timezone.now()
+    deadline = now - timedelta(seconds=EMBEDDING_JOB_STALE_TIMEOUT)
+    stale_jobs = EmbeddingJob.objects.filter(status=EmbeddingJob.STATUS_RUNNING, updated_at__lt=deadline)
+    
+    requeued = 0
+    for job in stale_jobs.only('id', 'attempts', 'max_attempts'):
+        # 以條件更新避免覆寫在查詢後才送出心跳或完成的工作
+        current = EmbeddingJob.objects.filter(id=job.id, status=EmbeddingJob.STATUS_RUNNING, updated_at__lt=deadline)
+        if job.attempts >= job.max_attempts:
+            current.update(
+                status=EmbeddingJob.STATUS_FAILED,
+                error="工作程序在執行期間中斷，已達最大嘗試次數",
+                finished_at=now,
+                updated_at=now
+            )
+        else:
+            requeued += current.update(
+                status=EmbeddingJob.STATUS_PENDING,
+                run_after=now + timedelta(seconds=EMBEDDING_JOB_RETRY_DELAY * job.attempts),
+                updated_at=now
+            )
+    return requeued
+
+def run_embedding_job(job):
+    """執行嵌入向量生成工作，並記錄進度與重試
+    
+    失敗的梗圖會在延遲後以新的嘗試重新執行，超過最大嘗試次數時工作標記為失敗。
+    
+    Args:
+        job (EmbeddingJob): 已標記為執行中的工作
+    """
+    from meme_manager.models import EmbeddingJob, Meme, ModelConfiguration
+    
+    # 略過執行前已被刪除的梗圖，空列表表示所有梗圖
+    memes = Meme.objects.order_by('id')
+    if job.meme_ids:
+        memes = memes.filter(id__in=job.meme_ids)
+    meme_ids = list(memes.values_list('id', flat=True))
+    
+    job.total = len(meme_ids)
+    job.progress = 0
+    job.failed_count = 0
+    job.save(update_fields=['total', 'progress', 'failed_count', 'updated_at'])
+    
+    failed = []
+    error = ""
+    try:
+        if not ModelConfiguration.objects.filter(active=True).exists():
+            # 沒有模型設定時重試也不會成功
+            job.attempts = job.max_attempts
+            raise RuntimeError("沒有啟用的模型設定")
+        
+        def update_progress(processed, failed_count):
+            job.progress = processed
+            job.failed_count = failed_count
+            job.save(update_fields=['progress', 'failed_count', 'updated_at'])
+        
+        def heartbeat():
+            # 推論耗時較長的批次期間也更新時間，避免被其他工作程序視為中斷而重複執行
+            EmbeddingJob.objects.filter(id=job.id, status=EmbeddingJob.STATUS_RUNNING).update(updated_at=timezone.now())
+        
+        if job.generate_tags:
+            # 標籤會影響文字嵌入向量，先完成標籤再生成向量；重試時不再重複生成標籤
+            tag_failed = generate_tags_batch(
+                meme_ids, progress_callback=update_progress, heartbeat=heartbeat, extract_text=job.extract_text
+            )
+            if tag_failed:
+                print(f"工作 {job.id} 有 {len(tag_failed)} 個梗圖無法自動生成標籤")
+            job.generate_tags = False
+            job.progress = 0
+            job.failed_count = 0
+            job.save(update_fields=['generate_tags', 'progress', 'failed_count', 'updated_at'])
+        
+        failed = generate_embeddings_batch(
+            meme_ids, progress_callback=update_progress, force=job.force, heartbeat=heartbeat
+        )
+        
+        if failed:
+            error = f"{len(failed)} 個梗圖生成失敗"
+    except Exception as e:
+        error = str(e)
+        # 生成標籤階段中斷時，所有梗圖都還沒有生成嵌入向量
+        failed = meme_ids if job.generate_tags else meme_ids[job.progress:] + failed
+        print(f"執行嵌入向量工作 {job.id} 時出錯: {error}")
+    
+    job.error = error
+    if not error:
+        job.status = EmbeddingJob.STATUS_SUCCEEDED
+        job.finished_at = timezone.now()
+    elif job.attempts < job.max_attempts and failed:
+        # 只重試失敗的梗圖
+        job.status = EmbeddingJob.STATUS_PENDING
+        job.meme_ids = failed
+        job.run_after = timezone.now() + timedelta(seconds=EMBEDDING_JOB_RETRY_DELAY * job.attempts)
+    else:
+        # 沒有待重試的梗圖時不可重新排入佇列：meme_ids 為空代表處理所有梗圖
+        job.status = EmbeddingJob.STATUS_FAILED
+        job.finished_at = timezone.now()
+    job.save()
 
 def reload_models():
     """根據啟用的設定重新載入NLP和CV模型"""
+    if get_inference_client() is not None:
+        # 模型由推論服務載入，Django 程序不保留模型
+        print("使用推論服務時，變更模型設定後請重新啟動推論服務")
+        return
+    
     try:
         from models.nlp_model import load_model as load_nlp_model
         from models.cv_model import load_model as load_cv_model
@@ -1,3 +1,708 @@
-from django.test import TestCase
+import os
+import json
+import base64
+import asyncio
+import shutil
+import tempfile
+from io import BytesIO
+from datetime import timedelta
+from unittest import mock
+import numpy as np
+from PIL import Image
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
 
-# Create your tests here.
+# 匯入 tasks 以將專案根目錄加入路徑
+from meme_manager import tasks  # noqa: F401
+from models.ann_index import IVFSearchEngine, ann_index_path, attach_ann_indexes
+from models.search_engine import VectorSearchEngine
+from models.perceptual_hash import PerceptualHashIndex, dhash, hamming_distance
+from models.lexical_index import BM25Index, tokenize
+from models import similarity
+from models.inference_server import InferenceServer
+from models.vector_payload import iter_payload, payload_size, decode_payload, PAYLOAD_ALIGNMENT
+from models.cache import LRUCache
+from meme_manager import views
+from meme_manager.fields import VectorField, encode_vector, decode_vector
+from meme_manager.models import (
+    Meme, MemeCategory, DeletedMeme, EmbeddingJob, ModelConfiguration, UserInteraction
+)
+
+class VectorSearchEngineCopyTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.vectors = {meme_id: rng.normal(size=8).astype(np.float32) for meme_id in range(1, 21)}
+        self.engine = VectorSearchEngine(self.vectors.items())
+        self.rng = rng
+
+    def test_copy_shares_matrix_until_written(self):
+        original = self.engine.matrix.copy()
+        engine = self.engine.copy()
+        self.assertIs(engine.matrix, self.engine.matrix)
+
+        engine.upsert([(3, self.rng.normal(size=8))])
+        self.assertIsNot(engine.matrix, self.engine.matrix)
+        np.testing.assert_array_equal(self.engine.matrix, original)
+        self.assertEqual(engine.search(engine.matrix[2], top_k=1)[0][0], 3)
+
+        # 原索引在複製後覆寫向量也不會影響副本
+        snapshot = engine.matrix.copy()
+        second = engine.copy()
+        engine.upsert([(4, self.rng.normal(size=8))])
+        np.testing.assert_array_equal(second.matrix, snapshot)
+        self.assertFalse(np.array_equal(engine.matrix, snapshot))
+
+    def test_added_and_removed_vectors_do_not_change_original(self):
+        engine = self.engine.copy()
+        engine.upsert([(1, self.rng.normal(size=8)), (100, self.rng.normal(size=8))])
+        engine.remove([2])
+
+        self.assertEqual(self.engine.ids, list(range(1, 21)))
+        self.assertEqual(len(self.engine.matrix), 20)
+        self.assertEqual(engine.ids, [1] + list(range(3, 21)) + [100])
+        self.assertEqual(self.engine.search(self.vectors[1], top_k=1)[0][0], 1)
+        self.assertAlmostEqual(self.engine.search(self.vectors[1], top_k=1)[0][1], 1.0, places=5)
+
+class IVFSearchEngineTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.vectors = {meme_id: rng.normal(size=16).astype(np.float32) for meme_id in range(1, 201)}
+        exact = VectorSearchEngine(self.vectors.items())
+        # 檢查所有群時 IVF 的結果應與精確搜尋相同
+        self.ann = IVFSearchEngine.build(exact.ids, exact.matrix, n_lists=8, n_probe=8)
+        self.rng = rng
+
+    def assert_same_results(self, ann, exact, queries, top_k=10):
+        for query in queries:
+            expected = exact.search(query, top_k=top_k)
+            actual = ann.search(query, top_k=top_k)
+            self.assertEqual([meme_id for meme_id, _ in actual], [meme_id for meme_id, _ in expected])
+            np.testing.assert_allclose([s for _, s in actual], [s for _, s in expected], rtol=1e-5, atol=1e-5)
+
+    def test_search_matches_exact_search_when_probing_all_lists(self):
+        exact = VectorSearchEngine(self.vectors.items())
+        self.assert_same_results(self.ann, exact, self.rng.normal(size=(20, 16)))
+
+    def test_sync_with_removed_changed_and_added_memes(self):
+        vectors = dict(self.vectors)
+        del vectors[5]
+        del vectors[17]
+        vectors[42] = self.rng.normal(size=16).astype(np.float32)
+        vectors[300] = self.rng.normal(size=16).astype(np.float32)
+        exact = VectorSearchEngine(vectors.items())
+
+        ann = self.ann.copy()
+        self.assertEqual(ann.sync_with(exact), 4)
+        self.assertEqual(len(ann), len(exact))
+        self.assertEqual(sorted(ann.ids), sorted(exact.ids))
+
+        # 以變更後與新增的向量查詢時應找到對應的梗圖，已刪除的梗圖不會出現
+        self.assertEqual(ann.search(vectors[42], top_k=1)[0][0], 42)
+        self.assertEqual(ann.search(vectors[300], top_k=1)[0][0], 300)
+        self.assertNotEqual(ann.search(self.vectors[5], top_k=1)[0][0], 5)
+        self.assertNotIn(42, [meme_id for meme_id, _ in ann.search(self.vectors[42], top_k=1)])
+        self.assert_same_results(ann, exact, self.rng.normal(size=(20, 16)))
+
+        # 複製後同步不影響原索引
+        self.assertEqual(self.ann.search(self.vectors[5], top_k=1)[0][0], 5)
+
+    def test_sync_with_unchanged_engine_records_no_changes(self):
+        exact = VectorSearchEngine(self.vectors.items())
+        self.assertEqual(self.ann.copy().sync_with(exact), 0)
+
+    def test_upsert_and_remove(self):
+        ann = self.ann.copy()
+        ann.remove([1])
+        ann.upsert([(2, self.vectors[3]), (3, None)])
+        results = ann.search(self.vectors[3], top_k=200)
+        ids = [meme_id for meme_id, _ in results]
+        self.assertEqual(ids[0], 2)
+        self.assertNotIn(1, ids)
+        self.assertNotIn(3, ids)
+        self.assertEqual(len(ann), 198)
+
+    def test_attach_ann_indexes_falls_back_when_model_differs(self):
+        exact = VectorSearchEngine(self.vectors.items())
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        ann = IVFSearchEngine.build(exact.ids, exact.matrix, n_lists=8, n_probe=8, model='model-a')
+        ann.save(ann_index_path(directory, 'embedding'))
+
+        text_index, image_index = attach_ann_indexes(exact, exact, directory, models={'embedding': 'model-a'})
+        self.assertIsInstance(text_index, IVFSearchEngine)
+        self.assertIs(image_index, exact)
+
+        text_index, _ = attach_ann_indexes(exact, exact, directory, models={'embedding': 'model-b'})
+        self.assertIs(text_index, exact)
+
+    def test_recommend_memes_accepts_ivf_index(self):
+        with mock.patch('models.nlp_model.get_text_embedding', return_value=self.vectors[7]):
+            results = similarity.recommend_memes("查詢", text_index=self.ann, top_k=3, use_cache=False)
+        self.assertEqual(results[0], 7)
+
+class PerceptualHashIndexTests(SimpleTestCase):
+    def test_find_returns_every_hash_within_max_distance(self):
+        rng = np.random.default_rng(0)
+        hashes = {}
+        for meme_id in range(1, 501):
+            hashes[meme_id] = int(rng.integers(0, 2 ** 63)) | (int(rng.integers(0, 2)) << 63)
+        # 加入與前幾個雜湊只差少數位元的雜湊，涵蓋門檻內各種距離
+        for offset, distance in enumerate(range(0, 9)):
+            bits = rng.choice(64, size=distance, replace=False)
+            hashes[1000 + offset] = hashes[1 + offset] ^ sum(1 << int(bit) for bit in bits)
+
+        index = PerceptualHashIndex(hashes.items(), max_distance=6)
+        for query in list(hashes.values())[:50] + list(hashes.values())[-9:]:
+            expected = sorted(
+                (hamming_distance(query, value), meme_id)
+                for meme_id, value in hashes.items() if hamming_distance(query, value) <= 6
+            )
+            self.assertEqual(index.find(query), expected)
+            self.assertEqual(index.find(query, max_distance=2), [r for r in expected if r[0] <= 2])
+
+    def test_add_replaces_and_remove_deletes(self):
+        index = PerceptualHashIndex([(1, 0b1111), (2, 0)], max_distance=3)
+        copy = index.copy()
+        copy.add(1, 1 << 60)
+        copy.remove(2)
+
+        self.assertEqual(copy.find(0b1111), [])
+        self.assertEqual(copy.find_one(1 << 60), 1)
+        self.assertEqual(len(copy), 1)
+        # 更新副本不影響原索引
+        self.assertEqual(index.find(0), [(0, 2)])
+        self.assertEqual(index.find_one(0b0111), 1)
+
+class BM25IndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = BM25Index([
+            (1, "海綿寶寶", "海綿寶寶,派大星"),
+            (2, "派大星", "派大星,寶寶"),
+            (3, "蟹老闆", "蟹堡王,87分"),
+            (4, "spongebob", "spongebob海綿寶寶"),
+        ])
+
+    def ids(self, results):
+        return [meme_id for meme_id, _ in results]
+
+    def test_tokenize_splits_cjk_into_bigrams(self):
+        self.assertEqual(tokenize("海綿寶寶"), ["海綿", "綿寶", "寶寶"])
+        self.assertEqual(tokenize("分"), ["分"])
+        self.assertEqual(tokenize("Ｈｅｌｌｏ, World"), ["hello", "world"])
+
+    def test_tokenize_separates_mixed_script_keywords(self):
+        self.assertEqual(tokenize("87分"), ["87", "分"])
+        self.assertEqual(tokenize("spongebob海綿寶寶"), ["spongebob", "海綿", "綿寶", "寶寶"])
+        self.assertEqual(self.ids(self.index.search("分")), [3])
+        self.assertEqual(self.ids(self.index.search("87")), [3])
+        self.assertEqual(self.ids(self.index.search("spongebob")), [4])
+
+    def test_cjk_bigram_scoring(self):
+        # 標題與關鍵字都符合的梗圖詞頻較高排在最前，只符合「寶寶」一個雙字詞的梗圖排在最後
+        self.assertEqual(self.ids(self.index.search("海綿寶寶")), [1, 4, 2])
+        self.assertEqual(self.ids(self.index.search("綿寶")), [1, 4])
+        self.assertEqual(self.index.search("章魚哥"), [])
+
+    def test_exact_matches_use_normalized_keywords_and_titles(self):
+        self.assertEqual(self.index.exact_matches("派大星"), {1, 2})
+        self.assertEqual(self.index.exact_matches(" SpongeBob "), {4})
+        self.assertEqual(self.index.exact_matches("派大"), set())
+
+    def test_incremental_updates_match_rebuild(self):
+        index = self.index.copy()
+        index.upsert([(3, "蟹老闆", "錢,87分"), (5, "章魚哥", "章魚哥")])
+        index.remove([2])
+        rebuilt = BM25Index([
+            (1, "海綿寶寶", "海綿寶寶,派大星"),
+            (3, "蟹老闆", "錢,87分"),
+            (4, "spongebob", "spongebob海綿寶寶"),
+            (5, "章魚哥", "章魚哥"),
+        ])
+        for query in ["海綿寶寶", "派大星", "蟹堡王", "87分", "章魚"]:
+            self.assertEqual(index.search(query, top_k=10), rebuilt.search(query, top_k=10))
+        self.assertEqual(index.exact_matches("派大星"), {1})
+        # 更新副本不影響原索引
+        self.assertEqual(self.index.exact_matches("派大星"), {1, 2})
+
+    def test_exact_keyword_match_skips_text_model(self):
+        with mock.patch.object(similarity, 'search_by_text') as search_by_text:
+            results = similarity.find_similar_memes_by_text("派大星", [], top_k=5, lexical_index=self.index)
+        search_by_text.assert_not_called()
+        self.assertEqual(sorted(results), [(1, 1.0), (2, 1.0)])
+
+    def test_text_search_fuses_vector_and_bm25_scores(self):
+        vector_results = [(1, 0.9), (4, 0.6), (2, 0.55)]
+        with mock.patch.object(similarity, 'search_by_text', return_value=vector_results) as search_by_text:
+            results = similarity.find_similar_memes_by_text("寶寶派大星", [], top_k=3, lexical_index=self.index)
+        search_by_text.assert_called_once()
+        self.assertEqual(results, similarity.fuse_lexical_scores("寶寶派大星", vector_results, self.index, top_k=3))
+
+    def test_fuse_lexical_scores_ordering(self):
+        vector_results = [(1, 0.9), (4, 0.8), (2, 0.3)]
+        # 只比對到梗圖2的關鍵字時，BM25 分數可將其排到向量相似度較高的梗圖之前
+        fused = similarity.fuse_lexical_scores("寶寶派大星", vector_results, self.index, top_k=3, weight=0.8)
+        self.assertEqual(fused[0][0], 2)
+        # 權重為 0 時維持向量搜尋的順序
+        fused = similarity.fuse_lexical_scores("寶寶派大星", vector_results, self.index, top_k=3, weight=0)
+        self.assertEqual(self.ids(fused), [1, 4, 2])
+        # 只出現在 BM25 候選中的梗圖也會加入結果
+        fused = similarity.fuse_lexical_scores("蟹堡王", vector_results, self.index, top_k=4)
+        self.assertIn(3, self.ids(fused))
+        self.assertEqual(self.ids(fused)[0], 1)
+        # 沒有符合的詞項時直接返回向量搜尋結果
+        self.assertEqual(similarity.fuse_lexical_scores("章魚哥", vector_results, self.index, top_k=2), vector_results[:2])
+
+class InferenceServerSearchTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.vectors = {meme_id: rng.normal(size=8).astype(np.float32) for meme_id in range(1, 21)}
+        self.server = InferenceServer(nlp_model_path='nlp', max_wait=0)
+        self.server.text_index = VectorSearchEngine(self.vectors.items())
+        self.server.image_index = VectorSearchEngine()
+        self.server.hash_index = PerceptualHashIndex()
+        self.server.lexical_index = BM25Index([(1, "派大星", "派大星"), (2, "海綿寶寶", "海綿寶寶")])
+        similarity.result_cache.clear()
+        self.addCleanup(similarity.result_cache.clear)
+
+    def search(self, texts, top_k=3):
+        """在同一個服務中依序送出查詢，每次查詢後記錄文字模型被呼叫的次數"""
+        from aiohttp.test_utils import TestClient, TestServer
+
+        async def run():
+            results = []
+            async with TestClient(TestServer(self.server.create_app())) as client:
+                for text in texts:
+                    response = await client.post('/search', params={'text': text, 'top_k': top_k})
+                    results.append(((await response.json())['results'], self.embed.call_count))
+            return results
+        return asyncio.run(run())
+
+    def test_search_uses_recommend_pipeline_and_batches_only_the_encoder(self):
+        self.embed = mock.Mock(side_effect=lambda texts, **kwargs: [self.vectors[5] for _ in texts])
+        with mock.patch('models.inference_server.get_text_embeddings', self.embed):
+            (exact, exact_calls), (results, calls) = self.search(["派大星", "寶寶"])
+
+        # 查詢與關鍵字完全相同時不執行模型，其他查詢經由微批次執行一次模型
+        self.assertEqual((exact, exact_calls), ([[1, 1.0]], 0))
+        self.assertEqual(calls, 1)
+        expected = similarity.recommend_memes(
+            "寶寶", top_k=3, text_index=self.server.text_index, lexical_index=self.server.lexical_index,
+            query_embedding=self.vectors[5], use_cache=False, return_scores=True
+        )
+        self.assertEqual([tuple(result) for result in results], expected)
+
+class InteractionRetryTests(SimpleTestCase):
+    def setUp(self):
+        from discord_bot import utils as bot_utils
+        self.bot_utils = bot_utils
+        for name, value in (('INTERACTION_MAX_RETRIES', 3), ('INTERACTION_RETRY_DELAY', 0)):
+            patcher = mock.patch.object(bot_utils, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_failed_batch_is_retried_until_sent(self):
+        flush = mock.AsyncMock(side_effect=[False, False, True])
+        with mock.patch.object(self.bot_utils, 'flush_interactions', flush):
+            self.assertTrue(asyncio.run(self.bot_utils.flush_interactions_with_retry([{'user_id': '1'}])))
+        self.assertEqual(flush.await_count, 3)
+
+    def test_retries_are_bounded(self):
+        flush = mock.AsyncMock(return_value=False)
+        with mock.patch.object(self.bot_utils, 'flush_interactions', flush):
+            self.assertFalse(asyncio.run(self.bot_utils.flush_interactions_with_retry([{'user_id': '1'}])))
+        self.assertEqual(flush.await_count, 4)
+
+class VectorFieldTests(SimpleTestCase):
+    def test_encode_decode_round_trip(self):
+        vector = np.arange(6, dtype=np.float32) / 3
+        data = encode_vector(vector)
+        self.assertEqual(data[:4], b'VEC1')
+        np.testing.assert_array_equal(decode_vector(data), vector)
+        # 讀取資料庫返回的 memoryview 時不複製資料
+        self.assertFalse(decode_vector(memoryview(data)).flags.writeable)
+
+        half = decode_vector(encode_vector(vector, dtype='float16'))
+        self.assertEqual(half.dtype, np.float16)
+        np.testing.assert_allclose(half, vector, rtol=1e-3)
+
+    def test_legacy_json_values(self):
+        np.testing.assert_array_equal(decode_vector('[0.5, 1.5]'), np.array([0.5, 1.5], dtype=np.float32))
+        np.testing.assert_array_equal(decode_vector(b'[1, 2, 3]'), np.array([1, 2, 3], dtype=np.float32))
+        self.assertIsNone(decode_vector('null'))
+        self.assertIsNone(decode_vector(None))
+
+    def test_invalid_values(self):
+        with self.assertRaises(ValueError):
+            encode_vector([1.0], dtype='float64')
+        with self.assertRaises(ValueError):
+            decode_vector(b'VEC1x' + bytes(4))
+
+    def test_field_conversions(self):
+        field = VectorField(dtype='float16')
+        vector = np.array([1.0, 2.0], dtype=np.float16)
+        self.assertIs(field.to_python(vector), vector)
+        np.testing.assert_array_equal(field.to_python([1.0, 2.0]), vector)
+        np.testing.assert_array_equal(field.to_python('[1.0, 2.0]'), vector)
+        # dumpdata 輸出的 base64 字串
+        encoded = base64.b64encode(encode_vector(vector, dtype='float16')).decode('ascii')
+        np.testing.assert_array_equal(field.to_python(encoded), vector)
+        # 寫入時統一轉換為欄位設定的型態
+        prepared = field.get_prep_value(encode_vector([1.0, 2.0]))
+        self.assertEqual(decode_vector(prepared).dtype, np.float16)
+        self.assertIsNone(field.get_prep_value(None))
+        self.assertEqual(field.deconstruct()[3]['dtype'], 'float16')
+
+class VectorPayloadTests(SimpleTestCase):
+    def test_round_trip(self):
+        rng = np.random.default_rng(0)
+        text = [rng.normal(size=5).astype(np.float32) for _ in range(7)]
+        image = [rng.normal(size=3).astype(np.float32) for _ in range(2)]
+        matrices = {'embedding': (list(range(1, 8)), text), 'image_features': ([2, 5], image)}
+
+        data = b''.join(iter_payload(matrices, chunk_rows=3, sync_time='t', deleted=[9]))
+        self.assertEqual(len(data), payload_size(matrices, sync_time='t', deleted=[9]))
+
+        header, decoded = decode_payload(data)
+        self.assertEqual((header['sync_time'], header['deleted']), ('t', [9]))
+        ids, matrix = decoded['embedding']
+        self.assertEqual(ids, list(range(1, 8)))
+        np.testing.assert_array_equal(matrix, np.stack(text))
+        ids, matrix = decoded['image_features']
+        self.assertEqual(ids, [2, 5])
+        np.testing.assert_array_equal(matrix, np.stack(image))
+        # 每個矩陣都是資料中對齊的零複製檢視
+        start = np.frombuffer(data, dtype=np.uint8).ctypes.data
+        for _, matrix in decoded.values():
+            self.assertEqual((matrix.ctypes.data - start) % PAYLOAD_ALIGNMENT, 0)
+            self.assertFalse(matrix.flags.writeable)
+
+    def test_float16_and_empty_matrices(self):
+        vectors = [np.array([0.25, 0.5], dtype=np.float32)]
+        header, decoded = decode_payload(b''.join(iter_payload(
+            {'embedding': ([1], vectors), 'image_features': ([], [])}, dtype='<f2'
+        )))
+        self.assertEqual(decoded['embedding'][1].dtype, np.float16)
+        np.testing.assert_array_equal(decoded['embedding'][1], np.stack(vectors))
+        self.assertEqual(decoded['image_features'][1].shape, (0, 0))
+
+    def test_invalid_payload(self):
+        with self.assertRaises(ValueError):
+            decode_payload(b'XXXX' + bytes(60))
+
+class LRUCacheTests(SimpleTestCase):
+    def test_expired_entries_are_misses(self):
+        cache = LRUCache(maxsize=4, ttl=10)
+        with mock.patch('models.cache.time.time', return_value=1000.0):
+            cache.put('fresh', 1)
+            cache.put('old', 2, timestamp=985.0)
+            self.assertEqual(cache.get('fresh'), 1)
+            self.assertIsNone(cache.get('old'))
+            self.assertEqual([key for key, _, _ in cache.items()], ['fresh'])
+
+        with mock.patch('models.cache.time.time', return_value=1011.0):
+            self.assertEqual(cache.get('fresh', 'missing'), 'missing')
+        self.assertEqual(len(cache), 0)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = LRUCache(maxsize=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertEqual([key for key, _, _ in cache.items()], ['a', 'c'])
+
+def make_image(seed, size=(64, 64), fmt='PNG'):
+    """產生內容隨種子不同的測試圖片"""
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 256, size=(8, 8, 3), dtype=np.uint8)
+    image = Image.fromarray(pixels).resize(size, Image.BILINEAR)
+    buffer = BytesIO()
+    image.save(buffer, format=fmt)
+    return buffer.getvalue()
+
+class BatchUploadTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.category = MemeCategory.objects.create(name="測試")
+        self.client.force_login(User.objects.create_user('uploader'))
+
+    def upload(self, files, **data):
+        data = dict(category=self.category.id, **data)
+        data['images'] = [SimpleUploadedFile(name, content, content_type='image/png') for name, content in files]
+        return self.client.post(reverse('batch_upload'), data, HTTP_X_REQUESTED_WITH='XMLHttpRequest').json()
+
+    def stored_files(self):
+        memes_dir = os.path.join(self.media_root, 'memes')
+        return os.listdir(memes_dir) if os.path.isdir(memes_dir) else []
+
+    def test_stored_files_are_deleted_when_insert_fails(self):
+        with mock.patch.object(Meme.objects, 'bulk_create', side_effect=RuntimeError("insert failed")):
+            result = self.upload([('a.png', make_image(1)), ('b.png', make_image(2))])
+
+        self.assertEqual(result, {'error': "insert failed"})
+        self.assertEqual(self.stored_files(), [])
+        self.assertFalse(Meme.objects.exists())
+
+    def test_duplicates_in_batch_map_to_created_ids(self):
+        original = make_image(1)
+        resized = make_image(1, size=(96, 96))
+        self.assertLessEqual(hamming_distance(dhash(original), dhash(resized)), 6)
+
+        result = self.upload([('a.png', original), ('b.png', make_image(2)), ('a-copy.png', resized)])
+
+        a = Meme.objects.get(title='a')
+        self.assertEqual(result['processed'], 2)
+        self.assertEqual(result['duplicates'], [{'name': 'a-copy.png', 'meme_id': a.id}])
+        self.assertEqual(Meme.objects.count(), 2)
+        self.assertEqual(len(self.stored_files()), 2)
+
+        # 再次上傳時對應到既有梗圖，允許重複時照常建立
+        result = self.upload([('again.png', make_image(2, fmt='JPEG'))])
+        self.assertEqual(result['duplicates'], [{'name': 'again.png', 'meme_id': Meme.objects.get(title='b').id}])
+        result = self.upload([('again.png', make_image(2, fmt='JPEG'))], allow_duplicates='on')
+        self.assertEqual((result['processed'], result['duplicates']), (1, []))
+
+    def test_extract_text_option_reaches_tagging(self):
+        self.upload([('a.png', make_image(1))], auto_generate_tags='on')
+        self.upload([('b.png', make_image(2))], auto_generate_tags='on', extract_text='on')
+        jobs = list(EmbeddingJob.objects.order_by('id'))
+        self.assertEqual([(job.generate_tags, job.extract_text) for job in jobs], [(True, False), (True, True)])
+
+        ModelConfiguration.objects.create(name="測試", active=True)
+        with mock.patch.object(tasks, 'generate_tags_batch', return_value=[]) as generate_tags, \
+                mock.patch.object(tasks, 'generate_embeddings_batch', return_value=[]):
+            tasks.run_embedding_job(tasks.claim_next_embedding_job())
+        self.assertFalse(generate_tags.call_args.kwargs['extract_text'])
+
+class GenerateTagsBatchTests(TestCase):
+    def setUp(self):
+        category = MemeCategory.objects.create(name="測試")
+        self.memes = Meme.objects.bulk_create([
+            Meme(title=f"梗圖{i}", image=f"memes/{i}.png", category=category, keywords="原有")
+            for i in range(4)
+        ])
+        self.ids = [meme.id for meme in self.memes]
+
+    def test_failed_chunks_and_images_are_logged_and_skipped(self):
+        def fake_generate(image_paths, workers=None, extract_text=True):
+            if any(path.endswith('2.png') for path in image_paths):
+                raise RuntimeError("程序池中斷")
+            return ["標籤" if path.endswith('0.png') else None for path in image_paths]
+
+        with mock.patch('meme_manager.auto_tagging.generate_tags_for_images', side_effect=fake_generate):
+            failed = tasks.generate_tags_batch(self.ids, batch_size=2)
+
+        self.assertEqual(failed, self.ids[1:])
+        self.assertEqual(Meme.objects.get(id=self.ids[0]).keywords, "標籤,原有")
+        self.assertEqual(Meme.objects.get(id=self.ids[1]).keywords, "原有")
+
+    def test_broken_process_pool_is_reset(self):
+        from concurrent.futures.process import BrokenProcessPool
+        from meme_manager import auto_tagging
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'a.png')
+        with open(path, 'wb') as f:
+            f.write(make_image(1))
+
+        executor = mock.Mock()
+        executor.submit.side_effect = BrokenProcessPool("子程序異常結束")
+        with mock.patch.object(auto_tagging, 'get_tagging_executor', return_value=executor), \
+                mock.patch.object(auto_tagging, 'get_cached_tags', return_value=None), \
+                mock.patch.object(auto_tagging, 'shutdown_tagging_executor') as shutdown:
+            self.assertEqual(auto_tagging.generate_tags_for_images([path]), [None])
+        shutdown.assert_called_once()
+
+class MemeSyncApiTests(TestCase):
+    def setUp(self):
+        self.category = MemeCategory.objects.create(name="測試")
+        rng = np.random.default_rng(0)
+        self.memes = Meme.objects.bulk_create([
+            Meme(title=f"梗圖{i}", image=f"memes/{i}.png", category=self.category, keywords=f"關鍵字{i}",
+                 embedding=rng.normal(size=4).astype(np.float32),
+                 image_features=rng.normal(size=3).astype(np.float32))
+            for i in range(3)
+        ])
+
+    def get_memes(self, etag=None, **params):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(reverse('api_get_memes'), {'fields': 'id,keywords', **params}, **headers)
+
+    def get_vectors(self, **params):
+        response = self.client.get(reverse('api_export_vectors'), params)
+        self.assertEqual(response.status_code, 200)
+        return decode_payload(b''.join(response.streaming_content))
+
+    def test_vector_field_stores_binary_and_reads_legacy_json(self):
+        meme = Meme.objects.get(id=self.memes[0].id)
+        self.assertIsInstance(meme.embedding, np.ndarray)
+        np.testing.assert_array_equal(meme.embedding, self.memes[0].embedding)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"UPDATE {Meme._meta.db_table} SET embedding = %s WHERE id = %s",
+                           [b'[1.0, 2.0]', meme.id])
+        np.testing.assert_array_equal(Meme.objects.get(id=meme.id).embedding, [1.0, 2.0])
+
+    def test_unchanged_catalog_returns_not_modified(self):
+        response = self.get_memes()
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data['memes']), 3)
+        self.assertFalse(data['delta'])
+
+        etag = response['ETag']
+        self.assertEqual(self.get_memes(etag).status_code, 304)
+        # ETag 不受 updated_since 影響，增量同步時目錄沒有變動同樣返回 304
+        self.assertEqual(self.get_memes(etag, updated_since=data['sync_time']).status_code, 304)
+        # 其他參數不同時為不同的回應
+        self.assertEqual(self.get_memes(etag, category=self.category.id).status_code, 200)
+
+    def test_delta_sync_returns_changes_and_tombstones(self):
+        first = self.get_memes()
+        sync_time = first.json()['sync_time']
+
+        changed, deleted = self.memes[0], self.memes[1]
+        Meme.objects.filter(id=changed.id).update(keywords="新關鍵字", updated_at=timezone.now())
+        Meme.objects.get(id=deleted.id).delete()
+        self.assertTrue(DeletedMeme.objects.filter(meme_id=deleted.id).exists())
+
+        response = self.get_memes(first['ETag'], updated_since=sync_time)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        data = response.json()
+        self.assertTrue(data['delta'])
+        self.assertEqual(data['memes'], [{'id': changed.id, 'keywords': "新關鍵字"}])
+        self.assertEqual(data['deleted'], [deleted.id])
+
+        # 串流輸出與一般輸出相同
+        streamed = self.get_memes(updated_since=sync_time, stream='1')
+        self.assertEqual(json.loads(b''.join(streamed.streaming_content))['memes'], data['memes'])
+
+        # 向量匯出使用相同的同步區間
+        header, matrices = self.get_vectors(updated_since=sync_time)
+        self.assertEqual((header['delta'], header['deleted']), (True, [deleted.id]))
+        ids, matrix = matrices['embedding']
+        self.assertEqual(ids, [changed.id])
+        np.testing.assert_array_equal(matrix[0], changed.embedding)
+
+    def test_full_vector_export(self):
+        ModelConfiguration.objects.create(name="測試", nlp_model_path="nlp", active=True)
+        header, matrices = self.get_vectors(dtype='float16')
+        self.assertEqual(header['models']['embedding'], "nlp")
+        ids, matrix = matrices['image_features']
+        self.assertEqual(ids, [meme.id for meme in self.memes])
+        self.assertEqual(matrix.dtype, np.float16)
+        np.testing.assert_allclose(matrix, np.stack([meme.image_features for meme in self.memes]), rtol=1e-3)
+
+    def test_invalid_updated_since(self):
+        self.assertEqual(self.get_memes(updated_since="昨天").status_code, 400)
+
+class InteractionsBulkApiTests(TestCase):
+    def post(self, body):
+        if not isinstance(body, str):
+            body = json.dumps(body)
+        return self.client.post(reverse('api_record_interactions_bulk'), body, content_type='application/json')
+
+    def test_invalid_requests_are_rejected(self):
+        self.assertEqual(self.client.get(reverse('api_record_interactions_bulk')).json()['status'], 'error')
+        self.assertEqual(self.post("{").status_code, 400)
+        self.assertEqual(self.post({'interactions': {'user_id': '1'}}).status_code, 400)
+        self.assertEqual(self.post({'interactions': [{'user_id': '1'}, "2"]}).status_code, 400)
+        with mock.patch.object(views, 'API_MAX_INTERACTIONS_PER_REQUEST', 2):
+            response = self.post({'interactions': [{'user_id': str(i)} for i in range(3)]})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UserInteraction.objects.exists())
+
+    def test_interactions_are_created_in_bulk(self):
+        category = MemeCategory.objects.create(name="測試")
+        meme = Meme.objects.bulk_create([Meme(title="梗圖", image="memes/a.png", category=category, keywords="")])[0]
+
+        response = self.post({'interactions': [
+            {'user_id': 1, 'input_text': "派大星", 'recommended_meme_id': meme.id},
+            {'user_id': '2', 'input_image': True, 'recommended_meme_id': meme.id + 100},
+            {'user_id': '3', 'recommended_meme_id': "abc"},
+        ]})
+
+        self.assertEqual(response.json(), {'status': 'success', 'created': 3})
+        interactions = list(UserInteraction.objects.order_by('user_id'))
+        self.assertEqual([i.user_id for i in interactions], ['1', '2', '3'])
+        self.assertEqual([i.recommended_meme_id for i in interactions], [meme.id, None, None])
+        self.assertEqual([i.input_image for i in interactions], [False, True, False])
+
+class EmbeddingJobQueueTests(TestCase):
+    def setUp(self):
+        category = MemeCategory.objects.create(name="測試")
+        self.ids = [meme.id for meme in Meme.objects.bulk_create([
+            Meme(title=f"梗圖{i}", image=f"memes/{i}.png", category=category, keywords="")
+            for i in range(3)
+        ])]
+        ModelConfiguration.objects.create(name="測試", active=True)
+
+    def claim(self):
+        # 讓等待重試的工作立即可執行
+        EmbeddingJob.objects.filter(status=EmbeddingJob.STATUS_PENDING).update(run_after=timezone.now())
+        return tasks.claim_next_embedding_job()
+
+    def test_claim_skips_jobs_that_are_not_ready(self):
+        later = EmbeddingJob.objects.create(meme_ids=self.ids, run_after=timezone.now() + timedelta(hours=1))
+        ready = tasks.enqueue_embeddings(self.ids)
+
+        job = tasks.claim_next_embedding_job()
+        self.assertEqual((job.id, job.status, job.attempts), (ready.id, EmbeddingJob.STATUS_RUNNING, 1))
+        self.assertIsNone(tasks.claim_next_embedding_job())
+        self.assertEqual(EmbeddingJob.objects.get(id=later.id).status, EmbeddingJob.STATUS_PENDING)
+
+    def test_failed_memes_are_retried_until_max_attempts(self):
+        job = tasks.enqueue_embeddings(self.ids)
+        with mock.patch.object(tasks, 'generate_embeddings_batch', return_value=[self.ids[1]]) as generate:
+            tasks.run_embedding_job(tasks.claim_next_embedding_job())
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.meme_ids), (EmbeddingJob.STATUS_PENDING, [self.ids[1]]))
+            self.assertGreater(job.run_after, timezone.now())
+            self.assertIsNone(tasks.claim_next_embedding_job())
+
+            for _ in range(job.max_attempts - 1):
+                tasks.run_embedding_job(self.claim())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (EmbeddingJob.STATUS_FAILED, job.max_attempts))
+        self.assertEqual(job.error, "1 個梗圖生成失敗")
+        self.assertEqual(generate.call_args.args[0], [self.ids[1]])
+
+    def test_job_without_failed_memes_is_not_requeued(self):
+        # meme_ids 為空代表所有梗圖，失敗時沒有可重試的梗圖就不可重新排入
+        Meme.objects.all().delete()
+        job = tasks.enqueue_embeddings_for_all()
+        with mock.patch.object(tasks, 'generate_embeddings_batch', side_effect=RuntimeError("模型載入失敗")):
+            tasks.run_embedding_job(tasks.claim_next_embedding_job())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.meme_ids, job.error), (EmbeddingJob.STATUS_FAILED, [], "模型載入失敗"))
+
+    def test_stale_running_jobs(self):
+        now = timezone.now()
+        stale = now - timedelta(seconds=tasks.EMBEDDING_JOB_STALE_TIMEOUT + 60)
+        retry = EmbeddingJob.objects.create(meme_ids=self.ids, status=EmbeddingJob.STATUS_RUNNING, attempts=1)
+        exhausted = EmbeddingJob.objects.create(meme_ids=self.ids, status=EmbeddingJob.STATUS_RUNNING, attempts=3)
+        active = EmbeddingJob.objects.create(meme_ids=self.ids, status=EmbeddingJob.STATUS_RUNNING, attempts=1)
+        EmbeddingJob.objects.filter(id__in=[retry.id, exhausted.id]).update(updated_at=stale)
+
+        self.assertEqual(tasks.requeue_stale_embedding_jobs(), 1)
+
+        retry.refresh_from_db()
+        self.assertEqual((retry.status, retry.attempts), (EmbeddingJob.STATUS_PENDING, 1))
+        self.assertGreater(retry.run_after, now)
+        exhausted.refresh_from_db()
+        self.assertEqual(exhausted.status, EmbeddingJob.STATUS_FAILED)
+        self.assertIsNotNone(exhausted.finished_at)
+        active.refresh_from_db()
+        self.assertEqual(active.status, EmbeddingJob.STATUS_RUNNING)
@@ -17,7 +17,10 @@ urlpatterns = [
     path('models/', views.model_configuration, name='model_configuration'),
     path('models/activate/<int:config_id>/', views.activate_config, name='activate_config'),
     path('embeddings/regenerate/', views.regenerate_all_embeddings, name='regenerate_all_embeddings'),
+    path('embeddings/jobs/<int:job_id>/', views.embedding_job_status, name='embedding_job_status'),
     path('interactions/', views.interaction_history, name='interaction_history'),
     path('api/memes/', views.api_get_memes, name='api_get_memes'),
+    path('api/memes/vectors/', views.api_export_vectors, name='api_export_vectors'),
     path('api/interactions/', views.api_record_interaction, name='api_record_interaction'),
+    path('api/interactions/bulk/', views.api_record_interactions_bulk, name='api_record_interactions_bulk'),
 ]
\ No newline at end of file
@@ -1,31 +1,40 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils.translation import gettext_lazy as _
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import condition
+import hashlib
 import json
-from .models import MemeCategory, Meme, UserInteraction, ModelConfiguration
+from .models import MemeCategory, Meme, UserInteraction, ModelConfiguration, DeletedMeme, EmbeddingJob
 from .forms import MemeCategoryForm, MemeForm, ModelConfigurationForm
-from .tasks import generate_embeddings, generate_embeddings_for_all, reload_models
+from .tasks import enqueue_embeddings, enqueue_embeddings_for_all, reload_models
+from .hashing import hash_uploaded_file, perceptual_hash_file, build_perceptual_hash_index
+from models.perceptual_hash import DEFAULT_DUPLICATE_DISTANCE, parse_hash
+from models.vector_payload import PAYLOAD_CONTENT_TYPE, iter_payload, payload_size
 from django.views.decorators.csrf import csrf_exempt
 import uuid
-from .auto_tagging import generate_tags_for_image
 from .forms import BatchUploadForm
 from django.conf import settings
 from django.core.files.storage import default_storage
 import os
-from django.core.files.base import ContentFile
 import re
 @login_required
 def dashboard(request):
     total_memes = Meme.objects.count()
     total_categories = MemeCategory.objects.count()
     recent_interactions = UserInteraction.objects.order_by('-interaction_time')[:10]
+    recent_jobs = EmbeddingJob.objects.order_by('-created_at')[:5]
     
     context = {
         'total_memes': total_memes,
         'total_categories': total_categories,
         'recent_interactions': recent_interactions,
+        'recent_jobs': recent_jobs,
     }
     
     return render(request, 'meme_manager/dashboard.html', context)
@@ -57,7 +66,7 @@ def add_meme(request):
             messages.success(request, _("梗圖已成功新增。"))
             
             # 在背景產生嵌入向量
-            generate_embeddings(meme.id)
+            enqueue_embeddings([meme.id])
             
             # 清除API快取
             clear_bot_cache()
@@ -83,9 +92,9 @@ def edit_meme(request, meme_id):
             meme = form.save()
             messages.success(request, _("梗圖已成功更新。"))
             
-            # 如需要重新產生嵌入向量
+            # 如需要重新產生嵌入向量（內容雜湊未變更時工作程序會略過）
             if 'keywords' in form.changed_data or 'image' in form.changed_data:
-                generate_embeddings(meme.id)
+                enqueue_embeddings([meme.id])
                 
             # 清除API快取
             clear_bot_cache()
@@ -235,12 +244,35 @@ def activate_config(request, config_id):
 @login_required
 def regenerate_all_embeddings(request):
     if request.method == 'POST':
-        # 啟動重新產生嵌入向量的任務
-        generate_embeddings_for_all()
-        messages.success(request, _("所有梗圖的嵌入向量重新生成任務已啟動。"))
+        # 將重新產生嵌入向量的工作加入背景佇列，未勾選強制時只處理內容或模型有變更的梗圖
+        enqueue_embeddings_for_all(force=request.POST.get('force') == 'on')
+        messages.success(request, _("所有梗圖的嵌入向量重新生成任務已加入背景佇列。"))
     
     return redirect('dashboard')
 
+@login_required
+def embedding_job_status(request, job_id):
+    """查詢嵌入向量工作進度的端點，供頁面輪詢"""
+    job = get_object_or_404(EmbeddingJob, id=job_id)
+    
+    status_display = str(job.get_status_display())
+    if job.status == EmbeddingJob.STATUS_RUNNING and job.stage == 'tagging':
+        status_display += f"（{_('生成標籤')}）"
+    
+    return JsonResponse({
+        'id': job.id,
+        'status': job.status,
+        'status_display': status_display,
+        'stage': job.stage,
+        'progress': job.progress,
+        'total': job.total,
+        'percent': job.percent,
+        'failed': job.failed_count,
+        'attempts': job.attempts,
+        'error': job.error,
+        'done': job.status in (EmbeddingJob.STATUS_SUCCEEDED, EmbeddingJob.STATUS_FAILED),
+    })
+
 @login_required
 def interaction_history(request):
     interactions = UserInteraction.objects.all().order_by('-interaction_time')
@@ -251,26 +283,238 @@ def interaction_history(request):
     
     return render(request, 'meme_manager/interaction_history.html', context)
 
-def api_get_memes(request):
-    """Discord機器人獲取梗圖的API端點"""
+# /api/memes/ 可透過 fields 參數選擇的欄位，以及各欄位需要從資料庫讀取的模型欄位
+API_MEME_FIELDS = {
+    'id': ('id',),
+    'title': ('title',),
+    'image_url': ('image',),
+    'category': ('category', 'category__name'),
+    'keywords': ('keywords',),
+    'image_hash': ('image_hash',),
+    'perceptual_hash': ('perceptual_hash',),
+    'embedding': ('embedding',),
+    'image_features': ('image_features',),
+}
+API_MAX_PAGE_SIZE = 1000
+API_STREAM_CHUNK_SIZE = 500
+API_MAX_INTERACTIONS_PER_REQUEST = 1000
+
+def _memes_etag(request):
+    """根據梗圖目錄的狀態計算 ETag
+    
+    ETag 只反映目錄內容（梗圖數量、最後更新時間、最後一筆刪除記錄）與除了 updated_since
+    以外的查詢參數，因此客戶端帶上次取得的 ETag 做增量同步時，
+    若目錄沒有任何變動即可直接得到 304。
+    """
+    stats = Meme.objects.aggregate(count=Count('id'), last_updated=Max('updated_at'))
+    last_deleted = DeletedMeme.objects.aggregate(last=Max('id'))['last']
+    params = sorted((key, value) for key, value in request.GET.items() if key != 'updated_since')
+    state = f"{stats['count']}:{stats['last_updated']}:{last_deleted}:{params}"
+    return hashlib.md5(state.encode('utf-8')).hexdigest()
+
+def _filter_memes_for_sync(request):
+    """依查詢參數篩選梗圖，供梗圖列表與向量匯出共用
+    
+    支援 category（類別ID或名稱）、ids（逗號分隔的梗圖ID）與 updated_since（ISO 8601）。
+    
+    Returns:
+        tuple: (梗圖查詢集, 已刪除梗圖ID列表) 元組
+        
+    Raises:
+        ValueError: 參數格式錯誤
+    """
     category_id = request.GET.get('category')
+    ids = request.GET.get('ids')
+    updated_since = request.GET.get('updated_since')
     
+    memes = Meme.objects.all()
     if category_id:
-        memes = Meme.objects.filter(category_id=category_id)
+        if category_id.isdigit():
+            memes = memes.filter(category_id=category_id)
+        else:
+            memes = memes.filter(category__name=category_id)
+    if ids:
+        try:
+            memes = memes.filter(id__in=[int(meme_id) for meme_id in ids.split(',') if meme_id.strip()])
+        except ValueError:
+            raise ValueError('Invalid ids')
+    
+    deleted = []
+    if updated_since:
+        since = parse_datetime(updated_since)
+        if since is None:
+            raise ValueError('Invalid updated_since')
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        
+        memes = memes.filter(updated_at__gte=since)
+        deleted = list(DeletedMeme.objects.filter(deleted_at__gte=since).values_list('meme_id', flat=True))
+    
+    return memes, deleted
+
+def _vector_to_list(vector):
+    """將二進位向量欄位轉換為 JSON 可序列化的列表"""
+    return vector.tolist() if vector is not None else None
+
+def _serialize_meme(request, meme, fields):
+    """將梗圖轉換為API回應的字典，只包含指定的欄位"""
+    values = {
+        'id': lambda: meme.id,
+        'title': lambda: meme.title,
+        'image_url': lambda: request.build_absolute_uri(meme.image.url),
+        'category': lambda: meme.category.name,
+        'keywords': lambda: meme.keywords,
+        'image_hash': lambda: meme.image_hash,
+        'perceptual_hash': lambda: meme.perceptual_hash,
+        'embedding': lambda: _vector_to_list(meme.embedding),
+        'image_features': lambda: _vector_to_list(meme.image_features),
+    }
+    return {field: values[field]() for field in fields}
+
+def _parse_positive_int(value, name):
+    """解析正整數查詢參數，未提供時返回 None"""
+    if not value:
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f'Invalid {name}')
+    if number <= 0:
+        raise ValueError(f'Invalid {name}')
+    return number
+
+def _stream_memes_json(request, memes, fields, limit, metadata):
+    """逐筆輸出梗圖列表的 JSON，不在記憶體中建立完整列表"""
+    yield '{"memes": ['
+    
+    count = 0
+    last_id = None
+    has_more = False
+    rows = memes[:limit + 1] if limit else memes
+    for meme in rows.iterator(chunk_size=API_STREAM_CHUNK_SIZE):
+        if limit and count == limit:
+            has_more = True
+            break
+        yield (', ' if count else '') + json.dumps(_serialize_meme(request, meme, fields))
+        last_id = meme.id
+        count += 1
+    
+    metadata['next_cursor'] = last_id if has_more else None
+    # 將其餘欄位接在梗圖列表之後
+    yield '], ' + json.dumps(metadata)[1:]
+
+@condition(etag_func=_memes_etag)
+def api_get_memes(request):
+    """Discord機器人獲取梗圖的API端點
+    
+    支援 If-None-Match 條件請求；帶入 updated_since (ISO 8601) 時只返回該時間之後
+    新增或更新的梗圖，並在 deleted 中列出期間被刪除的梗圖ID。
+    客戶端應以回應中的 sync_time 作為下一次的 updated_since。
+    
+    其他參數：
+        fields: 逗號分隔的欄位，例如不需要向量時省略 embedding 與 image_features
+        limit / cursor: 以梗圖ID為游標分頁，回應中的 next_cursor 為下一頁的 cursor
+        stream: 設為 1 時以串流方式逐筆輸出，資料庫以 iterator() 分批讀取
+    """
+    fields = list(API_MEME_FIELDS)
+    if request.GET.get('fields'):
+        fields = [field for field in request.GET['fields'].split(',') if field in API_MEME_FIELDS]
+    
+    # 在查詢之前記錄同步時間，避免遺漏查詢期間的變更
+    sync_time = timezone.now()
+    
+    try:
+        memes, deleted = _filter_memes_for_sync(request)
+        cursor = _parse_positive_int(request.GET.get('cursor'), 'cursor')
+        limit = _parse_positive_int(request.GET.get('limit'), 'limit')
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    
+    if limit:
+        limit = min(limit, API_MAX_PAGE_SIZE)
+    
+    # 只讀取需要的欄位，類別名稱以 JOIN 一次取得
+    model_fields = {'id'}
+    for field in fields:
+        model_fields.update(API_MEME_FIELDS[field])
+    if 'category' in fields:
+        memes = memes.select_related('category')
+    memes = memes.only(*model_fields).order_by('id')
+    if cursor:
+        memes = memes.filter(id__gt=cursor)
+    
+    metadata = {
+        'deleted': deleted,
+        'delta': bool(request.GET.get('updated_since')),
+        'sync_time': sync_time.isoformat(),
+    }
+    
+    if request.GET.get('stream') == '1':
+        return StreamingHttpResponse(
+            _stream_memes_json(request, memes, fields, limit, metadata),
+            content_type='application/json'
+        )
+    
+    next_cursor = None
+    if limit:
+        rows = list(memes[:limit + 1])
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = rows[-1].id
     else:
-        memes = Meme.objects.all()
-    
-    data = [{
-        'id': meme.id,
-        'title': meme.title,
-        'image_url': request.build_absolute_uri(meme.image.url),
-        'category': meme.category.name,
-        'keywords': meme.keywords,
-        'embedding': meme.embedding,
-        'image_features': meme.image_features
-    } for meme in memes]
-    
-    return JsonResponse({'memes': data})
+        rows = memes.iterator(chunk_size=API_STREAM_CHUNK_SIZE)
+    
+    data = [_serialize_meme(request, meme, fields) for meme in rows]
+    
+    return JsonResponse({'memes': data, **metadata, 'next_cursor': next_cursor})
+
+@condition(etag_func=_memes_etag)
+def api_export_vectors(request):
+    """以二進位格式匯出梗圖向量的API端點
+    
+    回應為 models.vector_payload 格式：標頭記錄各矩陣的梗圖ID與形狀，之後是連續的
+    embedding 與 image_features 矩陣，客戶端可用 np.frombuffer 零複製讀取。
+    篩選參數與 /api/memes/ 相同，另可用 dtype=float16 減少傳輸量。
+    維度與第一筆不同的向量（例如切換模型後尚未重新生成）不會被匯出。
+    """
+    dtype = '<f2' if request.GET.get('dtype') == 'float16' else '<f4'
+    sync_time = timezone.now()
+    
+    try:
+        memes, deleted = _filter_memes_for_sync(request)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    
+    matrices = {'embedding': ([], []), 'image_features': ([], [])}
+    rows = memes.order_by('id').only('id', 'embedding', 'image_features')
+    for meme in rows.iterator(chunk_size=500):
+        for name, (ids, vectors) in matrices.items():
+            vector = getattr(meme, name)
+            if vector is None or vector.size == 0:
+                continue
+            if vectors and vector.size != vectors[0].size:
+                continue
+            ids.append(meme.id)
+            vectors.append(vector)
+    
+    # 記錄產生向量的模型，客戶端可據此確認離線建立的 ANN 索引是否仍適用
+    config = ModelConfiguration.objects.filter(active=True).first()
+    metadata = {
+        'deleted': deleted,
+        'delta': bool(request.GET.get('updated_since')),
+        'sync_time': sync_time.isoformat(),
+        'models': {
+            'embedding': config.nlp_model_path if config else None,
+            'image_features': config.cv_model_path if config else None,
+        },
+    }
+    response = StreamingHttpResponse(
+        iter_payload(matrices, dtype=dtype, **metadata),
+        content_type=PAYLOAD_CONTENT_TYPE
+    )
+    response['Content-Length'] = payload_size(matrices, dtype=dtype, **metadata)
+    return response
+
 @csrf_exempt
 def api_record_interaction(request):
     """Discord機器人記錄使用者互動的API端點"""
@@ -303,6 +547,55 @@ def api_record_interaction(request):
             return JsonResponse({'status': 'error', 'message': str(e)})
     
     return JsonResponse({'status': 'error', 'message': 'Invalid request method'})
+
+def _parse_meme_id(value):
+    """解析互動記錄中的梗圖ID，無效時返回 None"""
+    try:
+        return int(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+@csrf_exempt
+def api_record_interactions_bulk(request):
+    """Discord機器人批次記錄使用者互動的API端點
+    
+    請求主體為 {"interactions": [{"user_id", "input_text", "input_image", "recommended_meme_id"}, ...]}，
+    以一次查詢確認梗圖是否存在，再以 bulk_create 一次寫入。
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Invalid request method'})
+    
+    try:
+        data = json.loads(request.body)
+        items = data.get('interactions')
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise ValueError('Invalid interactions')
+        if len(items) > API_MAX_INTERACTIONS_PER_REQUEST:
+            raise ValueError(f'Too many interactions (max {API_MAX_INTERACTIONS_PER_REQUEST})')
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    
+    try:
+        meme_ids = {_parse_meme_id(item.get('recommended_meme_id')) for item in items}
+        meme_ids.discard(None)
+        existing_ids = set(Meme.objects.filter(id__in=meme_ids).values_list('id', flat=True))
+        
+        interactions = []
+        for item in items:
+            meme_id = _parse_meme_id(item.get('recommended_meme_id'))
+            interactions.append(UserInteraction(
+                user_id=str(item.get('user_id', '')),
+                input_text=item.get('input_text'),
+                input_image=bool(item.get('input_image', False)),
+                # 已刪除的梗圖不建立關聯
+                recommended_meme_id=meme_id if meme_id in existing_ids else None
+            ))
+        
+        UserInteraction.objects.bulk_create(interactions)
+        return JsonResponse({'status': 'success', 'created': len(interactions)})
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)})
+
 def extract_tags_from_filename(filename):
     """從檔名中提取標籤，格式為【SS0008】後面的文字"""
     # 移除副檔名
@@ -337,72 +630,92 @@ def batch_upload(request):
             auto_generate_tags = request.POST.get('auto_generate_tags') == 'true' or request.POST.get('auto_generate_tags') == 'on'
             extract_text = request.POST.get('extract_text') == 'true' or request.POST.get('extract_text') == 'on'
             extract_filename_tags = request.POST.get('extract_filename_tags') == 'true' or request.POST.get('extract_filename_tags') == 'on'
+            allow_duplicates = request.POST.get('allow_duplicates') == 'true' or request.POST.get('allow_duplicates') == 'on'
             
             images = request.FILES.getlist('images')
             total = len(images)
             processed = 0
             failed = 0
+            memes = []
+            duplicates = []
+            
+            # 以感知雜湊找出與既有梗圖或同批次圖片重複（重新編碼、縮放）的圖片並略過
+            duplicate_index = None
+            if not allow_duplicates:
+                duplicate_index = build_perceptual_hash_index(
+                    getattr(settings, 'DUPLICATE_HASH_DISTANCE', DEFAULT_DUPLICATE_DISTANCE)
+                )
             
+            # 逐塊寫入上傳檔案，自動生成標籤與嵌入向量交由背景工作程序平行處理，
+            # 上傳大量圖片時請求不必等待模型執行
             for image in images:
                 try:
                     # 生成唯一檔名
                     file_ext = os.path.splitext(image.name)[1].lower()
                     unique_filename = f"{uuid.uuid4().hex}{file_ext}"
                     
-                    # 儲存到臨時路徑進行處理
-                    temp_path = default_storage.save(f"temp/{unique_filename}", ContentFile(image.read()))
-                    temp_full_path = os.path.join(settings.MEDIA_ROOT, temp_path)
+                    # bulk_create 不會呼叫 save()，先計算圖片雜湊
+                    image_hash = hash_uploaded_file(image)
+                    perceptual_hash = perceptual_hash_file(image)
                     
-                    # 自動生成標籤（如果啟用）
-                    keywords = ""
-                    if auto_generate_tags:
-                        try:
-                            keywords = generate_tags_for_image(temp_full_path)
-                        except Exception as e:
-                            print(f"自動生成標籤時出錯: {str(e)}")
+                    if duplicate_index is not None and perceptual_hash:
+                        duplicate_of = duplicate_index.find_one(parse_hash(perceptual_hash))
+                        if duplicate_of is not None:
+                            duplicates.append((image.name, duplicate_of))
+                            continue
+                    
+                    file_path = default_storage.save(f"memes/{unique_filename}", image)
                     
                     # 從檔名提取標籤（如果啟用）
+                    keywords = ""
                     if extract_filename_tags:
                         try:
-                            filename_tags = extract_tags_from_filename(image.name)
-                            if filename_tags:
-                                if keywords:
-                                    keywords += "," + filename_tags
-                                else:
-                                    keywords = filename_tags
+                            keywords = extract_tags_from_filename(image.name)
                         except Exception as e:
                             print(f"從檔名提取標籤時出錯: {str(e)}")
                     
-                    # 生成檔案存放路徑
-                    file_path = f"memes/{unique_filename}"
-                    final_path = os.path.join(settings.MEDIA_ROOT, file_path)
-                    
-                    # 確保目錄存在
-                    os.makedirs(os.path.dirname(final_path), exist_ok=True)
-                    
-                    # 移動檔案到最終位置
-                    os.rename(temp_full_path, final_path)
-                    
                     # 從檔名猜測標題（移除副檔名和特殊字元）
                     title = os.path.splitext(image.name)[0].replace('_', ' ').replace('-', ' ')
                     
-                    # 創建梗圖記錄
-                    meme = Meme.objects.create(
+                    memes.append(Meme(
                         title=title,
                         image=file_path,
                         category=category,
-                        keywords=keywords
-                    )
-                    
-                    # 在背景產生嵌入向量
-                    generate_embeddings(meme.id)
-                    
+                        keywords=keywords,
+                        image_hash=image_hash,
+                        perceptual_hash=perceptual_hash
+                    ))
                     processed += 1
                     
+                    if duplicate_index is not None and perceptual_hash:
+                        # 同一批次的圖片尚未有ID，以負數暫時編號加入索引
+                        duplicate_index.add(-len(memes), parse_hash(perceptual_hash))
+                    
                 except Exception as e:
                     print(f"處理圖片 {image.name} 時出錯: {str(e)}")
                     failed += 1
             
+            # 批次建立梗圖記錄，失敗時刪除已寫入的檔案以免留下沒有記錄的圖片
+            try:
+                Meme.objects.bulk_create(memes, batch_size=getattr(settings, 'BATCH_UPLOAD_CREATE_BATCH_SIZE', 500))
+            except Exception:
+                for meme in memes:
+                    try:
+                        default_storage.delete(meme.image.name)
+                    except Exception as e:
+                        print(f"刪除上傳檔案 {meme.image.name} 時出錯: {str(e)}")
+                raise
+            created_ids = [meme.id for meme in memes]
+            duplicates = [
+                {'name': name, 'meme_id': meme_id if meme_id > 0 else created_ids[-meme_id - 1]}
+                for name, meme_id in duplicates
+            ]
+            
+            # 在背景自動生成標籤（如果啟用）並產生嵌入向量
+            job = enqueue_embeddings(
+                created_ids, generate_tags=auto_generate_tags, extract_text=extract_text
+            ) if created_ids else None
+            
             # 清除API快取
             clear_bot_cache()
             
@@ -413,6 +726,9 @@ def batch_upload(request):
                     'success': True,
                     'processed': processed,
                     'failed': failed,
+                    'duplicates': duplicates,
+                    'job_id': job.id if job else None,
+                    'job_status_url': reverse('embedding_job_status', args=[job.id]) if job else None,
                     'redirect_url': '/memes/'  # 調整為正確的URLs
                 })
             else:
@@ -427,6 +743,11 @@ def batch_upload(request):
                             failed=failed
                         )
                     )
+                if duplicates:
+                    messages.info(
+                        request,
+                        _("已略過 {count} 張與既有梗圖重複的圖片。").format(count=len(duplicates))
+                    )
                 
                 return redirect('meme_list')
         except Exception as e:
@@ -0,0 +1,384 @@
+import os
+import json
+import time
+import numpy as np
+from models.search_engine import VectorSearchEngine, normalize_rows, top_k_indices, _versions
+
+# IVF 索引預設參數：分群數約為 4·sqrt(N)，查詢時檢查最接近的 DEFAULT_N_PROBE 個群
+DEFAULT_N_PROBE = 8
+DEFAULT_TRAIN_ITERATIONS = 20
+ANN_INDEX_VERSION = 1
+
+def default_n_lists(count):
+    """依向量數量決定分群數"""
+    return max(1, min(count, int(4 * np.sqrt(count))))
+
+def train_centroids(matrix, n_lists, iterations=DEFAULT_TRAIN_ITERATIONS, sample_size=None, seed=0, chunk_rows=8192):
+    """以球面 k-means 訓練分群中心
+
+    Args:
+        matrix (np.ndarray): 已正規化的 (N, D) 向量矩陣
+        n_lists (int): 分群數
+        iterations (int): 迭代次數
+        sample_size (int, optional): 訓練使用的向量數量，預設為每群 64 個（至少 10000 個）
+        seed (int): 亂數種子
+        chunk_rows (int): 計算分群時每次處理的向量數量
+
+    Returns:
+        np.ndarray: (n_lists, D) 已正規化的分群中心
+    """
+    rng = np.random.default_rng(seed)
+    count = len(matrix)
+    sample_size = min(count, sample_size or max(n_lists * 64, 10000))
+    sample = matrix[rng.choice(count, sample_size, replace=False)] if sample_size < count else matrix
+
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = assign_lists(sample, centroids, chunk_rows=chunk_rows)
+        sizes = np.bincount(assignments, minlength=n_lists)
+
+        # 依分群排序後以 reduceat 一次加總每群的向量
+        order = np.argsort(assignments, kind='stable')
+        starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        nonempty = sizes > 0
+        sums = np.zeros_like(centroids)
+        sums[nonempty] = np.add.reduceat(sample[order], starts[nonempty], axis=0)
+
+        # 沒有分到向量的群重新隨機選一個向量作為中心
+        empty = np.flatnonzero(sizes == 0)
+        if len(empty):
+            sums[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+        centroids = normalize_rows(sums)
+
+    return centroids.astype(np.float32)
+
+def assign_lists(matrix, centroids, chunk_rows=8192):
+    """將每個向量分配到最接近的分群中心
+
+    Returns:
+        np.ndarray: 長度為 N 的分群編號
+    """
+    assignments = np.empty(len(matrix), dtype=np.int64)
+    for start in range(0, len(matrix), chunk_rows):
+        chunk = matrix[start:start + chunk_rows]
+        assignments[start:start + chunk_rows] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+class IVFSearchEngine:
+    """倒排檔 (IVF) 近似最近鄰搜尋引擎，介面與 VectorSearchEngine 相同
+
+    向量依分群排序後存放於連續的矩陣中，查詢時只計算最接近的 n_probe 個群內的相似度。
+    建立後的新增、更新與刪除記錄在一個精確搜尋的增量索引中，查詢時合併兩者的結果，
+    增量過多時應以 build_ann_index 指令重新建立。
+    """
+
+    def __init__(self, ids, matrix, centroids, offsets, n_probe=DEFAULT_N_PROBE, metadata=None):
+        """
+        Args:
+            ids (np.ndarray): 依分群排序的梗圖ID
+            matrix (np.ndarray): 依分群排序、已正規化的 (N, D) 向量矩陣
+            centroids (np.ndarray): (L, D) 分群中心
+            offsets (np.ndarray): 長度 L+1，第 i 群位於 matrix[offsets[i]:offsets[i+1]]
+            n_probe (int): 查詢時檢查的群數
+            metadata (dict, optional): 建立時的資訊（模型、建立時間等）
+        """
+        self.base_ids = np.asarray(ids, dtype=np.int64)
+        self.matrix = matrix
+        self.centroids = centroids
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.n_probe = n_probe
+        self.metadata = metadata or {}
+        self.dtype = matrix.dtype
+
+        # 建立後變更的梗圖：從基礎索引排除，並改由增量索引搜尋（只記錄基礎索引中的梗圖）
+        self._base_id_set = frozenset(self.base_ids.tolist())
+        self._excluded = set()
+        self._delta = VectorSearchEngine()
+        self.version = next(_versions)
+
+    @classmethod
+    def build(cls, ids, matrix, n_lists=None, n_probe=DEFAULT_N_PROBE, iterations=DEFAULT_TRAIN_ITERATIONS,
+              **metadata):
+        """由向量矩陣建立 IVF 索引
+
+        Args:
+            ids (list): 梗圖ID列表
+            matrix (np.ndarray): (N, D) 向量矩陣
+            n_lists (int, optional): 分群數，預設依數量決定
+            n_probe (int): 查詢時檢查的群數
+            iterations (int): k-means 迭代次數
+            **metadata: 寫入索引檔的其他資訊
+
+        Returns:
+            IVFSearchEngine: 索引
+        """
+        matrix = normalize_rows(np.asarray(matrix, dtype=np.float32))
+        ids = np.asarray(ids, dtype=np.int64)
+        n_lists = n_lists or default_n_lists(len(ids))
+
+        centroids = train_centroids(matrix, n_lists, iterations=iterations)
+        assignments = assign_lists(matrix, centroids)
+        order = np.argsort(assignments, kind='stable')
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=n_lists))])
+
+        metadata = dict(metadata, n_lists=n_lists, built_at=time.time())
+        return cls(ids[order], np.ascontiguousarray(matrix[order]), centroids, offsets,
+                   n_probe=n_probe, metadata=metadata)
+
+    def save(self, path):
+        """儲存索引（未包含建立後的增量變更）
+
+        Args:
+            path (str): 檔案路徑 (.npz)
+        """
+        meta = dict(self.metadata, version=ANN_INDEX_VERSION, n_probe=self.n_probe)
+        with open(path, 'wb') as f:
+            np.savez(f, ids=self.base_ids, matrix=self.matrix, centroids=self.centroids,
+                     offsets=self.offsets, meta=np.array(json.dumps(meta)))
+
+    @classmethod
+    def load(cls, path, n_probe=None):
+        """載入索引
+
+        Args:
+            path (str): 檔案路徑
+            n_probe (int, optional): 覆寫查詢時檢查的群數
+
+        Returns:
+            IVFSearchEngine: 索引
+        """
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            if meta.get('version') != ANN_INDEX_VERSION:
+                raise ValueError(f"不支援的 ANN 索引版本: {meta.get('version')}")
+            return cls(data['ids'], data['matrix'], data['centroids'], data['offsets'],
+                       n_probe=n_probe or meta.get('n_probe', DEFAULT_N_PROBE), metadata=meta)
+
+    def __len__(self):
+        return len(self.base_ids) - len(self._excluded) + len(self._delta)
+
+    @property
+    def ids(self):
+        """索引中所有的梗圖ID"""
+        base = [meme_id for meme_id in self.base_ids.tolist() if meme_id not in self._excluded]
+        return base + list(self._delta.ids)
+
+    @property
+    def dim(self):
+        return self.matrix.shape[1] if self.matrix.ndim == 2 else 0
+
+    def copy(self):
+        """複製索引，基礎矩陣為唯讀而共用，只複製增量部分"""
+        engine = IVFSearchEngine.__new__(IVFSearchEngine)
+        engine.__dict__.update(self.__dict__)
+        engine._excluded = set(self._excluded)
+        engine._delta = self._delta.copy()
+        return engine
+
+    def upsert(self, items):
+        """新增或更新向量，記錄於增量索引
+
+        Args:
+            items (iterable): (meme_id, 向量) 元組的集合，向量為 None 時視為移除
+        """
+        items = list(items)
+        self._excluded.update(meme_id for meme_id, _ in items if meme_id in self._base_id_set)
+
+        valid = []
+        for meme_id, vector in items:
+            if vector is not None and np.asarray(vector).size not in (0, self.dim):
+                # 維度不符的向量視為移除，與 VectorSearchEngine 的處理一致
+                print(f"梗圖 {meme_id} 的向量維度 {np.asarray(vector).size} 與索引維度 {self.dim} 不符，已略過")
+                vector = None
+            valid.append((meme_id, vector))
+
+        self._delta.upsert(valid)
+        self.version = next(_versions)
+
+    def remove(self, meme_ids):
+        """移除向量
+
+        Args:
+            meme_ids (iterable): 要移除的梗圖ID
+        """
+        meme_ids = list(meme_ids)
+        if not meme_ids:
+            return
+        self._excluded.update(meme_id for meme_id in meme_ids if meme_id in self._base_id_set)
+        self._delta.remove(meme_ids)
+        self.version = next(_versions)
+
+    def sync_with(self, engine, tolerance=1e-4):
+        """將索引與精確搜尋引擎的內容對齊，記錄建立後變更、新增與刪除的梗圖
+
+        Args:
+            engine (VectorSearchEngine): 內容為最新的精確搜尋引擎
+            tolerance (float): 判斷向量相同的誤差
+
+        Returns:
+            int: 增量變更的數量，維度不符時返回 None
+        """
+        if engine.dim and engine.dim != self.dim:
+            print(f"ANN 索引維度 {self.dim} 與目前向量維度 {engine.dim} 不符，請重新建立索引")
+            return None
+
+        positions = {meme_id: i for i, meme_id in enumerate(self.base_ids.tolist())}
+        current = {meme_id: i for i, meme_id in enumerate(engine.ids)}
+
+        removed = [meme_id for meme_id in positions if meme_id not in current]
+        changed = []
+        shared = [(meme_id, positions[meme_id], row) for meme_id, row in current.items() if meme_id in positions]
+        if shared:
+            shared_ids, base_rows, engine_rows = zip(*shared)
+            diff = np.abs(self.matrix[list(base_rows)] - engine.matrix[list(engine_rows)]).max(axis=1)
+            changed = [meme_id for meme_id, delta in zip(shared_ids, diff) if delta > tolerance]
+        added = [meme_id for meme_id in current if meme_id not in positions]
+
+        self.remove(removed)
+        updates = changed + added
+        if updates:
+            self.upsert((meme_id, engine.matrix[current[meme_id]]) for meme_id in updates)
+        return len(removed) + len(updates)
+
+    def search(self, query_vector, top_k=5):
+        """搜尋最相似的向量
+
+        Args:
+            query_vector: 查詢向量
+            top_k (int): 返回前 k 個結果
+
+        Returns:
+            list: 包含 (meme_id, 相似度分數) 元組的列表，按相似度從高到低排序
+        """
+        if top_k <= 0 or len(self) == 0:
+            return []
+
+        query = np.asarray(query_vector, dtype=self.dtype).reshape(-1)
+        if query.size != self.dim:
+            print(f"查詢向量維度 {query.size} 與索引維度 {self.dim} 不符")
+            return []
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        query = query / norm
+
+        # 找出最接近的 n_probe 個群，只計算這些群內向量的相似度（矩陣切片不複製資料）
+        lists = top_k_indices(self.centroids @ query, self.n_probe)
+        ids_parts = []
+        score_parts = []
+        for list_id in lists:
+            start, end = self.offsets[list_id], self.offsets[list_id + 1]
+            if start == end:
+                continue
+            ids_parts.append(self.base_ids[start:end])
+            score_parts.append(self.matrix[start:end] @ query)
+
+        results = []
+        if score_parts:
+            candidate_ids = np.concatenate(ids_parts)
+            scores = np.concatenate(score_parts)
+            # 多取被排除的數量，確保過濾後仍有 k 個結果
+            for i in top_k_indices(scores, top_k + len(self._excluded)):
+                meme_id = int(candidate_ids[i])
+                if meme_id not in self._excluded:
+                    results.append((meme_id, float(scores[i])))
+                    if len(results) >= top_k:
+                        break
+
+        if len(self._delta):
+            results.extend(self._delta.search(query, top_k=top_k))
+            results.sort(key=lambda x: x[1], reverse=True)
+
+        return results[:top_k]
+
+def evaluate_recall(ann_engine, exact_engine, queries, top_k=10):
+    """以精確搜尋的結果評估 ANN 索引的 recall@k 與查詢時間
+
+    Args:
+        ann_engine (IVFSearchEngine): ANN 索引
+        exact_engine (VectorSearchEngine): 精確搜尋引擎
+        queries (np.ndarray): (Q, D) 查詢向量
+        top_k (int): 評估的 k
+
+    Returns:
+        dict: 包含 recall、ann_ms 與 exact_ms（平均每次查詢的毫秒數）
+    """
+    hits = 0
+    ann_time = 0.0
+    exact_time = 0.0
+    for query in queries:
+        start = time.perf_counter()
+        expected = {meme_id for meme_id, _ in exact_engine.search(query, top_k=top_k)}
+        exact_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        found = {meme_id for meme_id, _ in ann_engine.search(query, top_k=top_k)}
+        ann_time += time.perf_counter() - start
+
+        hits += len(expected & found) / max(len(expected), 1)
+
+    count = max(len(queries), 1)
+    return {
+        'recall': hits / count,
+        'ann_ms': ann_time / count * 1000,
+        'exact_ms': exact_time / count * 1000,
+    }
+
+# ANN 索引檔案對應的向量欄位，與向量匯出端點的名稱相同
+ANN_INDEX_NAMES = ('embedding', 'image_features')
+
+def ann_index_path(directory, name):
+    """ANN 索引檔案路徑
+
+    Args:
+        directory (str): 索引目錄
+        name (str): 向量欄位名稱，'embedding' 或 'image_features'
+
+    Returns:
+        str: 檔案路徑
+    """
+    return os.path.join(directory, f"{name}.npz")
+
+def attach_ann_indexes(text_index, image_index, directory, n_probe=None, models=None):
+    """以離線建立的 ANN 索引取代精確搜尋引擎
+
+    索引檔案建立後的變更會由精確搜尋引擎同步到 ANN 索引的增量部分；
+    檔案不存在、無法讀取、建立索引的模型與目前向量的模型不同或維度不符時沿用精確搜尋引擎。
+
+    Args:
+        text_index (VectorSearchEngine): 內容為最新的文字索引
+        image_index (VectorSearchEngine): 內容為最新的圖片索引
+        directory (str): 索引目錄
+        n_probe (int, optional): 覆寫查詢時檢查的群數
+        models (dict, optional): 向量欄位名稱 -> 產生目前向量的模型，提供時會與索引記錄的模型比對
+
+    Returns:
+        tuple: (文字索引, 圖片索引) 元組
+    """
+    indexes = []
+    for engine, name in ((text_index, 'embedding'), (image_index, 'image_features')):
+        path = ann_index_path(directory, name)
+        if not os.path.exists(path):
+            indexes.append(engine)
+            continue
+        try:
+            ann_engine = IVFSearchEngine.load(path, n_probe=n_probe)
+        except Exception as e:
+            print(f"載入 ANN 索引 {path} 出錯: {str(e)}")
+            indexes.append(engine)
+            continue
+
+        if models is not None and ann_engine.metadata.get('model') != models.get(name):
+            # 切換模型後維度可能相同，但舊索引的分群對新向量沒有意義
+            print(f"ANN 索引 {path} 由模型 {ann_engine.metadata.get('model')} 建立，"
+                  f"與目前的模型 {models.get(name)} 不同，請重新建立索引")
+            indexes.append(engine)
+            continue
+
+        changes = ann_engine.sync_with(engine)
+        if changes is None:
+            indexes.append(engine)
+            continue
+        print(f"使用 ANN 索引 {path}：{len(ann_engine)} 個向量，建立後變更 {changes} 個")
+        indexes.append(ann_engine)
+    return tuple(indexes)
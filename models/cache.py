@@ -0,0 +1,103 @@
+import threading
+import time
+from collections import OrderedDict
+
+class LRUCache:
+    """具容量上限與存活時間的 LRU 快取，可在多執行緒下使用
+
+    超過容量時淘汰最久未使用的項目，超過存活時間的項目在讀取時視為不存在。
+    記錄命中與未命中次數，方便觀察快取效果。
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        """
+        Args:
+            maxsize (int): 最多保存的項目數量
+            ttl (float, optional): 項目存活秒數，None 表示不過期
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def _expired(self, timestamp, now):
+        return self.ttl is not None and now - timestamp > self.ttl
+
+    def get(self, key, default=None):
+        """讀取快取項目，並將其標記為最近使用
+
+        Args:
+            key: 快取鍵
+            default: 找不到時返回的值
+
+        Returns:
+            快取的值或 default
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or self._expired(entry[1], now):
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, timestamp=None):
+        """寫入快取項目，超過容量時淘汰最久未使用的項目
+
+        Args:
+            key: 快取鍵
+            value: 快取的值
+            timestamp (float, optional): 寫入時間，預設為現在（從磁碟載入時沿用原本的時間）
+        """
+        with self._lock:
+            self._data[key] = (value, timestamp if timestamp is not None else time.time())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            self.dirty = True
+
+    def clear(self):
+        """清除所有項目"""
+        with self._lock:
+            self._data.clear()
+            self.dirty = True
+
+    def items(self):
+        """返回未過期的項目，由最久未使用到最近使用排序
+
+        Returns:
+            list: (鍵, 值, 寫入時間) 元組的列表
+        """
+        now = time.time()
+        with self._lock:
+            return [
+                (key, value, timestamp)
+                for key, (value, timestamp) in self._data.items()
+                if not self._expired(timestamp, now)
+            ]
+
+    def stats(self):
+        """快取統計資訊
+
+        Returns:
+            dict: 包含項目數量、命中與未命中次數及命中率
+        """
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
@@ -1,14 +1,25 @@
 import os
+import threading
 import numpy as np
 import torch
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from itertools import islice
 import torchvision.transforms as transforms
 import torchvision.models as models
 from PIL import Image
+from models.search_engine import as_search_engine
 
 # 預設模型
 DEFAULT_MODEL_NAME = "resnet50"
 cv_model = None
 transform = None
+cv_model_name = None
+_load_lock = threading.Lock()
+
+# 批次提取特徵時，圖片解碼與前處理使用的執行緒數量
+DEFAULT_PREPROCESS_WORKERS = min(4, os.cpu_count() or 1)
 
 def load_model(model_path=None):
     """載入CV模型
@@ -19,7 +30,7 @@ def load_model(model_path=None):
     Returns:
         torch.nn.Module: 載入的模型
     """
-    global cv_model, transform
+    global cv_model, transform, cv_model_name
     
     try:
         if model_path and os.path.exists(model_path):
@@ -45,6 +56,7 @@ def load_model(model_path=None):
         
         # 設定為評估模式
         cv_model.eval()
+        cv_model_name = os.path.abspath(model_path) if model_path and os.path.exists(model_path) else (model_path or DEFAULT_MODEL_NAME)
         
         # 設定圖像轉換
         transform = transforms.Compose([
@@ -62,11 +74,29 @@ def load_model(model_path=None):
         print(f"載入CV模型時出錯: {str(e)}")
         return None
 
-def get_image_features(image_path, model_path=None):
+def open_image(image):
+    """開啟圖片並轉換為 RGB
+    
+    Args:
+        image: 圖片路徑 (str)、二進制數據 (bytes)、檔案物件或 PIL.Image
+        
+    Returns:
+        PIL.Image.Image: RGB 圖片，路徑不存在時返回 None
+    """
+    if isinstance(image, Image.Image):
+        return image.convert('RGB')
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        image = BytesIO(image)
+    elif isinstance(image, str) and not os.path.exists(image):
+        print(f"圖片不存在: {image}")
+        return None
+    return Image.open(image).convert('RGB')
+
+def get_image_features(image, model_path=None):
     """提取圖片特徵
     
     Args:
-        image_path (str): 圖片路徑
+        image: 圖片路徑 (str)、二進制數據 (bytes)、檔案物件或 PIL.Image
         model_path (str, optional): 模型路徑，用於首次載入
         
     Returns:
@@ -75,20 +105,20 @@ def get_image_features(image_path, model_path=None):
     global cv_model, transform
     
     if not cv_model:
-        cv_model = load_model(model_path)
+        # 多個推論執行緒同時首次呼叫時只載入一次模型
+        with _load_lock:
+            if not cv_model:
+                cv_model = load_model(model_path)
     
     if not cv_model:
         print("未載入CV模型，無法提取圖片特徵")
         return None
     
     try:
-        # 確保圖片存在
-        if not os.path.exists(image_path):
-            print(f"圖片不存在: {image_path}")
+        # 載入並處理圖片，記憶體中的圖片不需先寫入檔案
+        image = open_image(image)
+        if image is None:
             return None
-            
-        # 載入並處理圖片
-        image = Image.open(image_path).convert('RGB')
         image_tensor = transform(image).unsqueeze(0)  # 增加批次維度
         
         # 提取特徵
@@ -103,37 +133,138 @@ def get_image_features(image_path, model_path=None):
         print(f"提取圖片特徵時出錯: {str(e)}")
         return None
     
-def search_by_image(image_path, memes_image_features, top_k=5):
+def load_image_tensor(image):
+    """讀取圖片並套用前處理轉換
+    
+    Args:
+        image: 圖片路徑 (str)、二進制數據 (bytes)、檔案物件（例如 BytesIO）或 PIL.Image
+        
+    Returns:
+        torch.Tensor: 前處理後的圖片張量，無法讀取時返回 None
+    """
+    try:
+        image = open_image(image)
+        if image is None:
+            return None
+        return transform(image)
+    except Exception as e:
+        print(f"讀取圖片時出錯: {str(e)}")
+        return None
+
+def iter_image_tensors(image_paths, workers=None, prefetch=None):
+    """以執行緒池平行解碼與前處理圖片，依輸入順序逐一產出張量
+    
+    同時最多只有 prefetch 張圖片在處理或等待取用，記憶體用量不隨圖片數量增加；
+    解碼與縮放在背景執行緒進行，可與呼叫端的模型推論重疊。
+    
+    Args:
+        image_paths (list): 圖片列表，每個元素可為路徑、二進制數據、檔案物件或 PIL.Image
+        workers (int, optional): 執行緒數量，預設為 DEFAULT_PREPROCESS_WORKERS
+        prefetch (int, optional): 預先處理的圖片數量上限，預設為執行緒數量的 4 倍
+        
+    Yields:
+        tuple: (輸入位置, 圖片張量或 None)
+    """
+    workers = workers or DEFAULT_PREPROCESS_WORKERS
+    prefetch = max(prefetch or workers * 4, 1)
+    
+    paths = iter(enumerate(image_paths))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cv-preprocess") as executor:
+        pending = deque(
+            (position, executor.submit(load_image_tensor, image_path))
+            for position, image_path in islice(paths, prefetch)
+        )
+        while pending:
+            position, future = pending.popleft()
+            tensor = future.result()
+            
+            # 取出一張後再補上一張，維持固定的預取數量
+            next_item = next(paths, None)
+            if next_item is not None:
+                next_position, next_path = next_item
+                pending.append((next_position, executor.submit(load_image_tensor, next_path)))
+            
+            yield position, tensor
+
+def get_images_features(image_paths, model_path=None, batch_size=16, workers=None):
+    """批次提取多張圖片的特徵
+    
+    圖片解碼與前處理由 iter_image_tensors 在背景執行緒預先進行，湊滿一批後送入模型。
+    
+    Args:
+        image_paths (list): 圖片列表，每個元素可為路徑、二進制數據、檔案物件或 PIL.Image
+        model_path (str, optional): 模型路徑，用於首次載入
+        batch_size (int): 每次送入模型的圖片數量
+        workers (int, optional): 前處理執行緒數量
+        
+    Returns:
+        list: 圖片特徵向量列表，順序與輸入相同；無法讀取的圖片對應 None，推論失敗時返回 None
+    """
+    global cv_model, transform
+    
+    if not cv_model:
+        # 多個推論執行緒同時首次呼叫時只載入一次模型
+        with _load_lock:
+            if not cv_model:
+                cv_model = load_model(model_path)
+    
+    if not cv_model:
+        print("未載入CV模型，無法提取圖片特徵")
+        return None
+    
+    results = [None] * len(image_paths)
+    positions = []
+    tensors = []
+    
+    def run_batch():
+        # 將整批圖片疊成一個張量進行推論
+        with torch.no_grad():
+            features = cv_model(torch.stack(tensors))
+        features = features.reshape(features.shape[0], -1).numpy()
+        for position, feature in zip(positions, features):
+            results[position] = feature
+        positions.clear()
+        tensors.clear()
+    
+    try:
+        for position, tensor in iter_image_tensors(image_paths, workers=workers, prefetch=batch_size * 2):
+            if tensor is None:
+                continue
+            positions.append(position)
+            tensors.append(tensor)
+            if len(tensors) >= batch_size:
+                run_batch()
+        
+        if tensors:
+            run_batch()
+    except Exception as e:
+        print(f"批次提取圖片特徵時出錯: {str(e)}")
+        return None
+    
+    return results
+
+def search_by_image(image, memes_image_features, top_k=5):
     """基於圖片搜尋最相似的梗圖
     
     Args:
-        image_path (str): 查詢圖片的路徑
-        memes_image_features (list): 梗圖圖片特徵列表，每個元素是 (meme_id, image_features) 元組
+        image: 查詢圖片，可以是路徑、二進制數據、檔案物件或 PIL.Image
+        memes_image_features (list | VectorSearchEngine): 梗圖圖片特徵列表，每個元素是 (meme_id, image_features) 元組，
+            或已建立好的 VectorSearchEngine
         top_k (int): 返回前 k 個結果
         
     Returns:
         list: 包含 (meme_id, 相似度分數) 元組的列表，按相似度從高到低排序
     """
-    if not image_path or not memes_image_features:
+    if image is None or not memes_image_features:
         return []
     
-    query_features = get_image_features(image_path)
+    query_features = get_image_features(image)
     if query_features is None:
         return []
     
-    results = []
-    for meme_id, features in memes_image_features:
-        if features is None:
-            continue
-            
-        # 計算餘弦相似度
-        similarity = cosine_similarity(query_features, np.array(features))
-        results.append((meme_id, float(similarity)))
-    
-    # 依相似度降序排序
-    results.sort(key=lambda x: x[1], reverse=True)
-    
-    return results[:top_k]
+    # 以矩陣運算一次計算所有相似度
+    engine = as_search_engine(memes_image_features)
+    return engine.search(query_features, top_k=top_k)
 
 def cosine_similarity(v1, v2):
     """計算兩個向量的餘弦相似度
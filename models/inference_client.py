@@ -0,0 +1,122 @@
+import threading
+import requests
+from models.vector_payload import decode_payload
+
+class InferenceClient:
+    """本機推論服務 (models.inference_server) 的同步客戶端
+
+    所有方法在連線或推論失敗時返回 None，由呼叫端決定如何處理。
+    """
+
+    def __init__(self, base_url, timeout=30):
+        """
+        Args:
+            base_url (str): 推論服務網址，例如 http://127.0.0.1:8765
+            timeout (float): 請求逾時秒數
+        """
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        """每個執行緒各自持有一個連線池，requests.Session 不保證可跨執行緒共用"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _decode_vectors(self, response, name):
+        """將向量匯出格式的回應還原為與輸入順序相同的向量列表"""
+        header, matrices = decode_payload(response.content)
+        positions, matrix = matrices.get(name, ([], None))
+        vectors = [None] * header.get('count', len(positions))
+        for position, vector in zip(positions, matrix if matrix is not None else []):
+            vectors[position] = vector
+        return vectors, header.get('model')
+
+    def embed_texts(self, texts):
+        """批次獲取文字嵌入向量
+
+        Args:
+            texts (list): 文字列表
+
+        Returns:
+            tuple: (向量列表, 模型名稱) 元組，失敗時返回 None
+        """
+        try:
+            response = self.session.post(
+                f"{self.base_url}/embed/text", json={'texts': list(texts)}, timeout=self.timeout
+            )
+            if response.status_code != 200:
+                print(f"推論服務生成文字嵌入向量失敗: HTTP {response.status_code} {response.text[:200]}")
+                return None
+            return self._decode_vectors(response, 'embedding')
+        except Exception as e:
+            print(f"連線推論服務時出錯: {str(e)}")
+            return None
+
+    def embed_images(self, image_paths):
+        """批次獲取圖片特徵，圖片須位於推論服務允許讀取的目錄中
+
+        Args:
+            image_paths (list): 圖片路徑列表
+
+        Returns:
+            tuple: (特徵向量列表, 模型名稱) 元組，無法讀取的圖片對應 None，失敗時返回 None
+        """
+        try:
+            response = self.session.post(
+                f"{self.base_url}/embed/image", json={'paths': list(image_paths)}, timeout=self.timeout
+            )
+            if response.status_code != 200:
+                print(f"推論服務提取圖片特徵失敗: HTTP {response.status_code} {response.text[:200]}")
+                return None
+            return self._decode_vectors(response, 'image_features')
+        except Exception as e:
+            print(f"連線推論服務時出錯: {str(e)}")
+            return None
+
+    def search(self, query_text=None, query_image=None, top_k=5, weight_text=0.5):
+        """以推論服務的索引搜尋梗圖
+
+        Args:
+            query_text (str, optional): 查詢文字
+            query_image (str | bytes, optional): 查詢圖片的路徑或內容
+            top_k (int): 返回前k個結果
+            weight_text (float): 文字搜尋結果的權重 (0~1)
+
+        Returns:
+            list: 包含 (meme_id, 相似度分數) 元組的列表，失敗時返回 None
+        """
+        try:
+            data = b''
+            if isinstance(query_image, str):
+                with open(query_image, 'rb') as f:
+                    data = f.read()
+            elif query_image:
+                data = bytes(query_image)
+
+            response = self.session.post(
+                f"{self.base_url}/search",
+                params={'text': query_text or '', 'top_k': top_k, 'weight_text': weight_text},
+                data=data,
+                headers={'Content-Type': 'application/octet-stream'},
+                timeout=self.timeout
+            )
+            if response.status_code != 200:
+                print(f"推論服務搜尋失敗: HTTP {response.status_code} {response.text[:200]}")
+                return None
+            return [(meme_id, score) for meme_id, score in response.json().get('results', [])]
+        except Exception as e:
+            print(f"連線推論服務時出錯: {str(e)}")
+            return None
+
+    def recommend(self, query_text=None, query_image=None, top_k=5, weight_text=0.5):
+        """與 models.similarity.recommend_memes 相同，返回推薦梗圖ID列表，失敗時返回 None"""
+        if not query_text and not query_image:
+            return []
+        results = self.search(query_text, query_image, top_k=top_k, weight_text=weight_text)
+        if results is None:
+            return None
+        return [meme_id for meme_id, _ in results]
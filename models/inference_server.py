@@ -0,0 +1,316 @@
+import os
+import asyncio
+import functools
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+from models.nlp_model import get_text_embeddings, load_model as load_nlp_model
+from models.cv_model import get_images_features, load_model as load_cv_model
+from models.similarity import recommend_memes
+from models.vector_payload import iter_payload, PAYLOAD_CONTENT_TYPE
+
+# 微批次設定：最多等待 DEFAULT_MAX_WAIT 秒或湊滿 DEFAULT_MAX_BATCH 筆後送入模型
+DEFAULT_MAX_BATCH = 32
+DEFAULT_MAX_WAIT = 0.01
+
+class MicroBatcher:
+    """將短時間內的多個請求合併成一批送入模型
+
+    第一個請求到達後最多等待 max_wait 秒，期間到達的請求與其合併，
+    湊滿 max_batch 筆時立即執行。批次函數在專用的執行緒中執行，不阻塞事件迴圈。
+    """
+
+    def __init__(self, batch_func, max_batch=DEFAULT_MAX_BATCH, max_wait=DEFAULT_MAX_WAIT, executor=None):
+        """
+        Args:
+            batch_func (callable): 接受輸入列表並返回相同長度輸出列表的函數，失敗時返回 None
+            max_batch (int): 每批最多的輸入數量
+            max_wait (float): 湊批次時最多等待的秒數
+            executor (Executor, optional): 執行批次函數的執行緒池
+        """
+        self.batch_func = batch_func
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.executor = executor
+        self._queue = None
+        self._task = None
+
+    def start(self):
+        """在目前的事件迴圈中啟動批次處理"""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """停止批次處理"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, items):
+        """送出一組輸入，等待所屬批次完成
+
+        Args:
+            items (list): 輸入列表
+
+        Returns:
+            list: 對應的輸出列表
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((list(items), future))
+        return await future
+
+    async def _collect(self):
+        """取出一批請求，等待時間與數量不超過設定的上限"""
+        loop = asyncio.get_running_loop()
+        requests = [await self._queue.get()]
+        size = len(requests[0][0])
+        deadline = loop.time() + self.max_wait
+
+        while size < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                request = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            requests.append(request)
+            size += len(request[0])
+
+        return requests
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            requests = await self._collect()
+            inputs = [item for items, _ in requests for item in items]
+
+            try:
+                outputs = await loop.run_in_executor(self.executor, self.batch_func, inputs)
+                if outputs is None:
+                    raise RuntimeError("模型推論失敗")
+            except Exception as e:
+                for _, future in requests:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            start = 0
+            for items, future in requests:
+                # 請求端可能已經斷線並取消等待
+                if not future.done():
+                    future.set_result(outputs[start:start + len(items)])
+                start += len(items)
+
+class InferenceServer:
+    """本機推論服務，只載入一份模型，提供文字嵌入、圖片特徵與搜尋
+
+    端點:
+        POST /embed/text   JSON {"texts": [...]}，返回向量匯出格式，矩陣名稱為 embedding
+        POST /embed/image  JSON {"paths": [...]} 或直接以圖片內容為請求主體，矩陣名稱為 image_features
+        POST /search       查詢字串 text、top_k、weight_text，請求主體可附上查詢圖片，返回 JSON
+        GET  /health       模型與索引狀態
+    向量匯出的標頭中 model 欄位記錄產生向量的模型，呼叫端可據此確認與啟用設定一致。
+    """
+
+    def __init__(self, nlp_model_path=None, cv_model_path=None, index_loader=None, refresh_interval=30,
+                 max_batch=DEFAULT_MAX_BATCH, max_wait=DEFAULT_MAX_WAIT, allowed_root=None):
+        """
+        Args:
+            nlp_model_path (str, optional): NLP模型路徑或名稱
+            cv_model_path (str, optional): CV模型路徑或名稱
+            index_loader (callable, optional): 返回 (文字索引, 圖片索引, 感知雜湊索引, 關鍵字倒排索引) 的函數，
+                目錄未變更時返回 None；
+                會在執行緒中呼叫
+            refresh_interval (float): 檢查目錄是否變更的間隔（秒）
+            max_batch (int): 微批次的最大數量
+            max_wait (float): 微批次的最長等待秒數
+            allowed_root (str, optional): /embed/image 允許讀取的圖片目錄，未設定時不接受路徑
+        """
+        self.nlp_model_path = nlp_model_path
+        self.cv_model_path = cv_model_path
+        self.index_loader = index_loader
+        self.refresh_interval = refresh_interval
+        self.allowed_root = os.path.realpath(allowed_root) if allowed_root else None
+        self.text_index = None
+        self.image_index = None
+        self.hash_index = None
+        self.lexical_index = None
+
+        # 模型推論在單一執行緒中依序執行，併發請求由微批次合併
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='inference-server')
+        self.text_batcher = MicroBatcher(
+            lambda texts: get_text_embeddings(texts, model_path=nlp_model_path, batch_size=max_batch),
+            max_batch=max_batch, max_wait=max_wait, executor=self._executor
+        )
+        self.image_batcher = MicroBatcher(
+            lambda images: get_images_features(images, model_path=cv_model_path, batch_size=max_batch),
+            max_batch=max_batch, max_wait=max_wait, executor=self._executor
+        )
+        self._refresh_task = None
+
+    def load_models(self):
+        """啟動前先載入模型，避免第一個請求等待"""
+        if self.nlp_model_path:
+            load_nlp_model(self.nlp_model_path)
+        if self.cv_model_path:
+            load_cv_model(self.cv_model_path)
+
+    def refresh_indexes(self):
+        """重新載入搜尋索引
+
+        Returns:
+            bool: 索引是否有更新
+        """
+        if not self.index_loader:
+            return False
+        indexes = self.index_loader()
+        if indexes is None:
+            return False
+        # 以新索引整個取代，進行中的搜尋仍使用舊索引
+        self.text_index, self.image_index, self.hash_index, self.lexical_index = indexes
+        print(f"搜尋索引已更新：文字 {len(self.text_index)} 個、圖片 {len(self.image_index)} 個")
+        return True
+
+    async def _refresh_periodically(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await loop.run_in_executor(None, self.refresh_indexes)
+            except Exception as e:
+                print(f"更新搜尋索引時出錯: {str(e)}")
+
+    async def _on_startup(self, app):
+        self.text_batcher.start()
+        self.image_batcher.start()
+        if self.index_loader:
+            self._refresh_task = asyncio.get_running_loop().create_task(self._refresh_periodically())
+
+    async def _on_cleanup(self, app):
+        if self._refresh_task:
+            self._refresh_task.cancel()
+        await self.text_batcher.stop()
+        await self.image_batcher.stop()
+        self._executor.shutdown(wait=False)
+
+    def create_app(self):
+        """建立 aiohttp 應用程式
+
+        Returns:
+            web.Application: 應用程式
+        """
+        app = web.Application(client_max_size=20 * 1024 * 1024)
+        app.router.add_post('/embed/text', self.handle_embed_text)
+        app.router.add_post('/embed/image', self.handle_embed_image)
+        app.router.add_post('/search', self.handle_search)
+        app.router.add_get('/health', self.handle_health)
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+    def _resolve_path(self, path):
+        """確認圖片路徑位於允許的目錄中"""
+        if not self.allowed_root:
+            raise ValueError("推論服務未設定圖片目錄，不接受圖片路徑")
+        real_path = os.path.realpath(os.path.join(self.allowed_root, path))
+        if os.path.commonpath([real_path, self.allowed_root]) != self.allowed_root:
+            raise ValueError(f"圖片路徑不在允許的目錄中: {path}")
+        return real_path
+
+    @staticmethod
+    def _payload_response(name, vectors, model):
+        """將向量列表以向量匯出格式返回，無法產生向量的位置不列入"""
+        positions = [i for i, vector in enumerate(vectors) if vector is not None]
+        body = b''.join(iter_payload(
+            {name: (positions, [vectors[i] for i in positions])},
+            count=len(vectors),
+            model=model
+        ))
+        return web.Response(body=body, content_type=PAYLOAD_CONTENT_TYPE)
+
+    async def handle_embed_text(self, request):
+        try:
+            data = await request.json()
+            texts = [str(text or '') for text in data.get('texts', [])]
+        except Exception:
+            return web.json_response({'error': '請求格式錯誤'}, status=400)
+
+        try:
+            embeddings = await self.text_batcher.submit(texts) if texts else []
+        except Exception as e:
+            return web.json_response({'error': str(e)}, status=500)
+
+        return self._payload_response('embedding', list(embeddings), self.nlp_model_path)
+
+    async def handle_embed_image(self, request):
+        try:
+            if request.content_type == 'application/json':
+                data = await request.json()
+                images = [self._resolve_path(path) for path in data.get('paths', [])]
+            else:
+                images = [BytesIO(await request.read())]
+        except ValueError as e:
+            return web.json_response({'error': str(e)}, status=400)
+        except Exception:
+            return web.json_response({'error': '請求格式錯誤'}, status=400)
+
+        try:
+            features = await self.image_batcher.submit(images) if images else []
+        except Exception as e:
+            return web.json_response({'error': str(e)}, status=500)
+
+        return self._payload_response('image_features', list(features), self.cv_model_path)
+
+    async def handle_search(self, request):
+        try:
+            text = request.query.get('text', '').strip()
+            top_k = int(request.query.get('top_k', 5))
+            weight_text = float(request.query.get('weight_text', 0.5))
+            image_data = await request.read()
+        except ValueError:
+            return web.json_response({'error': '參數格式錯誤'}, status=400)
+
+        loop = asyncio.get_running_loop()
+
+        def encode(batcher, item):
+            # 在搜尋的執行緒中等待微批次的結果，只有需要執行模型時才會呼叫
+            return asyncio.run_coroutine_threadsafe(batcher.submit([item]), loop).result()[0]
+
+        # 與機器人使用相同的推薦流程（完全相同的關鍵字、感知雜湊、BM25 融合與結果快取），
+        # 只有模型推論交由微批次執行；搜尋期間即使索引更新也使用呼叫時的索引
+        search = functools.partial(
+            recommend_memes,
+            query_text=text or None,
+            query_image=image_data or None,
+            top_k=top_k,
+            weight_text=weight_text,
+            text_index=self.text_index,
+            image_index=self.image_index,
+            hash_index=self.hash_index,
+            lexical_index=self.lexical_index,
+            query_embedding=(lambda: encode(self.text_batcher, text)) if self.nlp_model_path else (lambda: None),
+            query_features=(lambda: encode(self.image_batcher, BytesIO(image_data))) if self.cv_model_path
+            else (lambda: None),
+            return_scores=True
+        )
+
+        try:
+            # 不可使用模型推論的執行緒，否則等待微批次時會互相阻塞
+            results = await loop.run_in_executor(None, search)
+        except Exception as e:
+            return web.json_response({'error': str(e)}, status=500)
+
+        return web.json_response({'results': [[meme_id, score] for meme_id, score in results]})
+
+    async def handle_health(self, request):
+        return web.json_response({
+            'nlp_model': self.nlp_model_path,
+            'cv_model': self.cv_model_path,
+            'text_index': len(self.text_index) if self.text_index is not None else 0,
+            'image_index': len(self.image_index) if self.image_index is not None else 0,
+        })
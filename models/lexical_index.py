@@ -0,0 +1,193 @@
+import re
+import math
+import unicodedata
+from models.search_engine import _versions
+
+# BM25 參數
+DEFAULT_K1 = 1.2
+DEFAULT_B = 0.75
+
+_CJK = r'㐀-䶿一-鿿豈-﫿'
+# \w 也包含中文字，其他文字的詞須排除中文字，否則「87分」會成為一個沒有拆成雙字詞的詞項
+_TOKEN = re.compile(rf'[{_CJK}]+|[^\W_{_CJK}]+')
+_CJK_RUN = re.compile(rf'[{_CJK}]+')
+
+def normalize_text(text):
+    """正規化文字：統一全形與半形字元（NFKC）、轉為小寫並合併多餘的空白
+
+    Args:
+        text (str): 輸入文字
+
+    Returns:
+        str: 正規化後的文字
+    """
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFKC', text or '').casefold()).strip()
+
+def tokenize(text):
+    """將文字切成詞項：中文以相鄰兩字為一詞（單獨一個字時以單字為詞），其他文字以單字詞為詞
+
+    Args:
+        text (str): 輸入文字
+
+    Returns:
+        list: 詞項列表
+    """
+    tokens = []
+    for run in _TOKEN.findall(normalize_text(text)):
+        if _CJK_RUN.fullmatch(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+def split_keywords(keywords):
+    """將逗號分隔的關鍵字拆為正規化後的關鍵字列表"""
+    return [keyword for keyword in (normalize_text(k) for k in (keywords or '').split(',')) if keyword]
+
+class BM25Index:
+    """梗圖關鍵字與標題的倒排索引，以 BM25 計算文字查詢的相關分數
+
+    另外記錄每個完整關鍵字（與標題）對應的梗圖，查詢與關鍵字完全相同時可直接取得結果。
+    """
+
+    def __init__(self, items=None, k1=DEFAULT_K1, b=DEFAULT_B):
+        """
+        Args:
+            items (iterable, optional): (梗圖ID, 標題, 關鍵字) 元組的集合，關鍵字以逗號分隔
+            k1 (float): BM25 的詞頻飽和參數
+            b (float): BM25 的文件長度正規化參數
+        """
+        self.k1 = k1
+        self.b = b
+        self._postings = {}
+        self._terms = {}
+        self._lengths = {}
+        self._total_length = 0
+        self._exact = {}
+        self._phrases = {}
+        self.version = next(_versions)
+        if items is not None:
+            self.upsert(items)
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def copy(self):
+        """複製索引，更新副本不會影響正在查詢的原索引"""
+        index = BM25Index.__new__(BM25Index)
+        index.__dict__.update(self.__dict__)
+        index._postings = {term: dict(posting) for term, posting in self._postings.items()}
+        index._terms = dict(self._terms)
+        index._lengths = dict(self._lengths)
+        index._exact = {phrase: set(meme_ids) for phrase, meme_ids in self._exact.items()}
+        index._phrases = dict(self._phrases)
+        return index
+
+    def _remove_one(self, meme_id):
+        terms = self._terms.pop(meme_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            posting = self._postings[term]
+            del posting[meme_id]
+            if not posting:
+                del self._postings[term]
+        self._total_length -= self._lengths.pop(meme_id)
+        for phrase in self._phrases.pop(meme_id):
+            meme_ids = self._exact[phrase]
+            meme_ids.discard(meme_id)
+            if not meme_ids:
+                del self._exact[phrase]
+
+    def upsert(self, items):
+        """新增或更新梗圖
+
+        Args:
+            items (iterable): (梗圖ID, 標題, 關鍵字) 元組的集合
+        """
+        for meme_id, title, keywords in items:
+            self._remove_one(meme_id)
+
+            tokens = tokenize(title) + tokenize(keywords)
+            frequencies = {}
+            for token in tokens:
+                frequencies[token] = frequencies.get(token, 0) + 1
+            for term, count in frequencies.items():
+                self._postings.setdefault(term, {})[meme_id] = count
+            self._terms[meme_id] = list(frequencies)
+            self._lengths[meme_id] = len(tokens)
+            self._total_length += len(tokens)
+
+            phrases = set(split_keywords(keywords))
+            if normalize_text(title):
+                phrases.add(normalize_text(title))
+            for phrase in phrases:
+                self._exact.setdefault(phrase, set()).add(meme_id)
+            self._phrases[meme_id] = phrases
+
+        self.version = next(_versions)
+
+    def remove(self, meme_ids):
+        """移除梗圖
+
+        Args:
+            meme_ids (iterable): 要移除的梗圖ID
+        """
+        meme_ids = list(meme_ids)
+        if not meme_ids:
+            return
+        for meme_id in meme_ids:
+            self._remove_one(meme_id)
+        self.version = next(_versions)
+
+    def scores(self, query):
+        """計算查詢對每個含有查詢詞項的梗圖的 BM25 分數
+
+        Args:
+            query (str): 查詢文字
+
+        Returns:
+            dict: 梗圖ID -> BM25 分數
+        """
+        count = len(self._lengths)
+        if not count:
+            return {}
+        average_length = self._total_length / count or 1
+
+        scores = {}
+        for term in set(tokenize(query)):
+            posting = self._postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for meme_id, frequency in posting.items():
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[meme_id] / average_length)
+                scores[meme_id] = scores.get(meme_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return scores
+
+    def search(self, query, top_k=5):
+        """以 BM25 搜尋梗圖
+
+        Args:
+            query (str): 查詢文字
+            top_k (int): 返回前 k 個結果
+
+        Returns:
+            list: 包含 (meme_id, BM25 分數) 元組的列表，按分數從高到低排序
+        """
+        scores = self.scores(query)
+        return sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
+
+    def exact_matches(self, query):
+        """找出有關鍵字或標題與查詢完全相同的梗圖
+
+        Args:
+            query (str): 查詢文字
+
+        Returns:
+            set: 梗圖ID集合
+        """
+        return set(self._exact.get(normalize_text(query), ()))
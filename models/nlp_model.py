@@ -1,13 +1,26 @@
 import os
+import threading
+import re
+import json
+import unicodedata
 import torch
 import numpy as np
 from transformers import AutoTokenizer, AutoModel
 from sentence_transformers import SentenceTransformer
+from models.search_engine import as_search_engine
+from models.cache import LRUCache
 
 # 預設模型
 DEFAULT_MODEL_NAME = "distilbert-base-multilingual-cased"
 nlp_model = None
 tokenizer = None
+nlp_model_name = None
+_load_lock = threading.Lock()
+
+# 查詢文字嵌入向量快取，鍵為 (模型名稱, 正規化後的文字)
+DEFAULT_EMBEDDING_CACHE_SIZE = 1024
+embedding_cache = LRUCache(maxsize=DEFAULT_EMBEDDING_CACHE_SIZE)
+embedding_cache_path = None
 
 def load_model(model_path=None):
     """載入NLP模型
@@ -18,7 +31,7 @@ def load_model(model_path=None):
     Returns:
         tuple: (模型, tokenizer) 元組
     """
-    global nlp_model, tokenizer
+    global nlp_model, tokenizer, nlp_model_name
     
     try:
         if model_path and os.path.exists(model_path):
@@ -40,25 +53,128 @@ def load_model(model_path=None):
                 tokenizer = AutoTokenizer.from_pretrained(model_name)
                 nlp_model = AutoModel.from_pretrained(model_name)
         
+        nlp_model_name = os.path.abspath(model_path) if model_path and os.path.exists(model_path) else model_name
         return nlp_model, tokenizer
     except Exception as e:
         print(f"載入NLP模型時出錯: {str(e)}")
         return None, None
 
-def get_text_embedding(text, model_path=None):
+def normalize_query_text(text):
+    """正規化查詢文字，作為嵌入向量快取的鍵
+    
+    統一全形與半形字元（NFKC），並合併多餘的空白；不轉換大小寫，因為預設模型區分大小寫。
+    
+    Args:
+        text (str): 輸入文字
+        
+    Returns:
+        str: 正規化後的文字
+    """
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFKC', text)).strip()
+
+def configure_embedding_cache(maxsize=None, ttl=None, path=None):
+    """設定查詢文字嵌入向量快取
+    
+    Args:
+        maxsize (int, optional): 最多保存的向量數量
+        ttl (float, optional): 向量存活秒數，None 表示不過期
+        path (str, optional): 持久化檔案路徑，設定後會立即載入既有的快取
+        
+    Returns:
+        LRUCache: 新的快取
+    """
+    global embedding_cache, embedding_cache_path
+    
+    embedding_cache = LRUCache(maxsize=maxsize or DEFAULT_EMBEDDING_CACHE_SIZE, ttl=ttl)
+    embedding_cache_path = path
+    if path:
+        load_embedding_cache(path)
+    return embedding_cache
+
+def load_embedding_cache(path=None):
+    """從磁碟載入查詢文字嵌入向量快取
+    
+    Args:
+        path (str, optional): 快取檔案路徑，預設為 configure_embedding_cache 設定的路徑
+        
+    Returns:
+        int: 載入的向量數量
+    """
+    path = path or embedding_cache_path
+    if not path or not os.path.exists(path):
+        return 0
+    
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            entries = json.loads(str(data['keys']))
+            for i, (model_name, text, timestamp) in enumerate(entries):
+                vector = data[f'v{i}']
+                vector.setflags(write=False)
+                embedding_cache.put((model_name, text), vector, timestamp=timestamp)
+        embedding_cache.dirty = False
+        print(f"已載入 {len(entries)} 個查詢嵌入向量快取")
+        return len(entries)
+    except Exception as e:
+        print(f"載入查詢嵌入向量快取時出錯: {str(e)}")
+        return 0
+
+def save_embedding_cache(path=None):
+    """將查詢文字嵌入向量快取寫入磁碟，快取未變更時略過
+    
+    Args:
+        path (str, optional): 快取檔案路徑，預設為 configure_embedding_cache 設定的路徑
+        
+    Returns:
+        bool: 是否有寫入檔案
+    """
+    path = path or embedding_cache_path
+    if not path or not embedding_cache.dirty:
+        return False
+    
+    try:
+        items = embedding_cache.items()
+        keys = [[model_name, text, timestamp] for (model_name, text), _, timestamp in items]
+        vectors = {f'v{i}': vector for i, (_, vector, _) in enumerate(items)}
+        
+        # 先寫入暫存檔再取代，避免中途中斷留下損毀的檔案
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, keys=np.array(json.dumps(keys, ensure_ascii=False)), **vectors)
+        os.replace(tmp_path, path)
+        embedding_cache.dirty = False
+        return True
+    except Exception as e:
+        print(f"儲存查詢嵌入向量快取時出錯: {str(e)}")
+        return False
+
+def get_embedding_cache_stats():
+    """查詢文字嵌入向量快取的統計資訊
+    
+    Returns:
+        dict: 包含項目數量、命中與未命中次數及命中率
+    """
+    return embedding_cache.stats()
+
+def get_text_embedding(text, model_path=None, use_cache=True):
     """獲取文字的嵌入向量
     
+    相同的文字（正規化後）在同一個模型下只會計算一次，之後直接從快取返回。
+    
     Args:
         text (str): 輸入文字
         model_path (str, optional): 模型路徑，用於首次載入
+        use_cache (bool): 是否使用查詢嵌入向量快取
         
     Returns:
-        np.ndarray: 嵌入向量
+        np.ndarray: 嵌入向量，來自快取時為唯讀陣列
     """
     global nlp_model, tokenizer
     
     if not nlp_model:
-        nlp_model, tokenizer = load_model(model_path)
+        # 多個推論執行緒同時首次呼叫時只載入一次模型
+        with _load_lock:
+            if not nlp_model:
+                nlp_model, tokenizer = load_model(model_path)
     
     if not nlp_model:
         print("未載入NLP模型，無法生成嵌入向量")
@@ -69,11 +185,16 @@ def get_text_embedding(text, model_path=None):
         if not text or text.strip() == "":
             return np.zeros(768)  # 使用全零向量表示空文字
         
+        cache_key = (nlp_model_name, normalize_query_text(text))
+        if use_cache:
+            cached = embedding_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
         # 判斷模型類型
         if isinstance(nlp_model, SentenceTransformer):
             # 對於 SentenceTransformer 模型
             embedding = nlp_model.encode(text, convert_to_numpy=True)
-            return embedding
         else:
             # 對於 Hugging Face 模型
             inputs = tokenizer(text, return_tensors="pt", padding=True, truncation=True, max_length=512)
@@ -83,17 +204,80 @@ def get_text_embedding(text, model_path=None):
                 
             # 取最後一層隱藏狀態的平均值作為嵌入向量
             embedding = outputs.last_hidden_state.mean(dim=1).squeeze().numpy()
-            return embedding
+        
+        if use_cache:
+            # 快取中的向量為共用物件，設為唯讀以免被呼叫端修改
+            embedding = np.asarray(embedding, dtype=np.float32)
+            embedding.setflags(write=False)
+            embedding_cache.put(cache_key, embedding)
+        return embedding
     except Exception as e:
         print(f"生成文字嵌入向量時出錯: {str(e)}")
         return None
 
+def get_text_embeddings(texts, model_path=None, batch_size=32):
+    """批次獲取多段文字的嵌入向量
+    
+    Args:
+        texts (list): 文字列表
+        model_path (str, optional): 模型路徑，用於首次載入
+        batch_size (int): 每次送入模型的文字數量
+        
+    Returns:
+        np.ndarray: (N, D) 嵌入向量矩陣，順序與輸入相同；空文字對應全零向量
+    """
+    global nlp_model, tokenizer
+    
+    if not nlp_model:
+        # 多個推論執行緒同時首次呼叫時只載入一次模型
+        with _load_lock:
+            if not nlp_model:
+                nlp_model, tokenizer = load_model(model_path)
+    
+    if not nlp_model:
+        print("未載入NLP模型，無法生成嵌入向量")
+        return None
+    
+    try:
+        texts = list(texts)
+        # 空文字不送入模型，之後以全零向量補上
+        valid_positions = [i for i, text in enumerate(texts) if text and text.strip()]
+        valid_texts = [texts[i] for i in valid_positions]
+        
+        chunks = []
+        if isinstance(nlp_model, SentenceTransformer):
+            # 對於 SentenceTransformer 模型，由其內部分批
+            if valid_texts:
+                chunks.append(nlp_model.encode(valid_texts, batch_size=batch_size, convert_to_numpy=True))
+        else:
+            # 對於 Hugging Face 模型，依注意力遮罩計算平均值，避免補齊的 token 影響結果
+            for start in range(0, len(valid_texts), batch_size):
+                batch = valid_texts[start:start + batch_size]
+                inputs = tokenizer(batch, return_tensors="pt", padding=True, truncation=True, max_length=512)
+                
+                with torch.no_grad():
+                    outputs = nlp_model(**inputs)
+                
+                mask = inputs['attention_mask'].unsqueeze(-1).to(outputs.last_hidden_state.dtype)
+                summed = (outputs.last_hidden_state * mask).sum(dim=1)
+                chunks.append((summed / mask.sum(dim=1).clamp(min=1)).numpy())
+        
+        dim = chunks[0].shape[1] if chunks else 768
+        embeddings = np.zeros((len(texts), dim), dtype=np.float32)
+        if chunks:
+            embeddings[valid_positions] = np.concatenate(chunks)
+        return embeddings
+    except Exception as e:
+        print(f"批次生成文字嵌入向量時出錯: {str(e)}")
+        return None
+
 def search_by_text(query, memes_embeddings, top_k=5):
     """基於文字搜尋最相似的梗圖
     
     Args:
         query (str): 查詢文字
-        memes_embeddings (list): 梗圖嵌入向量列表，每個元素是 (meme_id, embedding) 元組
+        memes_embeddings (list | VectorSearchEngine): 梗圖嵌入向量列表，每個元素是 (meme_id, embedding) 元組，
+            或已建立好的 VectorSearchEngine
         top_k (int): 返回前 k 個結果
         
     Returns:
@@ -106,19 +290,9 @@ def search_by_text(query, memes_embeddings, top_k=5):
     if query_embedding is None:
         return []
     
-    results = []
-    for meme_id, embedding in memes_embeddings:
-        if embedding is None:
-            continue
-            
-        # 計算餘弦相似度
-        similarity = cosine_similarity(query_embedding, np.array(embedding))
-        results.append((meme_id, float(similarity)))
-    
-    # 依相似度降序排序
-    results.sort(key=lambda x: x[1], reverse=True)
-    
-    return results[:top_k]
+    # 以矩陣運算一次計算所有相似度
+    engine = as_search_engine(memes_embeddings)
+    return engine.search(query_embedding, top_k=top_k)
 
 def cosine_similarity(v1, v2):
     """計算兩個向量的餘弦相似度
@@ -0,0 +1,176 @@
+from io import BytesIO
+from PIL import Image
+from models.search_engine import _versions
+
+# dHash 的邊長，產生 HASH_SIZE × HASH_SIZE 位元的雜湊
+HASH_SIZE = 8
+# 漢明距離不超過此值的兩張圖片視為同一張圖片（重新編碼或縮放）
+DEFAULT_DUPLICATE_DISTANCE = 6
+
+def _open_gray(image, size):
+    """開啟圖片並轉為灰階，JPEG 會直接以較小的尺寸解碼"""
+    if isinstance(image, Image.Image):
+        return image.convert('L')
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        image = BytesIO(image)
+
+    position = image.tell() if hasattr(image, 'tell') else None
+    try:
+        with Image.open(image) as img:
+            img.draft('L', size)
+            return img.convert('L')
+    finally:
+        if position is not None:
+            image.seek(position)
+
+def dhash(image, hash_size=HASH_SIZE):
+    """計算圖片的差異雜湊 (dHash)，比較縮小後灰階影像中相鄰像素的亮度
+
+    重新編碼、縮放或輕微調整亮度的圖片會得到相同或漢明距離很小的雜湊。
+
+    Args:
+        image: 圖片路徑 (str)、二進制數據 (bytes)、檔案物件（讀取後移回原位置）或 PIL.Image
+        hash_size (int): 雜湊邊長
+
+    Returns:
+        int: hash_size × hash_size 位元的雜湊值
+    """
+    gray = _open_gray(image, (hash_size * 4, hash_size * 4))
+    pixels = list(gray.resize((hash_size + 1, hash_size), Image.BILINEAR).getdata())
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def format_hash(value, hash_size=HASH_SIZE):
+    """將雜湊值轉為固定長度的十六進位字串"""
+    return format(value, f"0{hash_size * hash_size // 4}x")
+
+def parse_hash(text):
+    """將十六進位字串還原為雜湊值，格式錯誤時返回 None"""
+    try:
+        return int(text, 16) if text else None
+    except (TypeError, ValueError):
+        return None
+
+def hamming_distance(a, b):
+    """兩個雜湊值的漢明距離"""
+    return bin(a ^ b).count('1')
+
+class PerceptualHashIndex:
+    """多索引雜湊表，查詢漢明距離門檻內的雜湊時只需比對少數候選
+
+    將雜湊切成 max_distance + 1 段，依鴿籠原理，距離不超過門檻的兩個雜湊至少有一段完全相同，
+    因此只要查詢每一段的雜湊表，再以漢明距離驗證候選即可。
+    """
+
+    def __init__(self, items=None, max_distance=DEFAULT_DUPLICATE_DISTANCE, bits=HASH_SIZE * HASH_SIZE):
+        """
+        Args:
+            items (iterable, optional): (梗圖ID, 雜湊值) 元組的集合
+            max_distance (int): 支援查詢的最大漢明距離
+            bits (int): 雜湊位元數
+        """
+        self.max_distance = max_distance
+        count = max_distance + 1
+        bounds = [bits * i // count for i in range(count + 1)]
+        self._segments = [(start, (1 << (end - start)) - 1) for start, end in zip(bounds, bounds[1:])]
+        self._tables = [{} for _ in self._segments]
+        self._hashes = {}
+        for meme_id, value in items or []:
+            self.add(meme_id, value)
+        self.version = next(_versions)
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def __contains__(self, meme_id):
+        return meme_id in self._hashes
+
+    def copy(self):
+        """複製索引，更新副本不會影響正在查詢的原索引"""
+        index = PerceptualHashIndex.__new__(PerceptualHashIndex)
+        index.max_distance = self.max_distance
+        index._segments = self._segments
+        index._tables = [{key: list(bucket) for key, bucket in table.items()} for table in self._tables]
+        index._hashes = dict(self._hashes)
+        index.version = self.version
+        return index
+
+    def _keys(self, value):
+        return [(value >> start) & mask for start, mask in self._segments]
+
+    def add(self, meme_id, value):
+        """加入或更新梗圖的雜湊值
+
+        Args:
+            meme_id (int): 梗圖ID
+            value (int): 雜湊值，None 時視為移除
+        """
+        self.remove(meme_id)
+        if value is None:
+            return
+        self._hashes[meme_id] = value
+        for table, key in zip(self._tables, self._keys(value)):
+            table.setdefault(key, []).append(meme_id)
+        self.version = next(_versions)
+
+    def remove(self, meme_id):
+        """移除梗圖的雜湊值
+
+        Args:
+            meme_id (int): 梗圖ID
+        """
+        value = self._hashes.pop(meme_id, None)
+        if value is None:
+            return
+        for table, key in zip(self._tables, self._keys(value)):
+            bucket = table[key]
+            bucket.remove(meme_id)
+            if not bucket:
+                del table[key]
+        self.version = next(_versions)
+
+    def find(self, value, max_distance=None):
+        """查詢距離門檻內的梗圖
+
+        Args:
+            value (int): 查詢的雜湊值
+            max_distance (int, optional): 漢明距離門檻，不可超過建立索引時的 max_distance
+
+        Returns:
+            list: 包含 (距離, 梗圖ID) 元組的列表，按距離由近到遠排序
+        """
+        if value is None:
+            return []
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+
+        results = []
+        seen = set()
+        for table, key in zip(self._tables, self._keys(value)):
+            for meme_id in table.get(key, ()):
+                if meme_id in seen:
+                    continue
+                seen.add(meme_id)
+                distance = hamming_distance(value, self._hashes[meme_id])
+                if distance <= max_distance:
+                    results.append((distance, meme_id))
+
+        results.sort()
+        return results
+
+    def find_one(self, value, max_distance=None):
+        """查詢距離最近的梗圖
+
+        Args:
+            value (int): 查詢的雜湊值
+            max_distance (int, optional): 漢明距離門檻
+
+        Returns:
+            int: 梗圖ID，沒有符合的梗圖時返回 None
+        """
+        results = self.find(value, max_distance)
+        return results[0][1] if results else None
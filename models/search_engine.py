@@ -0,0 +1,269 @@
+import itertools
+import numpy as np
+
+# 索引每次變更都取得一個新的版本號，供結果快取判斷索引是否已更新
+_versions = itertools.count(1)
+
+class VectorSearchEngine:
+    """以單一矩陣進行餘弦相似度搜尋的向量搜尋引擎
+
+    所有向量在建立時即轉換為 float32 並做 L2 正規化，存放於一個 (N, D) 矩陣中，
+    查詢時只需一次矩陣向量乘法即可得到全部相似度，再以 np.argpartition 取出前 k 名。
+    """
+
+    def __init__(self, items=None, dtype=np.float32):
+        """
+        Args:
+            items (iterable, optional): (meme_id, 向量) 元組的集合
+            dtype: 矩陣的資料型態
+        """
+        self.dtype = dtype
+        self.ids = []
+        self.matrix = np.zeros((0, 0), dtype=dtype)
+        self.version = next(_versions)
+        # 矩陣是否與其他副本共用，共用時就地修改前必須先複製
+        self._shared = False
+        if items is not None:
+            self.build(items)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def dim(self):
+        """向量維度，空索引時為 0"""
+        return self.matrix.shape[1] if self.matrix.ndim == 2 else 0
+
+    def build(self, items):
+        """以 (meme_id, 向量) 元組重新建立整個索引
+
+        維度與第一個有效向量不同的項目會被略過（例如切換模型後尚未重新生成的梗圖）。
+
+        Args:
+            items (iterable): (meme_id, 向量) 元組的集合，向量可為列表或 np.ndarray
+        """
+        ids = []
+        vectors = []
+        dim = None
+        for meme_id, vector in items:
+            if vector is None:
+                continue
+            vector = np.asarray(vector, dtype=self.dtype).reshape(-1)
+            if vector.size == 0:
+                continue
+            if dim is None:
+                dim = vector.size
+            elif vector.size != dim:
+                print(f"梗圖 {meme_id} 的向量維度 {vector.size} 與索引維度 {dim} 不符，已略過")
+                continue
+            ids.append(meme_id)
+            vectors.append(vector)
+
+        self.ids = ids
+        if vectors:
+            self.matrix = normalize_rows(np.stack(vectors))
+        else:
+            self.matrix = np.zeros((0, 0), dtype=self.dtype)
+        self._shared = False
+        self.version = next(_versions)
+
+    @classmethod
+    def from_matrix(cls, ids, matrix, dtype=np.float32):
+        """直接由 (N, D) 矩陣建立索引，不需逐筆轉換向量
+
+        Args:
+            ids (list): 梗圖ID列表，順序與矩陣的列相同
+            matrix (np.ndarray): 向量矩陣
+
+        Returns:
+            VectorSearchEngine: 搜尋引擎
+        """
+        engine = cls(dtype=dtype)
+        if len(ids):
+            engine.ids = list(ids)
+            engine.matrix = normalize_rows(np.asarray(matrix, dtype=dtype))
+        return engine
+
+    def copy(self):
+        """複製索引，用於在其他執行緒仍在搜尋時更新索引（寫入時複製）
+
+        副本與原索引共用ID列表與矩陣，兩者都不會就地修改共用的部分：新增與移除向量本來就會產生新矩陣，
+        只有覆寫既有向量時才複製矩陣，增量同步不必每次複製整個 (N, D) 矩陣。
+
+        Returns:
+            VectorSearchEngine: 與原索引內容相同、互不影響的新索引
+        """
+        engine = VectorSearchEngine(dtype=self.dtype)
+        engine.ids = self.ids
+        engine.matrix = self.matrix
+        engine.version = self.version
+        self._shared = engine._shared = True
+        return engine
+
+    def upsert(self, items):
+        """新增或更新索引中的向量，已存在的 meme_id 會被覆寫
+
+        Args:
+            items (iterable): (meme_id, 向量) 元組的集合，向量為 None 時視為移除
+        """
+        removed = []
+        updates = {}
+        for meme_id, vector in items:
+            if vector is None:
+                removed.append(meme_id)
+                continue
+            vector = np.asarray(vector, dtype=self.dtype).reshape(-1)
+            if vector.size == 0:
+                removed.append(meme_id)
+                continue
+            updates[meme_id] = vector
+
+        if removed:
+            self.remove(removed)
+        if not updates:
+            return
+
+        if not self.ids:
+            self.build(updates.items())
+            return
+
+        positions = {meme_id: i for i, meme_id in enumerate(self.ids)}
+        mismatched = []
+        replaced = []
+        new_ids = []
+        new_vectors = []
+        for meme_id, vector in updates.items():
+            if vector.size != self.dim:
+                print(f"梗圖 {meme_id} 的向量維度 {vector.size} 與索引維度 {self.dim} 不符，已略過")
+                mismatched.append(meme_id)
+                continue
+            vector = normalize_rows(vector[np.newaxis, :])[0]
+            if meme_id in positions:
+                replaced.append((positions[meme_id], vector))
+            else:
+                new_ids.append(meme_id)
+                new_vectors.append(vector)
+
+        if new_ids:
+            # 以新矩陣取代，共用的矩陣保持不變
+            self.ids = self.ids + new_ids
+            self.matrix = np.vstack([self.matrix, np.stack(new_vectors)])
+            self._shared = False
+        elif replaced and self._shared:
+            self.matrix = self.matrix.copy()
+            self._shared = False
+        for position, vector in replaced:
+            self.matrix[position] = vector
+        if mismatched:
+            self.remove(mismatched)
+        self.version = next(_versions)
+
+    def remove(self, meme_ids):
+        """從索引中移除向量
+
+        Args:
+            meme_ids (iterable): 要移除的梗圖ID
+        """
+        meme_ids = set(meme_ids)
+        if not meme_ids or not self.ids:
+            return
+
+        keep = np.array([meme_id not in meme_ids for meme_id in self.ids], dtype=bool)
+        if keep.all():
+            return
+
+        self.ids = [meme_id for meme_id, kept in zip(self.ids, keep) if kept]
+        self.matrix = self.matrix[keep]
+        self._shared = False
+        self.version = next(_versions)
+
+    def scores(self, query_vector):
+        """計算查詢向量與索引中所有向量的餘弦相似度
+
+        Args:
+            query_vector: 查詢向量
+
+        Returns:
+            np.ndarray: 長度為 N 的相似度陣列，維度不符時返回 None
+        """
+        query = np.asarray(query_vector, dtype=self.dtype).reshape(-1)
+        if query.size != self.dim:
+            print(f"查詢向量維度 {query.size} 與索引維度 {self.dim} 不符")
+            return None
+
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return np.zeros(len(self.ids), dtype=self.dtype)
+
+        return self.matrix @ (query / norm)
+
+    def search(self, query_vector, top_k=5):
+        """搜尋最相似的向量
+
+        Args:
+            query_vector: 查詢向量
+            top_k (int): 返回前 k 個結果
+
+        Returns:
+            list: 包含 (meme_id, 相似度分數) 元組的列表，按相似度從高到低排序
+        """
+        if not self.ids or top_k <= 0:
+            return []
+
+        scores = self.scores(query_vector)
+        if scores is None:
+            return []
+
+        top_indices = top_k_indices(scores, top_k)
+        return [(self.ids[i], float(scores[i])) for i in top_indices]
+
+def is_search_engine(items):
+    """判斷是否為已建立的搜尋引擎（VectorSearchEngine 或介面相同的 ANN 索引），而非向量列表"""
+    return hasattr(items, 'search')
+
+def as_search_engine(items):
+    """將 (meme_id, 向量) 元組列表轉換為搜尋引擎，已是搜尋引擎則直接返回
+
+    Args:
+        items (list | VectorSearchEngine): 向量列表或搜尋引擎（包含介面相同的 IVFSearchEngine）
+
+    Returns:
+        VectorSearchEngine: 搜尋引擎
+    """
+    if is_search_engine(items):
+        return items
+    return VectorSearchEngine(items)
+
+def normalize_rows(matrix):
+    """對矩陣的每一列做 L2 正規化，零向量維持為零
+
+    Args:
+        matrix (np.ndarray): (N, D) 矩陣
+
+    Returns:
+        np.ndarray: 正規化後的矩陣
+    """
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+def top_k_indices(scores, top_k):
+    """以 np.argpartition 取出分數最高的 k 個索引，並依分數由高到低排序
+
+    Args:
+        scores (np.ndarray): 分數陣列
+        top_k (int): 取出的數量
+
+    Returns:
+        np.ndarray: 索引陣列
+    """
+    k = min(top_k, len(scores))
+    if k <= 0:
+        return np.array([], dtype=np.int64)
+
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
@@ -1,84 +1,370 @@
 import numpy as np
 import os
-import tempfile
+import hashlib
 import requests
 from PIL import Image
-from models.nlp_model import get_text_embedding, search_by_text, cosine_similarity
+from models import nlp_model as nlp_module, cv_model as cv_module
+from models.nlp_model import get_text_embedding, search_by_text, cosine_similarity, normalize_query_text
 from models.cv_model import get_image_features, search_by_image
+from models.search_engine import VectorSearchEngine, as_search_engine, is_search_engine
+from models.perceptual_hash import PerceptualHashIndex, dhash, parse_hash, HASH_SIZE
+from models.lexical_index import BM25Index
+from models.cache import LRUCache
 
-def find_similar_memes_by_text(query_text, memes, top_k=5):
+# 查詢圖片與梗圖的感知雜湊距離不超過此值時，直接視為同一張梗圖而不執行CV模型
+DEFAULT_QUERY_HASH_DISTANCE = 4
+
+# 文字查詢時 BM25 分數所佔的權重，融合前向量搜尋與 BM25 各取 top_k 的幾倍作為候選
+DEFAULT_LEXICAL_WEIGHT = 0.3
+LEXICAL_CANDIDATE_FACTOR = 4
+
+# 推薦結果快取，鍵包含查詢內容、參數、索引版本與模型名稱，索引或模型變更後舊結果自然失效
+DEFAULT_RESULT_CACHE_SIZE = 512
+result_cache = LRUCache(maxsize=DEFAULT_RESULT_CACHE_SIZE)
+
+def configure_result_cache(maxsize=None, ttl=None):
+    """設定推薦結果快取
+    
+    Args:
+        maxsize (int, optional): 最多保存的結果數量
+        ttl (float, optional): 結果存活秒數，None 表示不過期
+        
+    Returns:
+        LRUCache: 新的快取
+    """
+    global result_cache
+    result_cache = LRUCache(maxsize=maxsize or DEFAULT_RESULT_CACHE_SIZE, ttl=ttl)
+    return result_cache
+
+def hash_query_image(image_data, chunk_size=65536):
+    """計算查詢圖片內容的雜湊值，作為結果快取的鍵
+    
+    Args:
+        image_data: 圖片數據，可以是路徑、URL、二進制數據、檔案物件或 PIL.Image
+        chunk_size (int): 讀取檔案時每次讀取的位元組數
+        
+    Returns:
+        str: 雜湊值，無法判斷時返回 None
+    """
+    if image_data is None:
+        return None
+    
+    try:
+        digest = hashlib.sha256()
+        if isinstance(image_data, (bytes, bytearray, memoryview)):
+            digest.update(image_data)
+        elif isinstance(image_data, str) and os.path.exists(image_data):
+            with open(image_data, 'rb') as f:
+                for chunk in iter(lambda: f.read(chunk_size), b''):
+                    digest.update(chunk)
+        elif isinstance(image_data, str):
+            # URL 的內容可能改變，無法安全快取
+            return None
+        elif isinstance(image_data, Image.Image):
+            digest.update(f"{image_data.mode}:{image_data.size}".encode('utf-8'))
+            digest.update(image_data.tobytes())
+        elif hasattr(image_data, 'read') and hasattr(image_data, 'seek'):
+            # 檔案物件讀完後回到原位置，供之後的特徵提取使用
+            position = image_data.tell()
+            for chunk in iter(lambda: image_data.read(chunk_size), b''):
+                digest.update(chunk)
+            image_data.seek(position)
+        else:
+            return None
+        return digest.hexdigest()
+    except OSError as e:
+        print(f"計算查詢圖片雜湊值時出錯: {str(e)}")
+        return None
+
+def index_versions(text_index, image_index):
+    """取得文字與圖片索引目前的版本號，作為目錄版本"""
+    return (
+        text_index.version if text_index is not None else None,
+        image_index.version if image_index is not None else None,
+    )
+
+def _recommend_cache_key(query_text, image_hash, top_k, weight_text, catalog_version):
+    """組合推薦結果快取的鍵"""
+    return (
+        normalize_query_text(query_text) if query_text else None,
+        image_hash,
+        top_k,
+        weight_text if query_text and image_hash else None,
+        catalog_version,
+        nlp_module.nlp_model_name if query_text else None,
+        cv_module.cv_model_name if image_hash else None,
+    )
+
+def get_result_cache_stats():
+    """推薦結果快取的統計資訊
+    
+    Returns:
+        dict: 包含項目數量、命中與未命中次數及命中率
+    """
+    return result_cache.stats()
+
+def build_meme_indexes(memes):
+    """由梗圖列表建立文字與圖片向量索引
+    
+    Args:
+        memes (list): 梗圖列表，每個元素是一個包含 'id'、'embedding' 和 'image_features' 的字典
+        
+    Returns:
+        tuple: (文字索引, 圖片索引) 元組，皆為 VectorSearchEngine
+    """
+    memes = memes or []
+    text_index = VectorSearchEngine((meme['id'], meme['embedding']) for meme in memes if meme.get('embedding'))
+    image_index = VectorSearchEngine((meme['id'], meme['image_features']) for meme in memes if meme.get('image_features'))
+    return text_index, image_index
+
+def build_meme_indexes_from_vectors(vectors):
+    """由向量匯出資料建立文字與圖片向量索引
+    
+    Args:
+        vectors (dict): 名稱 -> (梗圖ID列表, 矩陣) 的對應，名稱為 'embedding' 與 'image_features'
+        
+    Returns:
+        tuple: (文字索引, 圖片索引) 元組，皆為 VectorSearchEngine
+    """
+    indexes = []
+    for name in ('embedding', 'image_features'):
+        ids, matrix = vectors.get(name, ([], None))
+        indexes.append(VectorSearchEngine.from_matrix(ids, matrix))
+    return tuple(indexes)
+
+def build_meme_hash_index(memes):
+    """由梗圖列表建立感知雜湊索引
+    
+    Args:
+        memes (list): 梗圖列表，每個元素是一個包含 'id' 和 'perceptual_hash' 的字典
+        
+    Returns:
+        PerceptualHashIndex: 感知雜湊索引
+    """
+    return PerceptualHashIndex(
+        (meme['id'], parse_hash(meme.get('perceptual_hash'))) for meme in memes or [] if meme.get('perceptual_hash')
+    )
+
+def build_meme_lexical_index(memes):
+    """由梗圖列表建立關鍵字與標題的 BM25 倒排索引
+    
+    Args:
+        memes (list): 梗圖列表，每個元素是一個包含 'id'、'title' 和 'keywords' 的字典
+        
+    Returns:
+        BM25Index: 倒排索引
+    """
+    return BM25Index((meme['id'], meme.get('title'), meme.get('keywords')) for meme in memes or [])
+
+def update_meme_indexes(text_index, image_index, changed_ids, vectors, deleted_ids=None):
+    """將增量同步得到的變更套用到既有的向量索引
+    
+    Args:
+        text_index (VectorSearchEngine): 文字索引
+        image_index (VectorSearchEngine): 圖片索引
+        changed_ids (list): 新增或更新的梗圖ID列表
+        vectors (dict): 變更梗圖的向量匯出資料，名稱 -> (梗圖ID列表, 矩陣)
+        deleted_ids (list, optional): 已刪除的梗圖ID列表
+    """
+    for index, name in ((text_index, 'embedding'), (image_index, 'image_features')):
+        ids, matrix = vectors.get(name, ([], None))
+        
+        # 已刪除或已不再有向量的梗圖從索引中移除
+        present = set(ids)
+        stale = [meme_id for meme_id in changed_ids if meme_id not in present]
+        index.remove(list(deleted_ids or []) + stale)
+        
+        if ids:
+            index.upsert(zip(ids, matrix))
+
+def find_exact_keyword_matches(query_text, lexical_index, top_k=5):
+    """找出關鍵字或標題與查詢完全相同的梗圖
+    
+    Args:
+        query_text (str): 查詢文字
+        lexical_index (BM25Index): 關鍵字倒排索引
+        top_k (int): 返回前k個結果
+        
+    Returns:
+        list: 包含 (meme_id, 相似度分數) 元組的列表，依 BM25 分數排序，沒有完全相同的關鍵字時為空列表
+    """
+    if not query_text or not lexical_index:
+        return []
+    
+    matches = lexical_index.exact_matches(query_text)
+    if not matches:
+        return []
+    
+    scores = lexical_index.scores(query_text)
+    ranked = sorted(matches, key=lambda meme_id: scores.get(meme_id, 0.0), reverse=True)
+    return [(meme_id, 1.0) for meme_id in ranked[:top_k]]
+
+def fuse_lexical_scores(query_text, vector_results, lexical_index, top_k=5, weight=DEFAULT_LEXICAL_WEIGHT):
+    """將向量相似度與 BM25 分數加權融合
+    
+    BM25 分數除以本次查詢的最高分正規化到 0~1，只出現在其中一方候選中的梗圖，另一方的分數以 0 計。
+    
+    Args:
+        query_text (str): 查詢文字
+        vector_results (list): 向量搜尋結果，包含 (meme_id, 相似度分數) 元組
+        lexical_index (BM25Index): 關鍵字倒排索引
+        top_k (int): 返回前k個結果
+        weight (float): BM25 分數的權重 (0~1)
+        
+    Returns:
+        list: 包含 (meme_id, 分數) 元組的列表，按分數從高到低排序
+    """
+    lexical_results = lexical_index.search(query_text, top_k=top_k * LEXICAL_CANDIDATE_FACTOR) if lexical_index else []
+    if not lexical_results:
+        return vector_results[:top_k]
+    
+    best = lexical_results[0][1]
+    combined = {meme_id: (1 - weight) * score for meme_id, score in vector_results}
+    for meme_id, score in lexical_results:
+        combined[meme_id] = combined.get(meme_id, 0.0) + weight * score / best
+    
+    return sorted(combined.items(), key=lambda x: x[1], reverse=True)[:top_k]
+
+def _resolve_query_vector(query_vector):
+    """取得預先計算的查詢向量，傳入函數時才在此呼叫（例如交由推論服務的微批次執行模型）"""
+    return query_vector() if callable(query_vector) else query_vector
+
+def find_similar_memes_by_text(query_text, memes, top_k=5, lexical_index=None, query_embedding=None):
     """基於文字查詢找出最相似的梗圖
     
+    提供關鍵字倒排索引時，查詢與梗圖關鍵字完全相同時直接返回而不執行NLP模型，
+    否則將向量相似度與 BM25 分數融合。
+    
     Args:
         query_text (str): 查詢文字
-        memes (list): 梗圖列表，每個元素是一個包含 'id' 和 'embedding' 的字典
+        memes (list | VectorSearchEngine): 梗圖列表，每個元素是一個包含 'id' 和 'embedding' 的字典，
+            或已建立好的文字索引
         top_k (int): 返回前k個結果
+        lexical_index (BM25Index, optional): 關鍵字倒排索引
+        query_embedding (np.ndarray | callable, optional): 查詢文字的嵌入向量，或需要時才呼叫、返回嵌入向量的函數；
+            未提供時以本程序的NLP模型計算
         
     Returns:
         list: 包含 (meme_id, 相似度分數) 元組的列表，按相似度從高到低排序
     """
-    if not query_text or not memes:
+    if not query_text or (not memes and not lexical_index):
         return []
     
-    # 過濾掉沒有嵌入向量的梗圖
-    valid_memes = [(meme['id'], meme['embedding']) for meme in memes if meme.get('embedding')]
+    exact = find_exact_keyword_matches(query_text, lexical_index, top_k=top_k)
+    if exact:
+        return exact
+    
+    if is_search_engine(memes) or not memes:
+        valid_memes = memes
+    else:
+        # 過濾掉沒有嵌入向量的梗圖
+        valid_memes = [(meme['id'], meme['embedding']) for meme in memes if meme.get('embedding')]
     
-    # 使用NLP模型搜尋相似梗圖
-    return search_by_text(query_text, valid_memes, top_k=top_k)
+    # 使用NLP模型搜尋相似梗圖，有倒排索引時多取候選再與 BM25 分數融合
+    candidates = top_k * LEXICAL_CANDIDATE_FACTOR if lexical_index else top_k
+    if query_embedding is None:
+        results = search_by_text(query_text, valid_memes, top_k=candidates)
+    else:
+        embedding = _resolve_query_vector(query_embedding)
+        results = as_search_engine(valid_memes).search(embedding, top_k=candidates) \
+            if embedding is not None and valid_memes else []
+    return fuse_lexical_scores(query_text, results, lexical_index, top_k=top_k)
 
-def find_similar_memes_by_image(image_data, memes, top_k=5):
+def load_query_image(image_data, timeout=10):
+    """將查詢圖片轉換為 get_image_features 可直接使用的形式，不寫入臨時檔案
+    
+    Args:
+        image_data: 圖片數據，可以是路徑、URL、二進制數據、檔案物件或 PIL.Image
+        timeout (float): 下載URL圖片的逾時秒數
+        
+    Returns:
+        路徑、二進制數據、檔案物件或 PIL.Image，無法取得時返回 None
+    """
+    if isinstance(image_data, str):
+        if os.path.exists(image_data):
+            # 本地文件路徑
+            return image_data
+        if image_data.startswith(('http://', 'https://')):
+            # 網絡URL，直接讀入記憶體
+            response = requests.get(image_data, timeout=timeout)
+            if response.status_code == 200:
+                return response.content
+            print(f"下載查詢圖片失敗: HTTP {response.status_code}")
+        return None
+    # 二進制數據、檔案物件或 PIL.Image
+    return image_data
+
+def find_memes_by_perceptual_hash(image, hash_index, top_k=5, max_distance=DEFAULT_QUERY_HASH_DISTANCE):
+    """以感知雜湊找出與查詢圖片相同（重新編碼、縮放）的梗圖
+    
+    Args:
+        image: 圖片路徑、二進制數據、檔案物件或 PIL.Image
+        hash_index (PerceptualHashIndex): 梗圖的感知雜湊索引
+        top_k (int): 返回前k個結果
+        max_distance (int): 視為同一張圖片的最大漢明距離
+        
+    Returns:
+        list: 包含 (meme_id, 相似度分數) 元組的列表，沒有相同的梗圖時為空列表
+    """
+    if image is None or not hash_index:
+        return []
+    
+    try:
+        value = dhash(image)
+    except Exception as e:
+        print(f"計算查詢圖片感知雜湊時出錯: {str(e)}")
+        return []
+    
+    bits = HASH_SIZE * HASH_SIZE
+    return [(meme_id, 1.0 - distance / bits) for distance, meme_id in hash_index.find(value, max_distance)[:top_k]]
+
+def find_similar_memes_by_image(image_data, memes, top_k=5, hash_index=None, query_features=None):
     """基於圖片查詢找出最相似的梗圖
     
+    提供感知雜湊索引時，先檢查查詢圖片是否就是目錄中的梗圖，是的話直接返回而不執行CV模型。
+    
     Args:
-        image_data: 圖片數據，可以是路徑、URL或二進制數據
-        memes (list): 梗圖列表，每個元素是一個包含 'id' 和 'image_features' 的字典
+        image_data: 圖片數據，可以是路徑、URL、二進制數據、檔案物件或 PIL.Image
+        memes (list | VectorSearchEngine): 梗圖列表，每個元素是一個包含 'id' 和 'image_features' 的字典，
+            或已建立好的圖片索引
         top_k (int): 返回前k個結果
+        hash_index (PerceptualHashIndex, optional): 梗圖的感知雜湊索引
+        query_features (np.ndarray | callable, optional): 查詢圖片的特徵向量，或需要時才呼叫、返回特徵向量的函數；
+            未提供時以本程序的CV模型計算
         
     Returns:
         list: 包含 (meme_id, 相似度分數) 元組的列表，按相似度從高到低排序
     """
-    if not image_data or not memes:
+    if image_data is None or (not memes and not hash_index):
         return []
     
-    # 過濾掉沒有圖片特徵的梗圖
-    valid_memes = [(meme['id'], meme['image_features']) for meme in memes if meme.get('image_features')]
-    
-    # 處理不同類型的圖片數據
-    image_path = None
-    temp_file = None
+    if is_search_engine(memes) or not memes:
+        valid_memes = memes
+    else:
+        # 過濾掉沒有圖片特徵的梗圖
+        valid_memes = [(meme['id'], meme['image_features']) for meme in memes if meme.get('image_features')]
     
     try:
-        if isinstance(image_data, str):
-            if os.path.exists(image_data):
-                # 本地文件路徑
-                image_path = image_data
-            elif image_data.startswith(('http://', 'https://')):
-                # 網絡URL
-                temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg')
-                response = requests.get(image_data, stream=True)
-                if response.status_code == 200:
-                    with open(temp_file.name, 'wb') as f:
-                        for chunk in response.iter_content(1024):
-                            f.write(chunk)
-                    image_path = temp_file.name
-        else:
-            # 二進制數據
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg')
-            with open(temp_file.name, 'wb') as f:
-                f.write(image_data)
-            image_path = temp_file.name
-        
-        # 使用CV模型搜尋相似梗圖
-        if image_path:
-            results = search_by_image(image_path, valid_memes, top_k=top_k)
-            return results
-        else:
-            return []
+        image = load_query_image(image_data)
+    except Exception as e:
+        print(f"讀取查詢圖片時出錯: {str(e)}")
+        return []
     
-    finally:
-        # 清理臨時文件
-        if temp_file and os.path.exists(temp_file.name):
-            os.unlink(temp_file.name)
+    if image is None:
+        return []
+    
+    # 轉貼目錄中既有梗圖的查詢直接由感知雜湊找到
+    duplicates = find_memes_by_perceptual_hash(image, hash_index, top_k=top_k)
+    if duplicates:
+        return duplicates
+    
+    # 使用CV模型搜尋相似梗圖
+    if query_features is None:
+        return search_by_image(image, valid_memes, top_k=top_k)
+    features = _resolve_query_vector(query_features)
+    if features is None or not valid_memes:
+        return []
+    return as_search_engine(valid_memes).search(features, top_k=top_k)
 
 def combine_search_results(text_results, image_results, weight_text=0.5, top_k=5):
     """結合文字和圖片搜尋結果
@@ -119,32 +405,70 @@ def combine_search_results(text_results, image_results, weight_text=0.5, top_k=5
     
     return results[:top_k]
 
-def recommend_memes(query_text=None, query_image=None, memes=None, top_k=5, weight_text=0.5):
+def recommend_memes(query_text=None, query_image=None, memes=None, top_k=5, weight_text=0.5,
+                    text_index=None, image_index=None, use_cache=True, hash_index=None, lexical_index=None,
+                    query_embedding=None, query_features=None, return_scores=False):
     """推薦梗圖
     
+    使用預建索引時，相同的查詢（文字正規化後相同、圖片內容相同）在索引與模型未變更前直接返回快取的結果。
+    
     Args:
         query_text (str, optional): 查詢文字
-        query_image: 查詢圖片
-        memes (list): 梗圖列表
+        query_image: 查詢圖片，可以是路徑、URL、二進制數據、檔案物件或 PIL.Image
+        memes (list): 梗圖列表，未提供預建索引時用於建立索引
         top_k (int): 返回前k個結果
         weight_text (float): 文字搜尋結果的權重 (0~1)
+        text_index (VectorSearchEngine, optional): 預先建立的文字索引
+        image_index (VectorSearchEngine, optional): 預先建立的圖片索引
+        use_cache (bool): 是否使用推薦結果快取
+        hash_index (PerceptualHashIndex, optional): 梗圖的感知雜湊索引，圖片查詢時先比對是否為既有梗圖
+        lexical_index (BM25Index, optional): 關鍵字倒排索引，文字查詢時與向量相似度融合
+        query_embedding (np.ndarray | callable, optional): 查詢文字的嵌入向量，或需要時才呼叫的函數
+        query_features (np.ndarray | callable, optional): 查詢圖片的特徵向量，或需要時才呼叫的函數
+        return_scores (bool): 是否連同分數返回
         
     Returns:
-        list: 推薦梗圖ID列表
+        list: 推薦梗圖ID列表；return_scores 為 True 時為 (meme_id, 分數) 元組的列表
     """
-    if not memes:
-        return []
+    if text_index is None and image_index is None:
+        if not memes:
+            return []
+        # 臨時建立的索引每次版本都不同，快取不會命中
+        use_cache = False
+        text_index, image_index = build_meme_indexes(memes)
+    
+    image_hash = None
+    if use_cache and query_image:
+        image_hash = hash_query_image(query_image)
+        # 無法計算雜湊值的圖片（例如URL）不使用快取
+        use_cache = image_hash is not None
+    
+    # 在搜尋前記下索引版本，搜尋期間索引若被更新，結果會記在舊版本下而不會被誤用
+    catalog_version = index_versions(text_index, image_index) + (
+        lexical_index.version if lexical_index is not None else None,
+        hash_index.version if hash_index is not None else None,
+    )
+    if use_cache:
+        cached = result_cache.get(_recommend_cache_key(
+            query_text, image_hash, top_k, weight_text, catalog_version
+        ))
+        if cached is not None:
+            return list(cached) if return_scores else [meme_id for meme_id, _ in cached]
     
     text_results = []
     image_results = []
     
     # 文字搜尋
-    if query_text:
-        text_results = find_similar_memes_by_text(query_text, memes, top_k=top_k)
+    if query_text and text_index is not None:
+        text_results = find_similar_memes_by_text(
+            query_text, text_index, top_k=top_k, lexical_index=lexical_index, query_embedding=query_embedding
+        )
     
     # 圖片搜尋
-    if query_image:
-        image_results = find_similar_memes_by_image(query_image, memes, top_k=top_k)
+    if query_image and image_index is not None:
+        image_results = find_similar_memes_by_image(
+            query_image, image_index, top_k=top_k, hash_index=hash_index, query_features=query_features
+        )
     
     # 組合結果
     if query_text and query_image:
@@ -156,5 +480,13 @@ def recommend_memes(query_text=None, query_image=None, memes=None, top_k=5, weig
     else:
         return []
     
+    results = [(meme_id, score) for meme_id, score in results]
+    
+    # 空結果可能來自模型載入失敗，不寫入快取；模型可能在這次查詢中才載入，因此重新計算鍵
+    if use_cache and results:
+        result_cache.put(_recommend_cache_key(
+            query_text, image_hash, top_k, weight_text, catalog_version
+        ), tuple(results))
+    
     # 返回梗圖ID列表
-    return [meme_id for meme_id, _ in results]
\ No newline at end of file
+    return results if return_scores else [meme_id for meme_id, _ in results]
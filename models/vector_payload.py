@@ -0,0 +1,119 @@
+import json
+import struct
+import numpy as np
+
+# 向量匯出格式：
+#   4 位元組標記 + uint16 版本 + uint32 標頭長度 + JSON 標頭（補齊至 64 位元組）+ 各矩陣的原始資料
+# 標頭中的 matrices 記錄每個矩陣的梗圖ID、資料型態、形狀與相對於資料區起點的偏移量，
+# 每個矩陣都對齊 64 位元組，讀取端可直接以 np.frombuffer 零複製取得矩陣。
+PAYLOAD_MAGIC = b'MMVP'
+PAYLOAD_VERSION = 1
+PAYLOAD_PREFIX = struct.Struct('<4sHI')
+PAYLOAD_ALIGNMENT = 64
+PAYLOAD_CONTENT_TYPE = 'application/x-meme-vectors'
+
+def _padding(size):
+    return (-size) % PAYLOAD_ALIGNMENT
+
+def build_payload_header(matrices, dtype='<f4', **metadata):
+    """建立向量匯出的標頭
+
+    Args:
+        matrices (dict): 名稱 -> (梗圖ID列表, 向量維度) 的對應
+        dtype (str): 矩陣的資料型態
+        **metadata: 其他要寫入標頭的資訊（例如 sync_time、deleted）
+
+    Returns:
+        tuple: (標頭位元組, 資料區總長度) 元組
+    """
+    dtype = np.dtype(dtype)
+    offset = 0
+    entries = {}
+    for name, (ids, dim) in matrices.items():
+        size = len(ids) * dim * dtype.itemsize
+        entries[name] = {
+            'ids': list(ids),
+            'dtype': dtype.str,
+            'shape': [len(ids), dim],
+            'offset': offset,
+        }
+        offset += size + _padding(size)
+
+    header = json.dumps({'version': PAYLOAD_VERSION, 'matrices': entries, **metadata}).encode('utf-8')
+    prefix = PAYLOAD_PREFIX.pack(PAYLOAD_MAGIC, PAYLOAD_VERSION, len(header))
+    header_block = prefix + header
+    header_block += b'\0' * _padding(len(header_block))
+    return header_block, offset
+
+def iter_payload(matrices, dtype='<f4', chunk_rows=256, **metadata):
+    """以串流方式產生向量匯出資料
+
+    Args:
+        matrices (dict): 名稱 -> (梗圖ID列表, 向量列表) 的對應，向量列表中每個元素為 np.ndarray
+        dtype (str): 輸出的資料型態
+        chunk_rows (int): 每次輸出的向量數量
+        **metadata: 其他要寫入標頭的資訊
+
+    Yields:
+        bytes: 依序為標頭與各矩陣的資料片段
+    """
+    dtype = np.dtype(dtype)
+    shapes = {}
+    for name, (ids, vectors) in matrices.items():
+        dim = vectors[0].size if vectors else 0
+        shapes[name] = (ids, dim)
+
+    header, _ = build_payload_header(shapes, dtype=dtype, **metadata)
+    yield header
+
+    for name, (ids, vectors) in matrices.items():
+        size = 0
+        for start in range(0, len(vectors), chunk_rows):
+            chunk = np.stack(vectors[start:start + chunk_rows]).astype(dtype, copy=False)
+            data = chunk.tobytes()
+            size += len(data)
+            yield data
+        if _padding(size):
+            yield b'\0' * _padding(size)
+
+def payload_size(matrices, dtype='<f4', **metadata):
+    """計算 iter_payload 輸出的總位元組數"""
+    shapes = {}
+    for name, (ids, vectors) in matrices.items():
+        shapes[name] = (ids, vectors[0].size if vectors else 0)
+    header, data_size = build_payload_header(shapes, dtype=dtype, **metadata)
+    return len(header) + data_size
+
+def decode_payload(data):
+    """解析向量匯出資料
+
+    Args:
+        data (bytes): 匯出資料
+
+    Returns:
+        tuple: (標頭字典, 名稱 -> (梗圖ID列表, 矩陣) 的對應)，矩陣為唯讀的零複製檢視
+    """
+    buffer = memoryview(data)
+    magic, version, header_length = PAYLOAD_PREFIX.unpack_from(buffer)
+    if magic != PAYLOAD_MAGIC:
+        raise ValueError("不是有效的向量匯出資料")
+    if version != PAYLOAD_VERSION:
+        raise ValueError(f"不支援的向量匯出版本: {version}")
+
+    header_start = PAYLOAD_PREFIX.size
+    header = json.loads(bytes(buffer[header_start:header_start + header_length]).decode('utf-8'))
+    data_start = header_start + header_length
+    data_start += _padding(data_start)
+
+    matrices = {}
+    for name, entry in header.get('matrices', {}).items():
+        rows, dim = entry['shape']
+        matrix = np.frombuffer(
+            buffer,
+            dtype=np.dtype(entry['dtype']),
+            count=rows * dim,
+            offset=data_start + entry['offset'],
+        ).reshape(rows, dim)
+        matrices[name] = (entry['ids'], matrix)
+
+    return header, matrices